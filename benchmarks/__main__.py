@@ -0,0 +1,153 @@
+"""
+Бенчмарк бота на синтетической базе и фиктивной сессии Bot API.
+
+    python -m benchmarks --rows 100000 --output bench.json
+
+Результат - JSON с ops/sec, перцентилями задержек и пиковым RSS по каждому сценарию.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("find", "search", "list", "join", "sweep")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Бенчмарк Checkup-Subs Bot")
+    parser.add_argument("--rows", type=int, default=10_000, help="размер таблицы users (10000, 100000, 1000000)")
+    parser.add_argument("--channels", type=int, default=1, help="количество каналов")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="сценарии через запятую")
+    parser.add_argument("--find-ops", type=int, default=5000)
+    parser.add_argument("--search-ops", type=int, default=1000)
+    parser.add_argument("--list-pages", type=int, default=200)
+    parser.add_argument("--join-ops", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.03, help="средняя задержка Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="каждый N-й запрос получает 429 (0 - никогда)")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--bot-rate-limit", type=float, default=1000, help="BOT_RATE_LIMIT на время бенчмарка")
+    parser.add_argument("--chat-rate-limit", type=float, default=1000, help="CHAT_RATE_LIMIT на время бенчмарка")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite", help="хранилище пользователей")
+    parser.add_argument("--db", help="файл базы; если не задан, используется временный")
+    parser.add_argument("--reuse-db", action="store_true", help="не генерировать базу, если файл уже существует")
+    parser.add_argument("--output", help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace, db_name: str):
+    # src.config читает окружение при импорте, поэтому настраиваем его до импорта модулей бота
+    channel_ids = [-1001000000000 - i for i in range(max(1, args.channels))]
+    os.environ.update({
+        "BOT_TOKEN": "123456:benchmark",
+        "ADMIN_ID": "1",
+        "CHANNEL_ID": ",".join(map(str, channel_ids)),
+        "DB_NAME": db_name,
+        "STORAGE_BACKEND": args.storage,
+        "BOT_RATE_LIMIT": str(args.bot_rate_limit),
+        "CHAT_RATE_LIMIT": str(args.chat_rate_limit),
+        "METRICS_PORT": "0",
+    })
+    return channel_ids
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace, db_name: str, channel_ids: list[int]) -> dict:
+    from loguru import logger
+
+    from benchmarks import scenarios
+    from benchmarks.dataset import generate_users, load_users
+    from benchmarks.session import FakeSession
+    from src.database.storage import create_storage
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "rows": args.rows,
+        "storage": args.storage,
+        "channels": len(channel_ids),
+        "seed": args.seed,
+        "scenarios": {},
+    }
+
+    storage = create_storage(args.storage)
+    await storage.open()
+    if args.storage == "memory":
+        started = time.perf_counter()
+        await load_users(storage, args.rows, channel_ids, args.seed)
+        report["generate_seconds"] = round(time.perf_counter() - started, 3)
+    elif not (args.reuse_db and args.db and os.path.exists(args.db)):
+        started = time.perf_counter()
+        generate_users(db_name, args.rows, channel_ids, args.seed)
+        report["generate_seconds"] = round(time.perf_counter() - started, 3)
+
+    session = FakeSession(args.latency, args.jitter, args.rate_limit_every, args.retry_after, args.seed)
+    ctx = scenarios.BenchmarkContext(session, storage, args.rows, args.seed)
+    runners = {
+        "find": lambda: scenarios.run_find(ctx, args.find_ops),
+        "search": lambda: scenarios.run_search(ctx, args.search_ops),
+        "list": lambda: scenarios.run_list(ctx, args.list_pages),
+        "join": lambda: scenarios.run_join(ctx, args.join_ops),
+        "sweep": lambda: scenarios.run_sweep(ctx),
+    }
+    try:
+        for name in args.scenarios.split(","):
+            name = name.strip()
+            if name not in runners:
+                raise SystemExit(f"Неизвестный сценарий: {name}")
+            result = (await runners[name]()).to_dict()
+            result["peak_rss_mb"] = peak_rss_mb()
+            report["scenarios"][name] = result
+            logger.warning(f"Сценарий {name}: {result['ops_per_sec']} оп/с, p95 {result['latency_ms']['p95']} мс")
+    finally:
+        await ctx.close()
+        await storage.close()
+
+    report["api_calls"] = dict(session.calls)
+    report["api_rate_limited"] = session.rate_limited
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = args.db or os.path.join(tmp, "benchmark.db")
+        channel_ids = configure_environment(args, db_name)
+        report = asyncio.run(run(args, db_name, channel_ids))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from loguru import logger
+
+# Доли статусов и параметры дат подобраны по живой базе канала с подписками
+STATUS_WEIGHTS = {
+    'active': 0.55,
+    'expired': 0.25,
+    'pending': 0.08,
+    'rejected': 0.09,
+    'banned': 0.03,
+}
+USERNAME_SHARE = 0.7
+# Доля активных пользователей, у которых подписка уже истекла, но проверка еще не прошла
+OVERDUE_SHARE = 0.005
+FIRST_USER_ID = 100_000_000
+INSERT_CHUNK = 10_000
+
+
+def user_id_for(index: int) -> int:
+    return FIRST_USER_ID + index
+
+
+def username_for(index: int) -> str | None:
+    # Детерминированно, чтобы сценарии поиска знали, какие username существуют
+    return f"user{index}" if index % 10 < USERNAME_SHARE * 10 else None
+
+
+def _end_date(status: str, today: date, rng: random.Random) -> str | None:
+    if status == 'active':
+        if rng.random() < OVERDUE_SHARE:
+            return (today - timedelta(days=rng.randint(1, 30))).isoformat()
+        return (today + timedelta(days=rng.randint(0, 90))).isoformat()
+    if status == 'expired':
+        return (today - timedelta(days=rng.randint(1, 365))).isoformat()
+    return None
+
+
+def _rows(rows: int, channel_ids: list[int], seed: int):
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.now()
+    statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+    for index in range(rows):
+        status = rng.choices(statuses, weights)[0]
+        applied_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        yield (
+            channel_ids[index % len(channel_ids)],
+            user_id_for(index),
+            username_for(index),
+            f"User {index}",
+            status,
+            _end_date(status, today, rng),
+            applied_at.isoformat(sep=' '),
+        )
+
+
+def generate_users(db_name: str, rows: int, channel_ids: list[int], seed: int = 0):
+    """
+    Заполняет таблицу users синтетическими пользователями. Схема должна быть создана миграциями заранее.
+    Пользователи распределяются по каналам по кругу, каждый user_id встречается в базе один раз.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("DELETE FROM users")
+        generated = _rows(rows, channel_ids, seed)
+        while True:
+            chunk = [row for _, row in zip(range(INSERT_CHUNK), generated)]
+            if not chunk:
+                break
+            conn.executemany("""
+                INSERT INTO users (channel_id, user_id, username, full_name, status, subscription_end_date, last_application_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, chunk)
+        conn.commit()
+        conn.execute("ANALYZE")
+        logger.info(f"Сгенерировано {rows} пользователей в {db_name}.")
+    finally:
+        conn.close()
+
+
+async def load_users(storage, rows: int, channel_ids: list[int], seed: int = 0):
+    """
+    Те же синтетические пользователи, загруженные через import_users: для хранилища без файла базы.
+    """
+    generated = _rows(rows, channel_ids, seed)
+    while True:
+        chunk = [row for _, row in zip(range(INSERT_CHUNK), generated)]
+        if not chunk:
+            break
+        await storage.import_users(chunk)
+    logger.info(f"Загружено {rows} пользователей в хранилище.")
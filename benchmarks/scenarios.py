@@ -0,0 +1,231 @@
+import math
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from benchmarks.dataset import user_id_for, username_for
+from benchmarks.session import FakeSession
+from src.config import ADMIN_ID, CHANNEL_IDS
+from src.database.storage import Storage
+from src.handlers.admin_commands import admin_router
+from src.handlers.join_requests import join_router
+from src.utils.join_queue import join_queue
+from src.utils.notifier import notifier
+from src.utils.page_cache import list_page_cache
+from src.utils.scheduler import check_subscriptions_with_stats
+
+
+@dataclass
+class ScenarioResult:
+    ops: int = 0
+    seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    extra: dict = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        values = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            if not values:
+                return 0.0
+            return round(values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))] * 1000, 3)
+
+        return {
+            'ops': self.ops,
+            'seconds': round(self.seconds, 3),
+            'ops_per_sec': round(self.ops / self.seconds, 2) if self.seconds else 0.0,
+            'latency_ms': {
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': percentile(1.0),
+            },
+            **self.extra,
+        }
+
+
+class BenchmarkContext:
+    """
+    Бот с фиктивной сессией и Dispatcher с роутерами бота, как в main.py.
+    """
+
+    def __init__(self, session: FakeSession, storage: Storage, rows: int, seed: int = 0):
+        self.session = session
+        self.storage = storage
+        self.rows = rows
+        self.random = random.Random(seed)
+        self.bot = Bot(token="123456:benchmark", session=session)
+        self.dp = Dispatcher(db=storage)
+        self.dp.include_router(admin_router)
+        self.dp.include_router(join_router)
+        self._update_id = 0
+
+    def update(self, payload: dict) -> Update:
+        self._update_id += 1
+        return Update.model_validate({'update_id': self._update_id, **payload}, context={'bot': self.bot})
+
+    def admin_message(self, text: str) -> Update:
+        return self.update({'message': {
+            'message_id': self._update_id,
+            'date': 0,
+            'chat': {'id': ADMIN_ID, 'type': 'private'},
+            'from': {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+            'text': text,
+        }})
+
+    def admin_callback(self, data: str) -> Update:
+        return self.update({'callback_query': {
+            'id': str(self._update_id),
+            'from': {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+            'chat_instance': 'benchmark',
+            'data': data,
+            'message': {
+                # date=0 aiogram считает недоступным сообщением (InaccessibleMessage)
+                'message_id': 1,
+                'date': 1,
+                'chat': {'id': ADMIN_ID, 'type': 'private'},
+                'text': 'list',
+            },
+        }})
+
+    def join_request(self, index: int, channel_id: int) -> Update:
+        user = {'id': user_id_for(index), 'is_bot': False, 'first_name': f"User {index}"}
+        if username_for(index):
+            user['username'] = username_for(index)
+        return self.update({'chat_join_request': {
+            'chat': {'id': channel_id, 'type': 'channel', 'title': 'Benchmark'},
+            'from': user,
+            'user_chat_id': user['id'],
+            'date': 0,
+        }})
+
+    async def close(self):
+        await self.bot.session.close()
+
+
+async def run_find(ctx: BenchmarkContext, ops: int) -> ScenarioResult:
+    """
+    Поиск по ID и @username: половина запросов к существующим пользователям, половина - промахи.
+    """
+    result = ScenarioResult()
+    identifiers = []
+    for _ in range(ops):
+        index = ctx.random.randrange(ctx.rows * 2)
+        if ctx.random.random() < 0.5 and username_for(index):
+            identifiers.append(f"@{username_for(index)}")
+        else:
+            identifiers.append(str(user_id_for(index)))
+
+    started = time.perf_counter()
+    found = 0
+    for identifier in identifiers:
+        op_started = time.perf_counter()
+        if await ctx.storage.find_user_by_id_or_username(identifier):
+            found += 1
+        result.latencies.append(time.perf_counter() - op_started)
+    result.seconds = time.perf_counter() - started
+    result.ops = ops
+    result.extra['found'] = found
+    return result
+
+
+async def run_search(ctx: BenchmarkContext, ops: int) -> ScenarioResult:
+    """
+    Полнотекстовый поиск /find: префиксы username и имени разной длины.
+    """
+    result = ScenarioResult()
+    queries = []
+    for _ in range(ops):
+        index = str(ctx.random.randrange(ctx.rows))
+        prefix = index[:ctx.random.randint(1, len(index))]
+        queries.append(f"user{prefix}" if ctx.random.random() < 0.5 else f"user {prefix}")
+
+    started = time.perf_counter()
+    found = 0
+    for query in queries:
+        op_started = time.perf_counter()
+        users, _, _ = await ctx.storage.search_users(query, limit=10)
+        found += bool(users)
+        result.latencies.append(time.perf_counter() - op_started)
+    result.seconds = time.perf_counter() - started
+    result.ops = ops
+    result.extra['found'] = found
+    return result
+
+
+async def run_list(ctx: BenchmarkContext, pages: int) -> ScenarioResult:
+    """
+    /all, листание списка вперед кнопками через paginate_list и обратно к началу.
+    Обратный проход при неизменной БД отдается из кэша отрисованных страниц.
+    """
+    result = ScenarioResult()
+    started = time.perf_counter()
+
+    op_started = time.perf_counter()
+    await ctx.dp.feed_update(ctx.bot, ctx.admin_message("/all"))
+    result.latencies.append(time.perf_counter() - op_started)
+    markup = ctx.session.last['sendMessage'].reply_markup
+
+    cache_hits = list_page_cache.hits
+    for direction in ("_n_", "_p_"):
+        # Кнопки "Вперёд" и "Назад": list_<тип>_<страница>_<n|p>_<ключ>
+        for _ in range(pages - 1):
+            button_data = [button.callback_data for row in markup.inline_keyboard for button in row if direction in button.callback_data]
+            if not button_data:
+                break
+            op_started = time.perf_counter()
+            await ctx.dp.feed_update(ctx.bot, ctx.admin_callback(button_data[0]))
+            result.latencies.append(time.perf_counter() - op_started)
+            markup = ctx.session.last['editMessageText'].reply_markup
+    result.extra['cache_hits'] = list_page_cache.hits - cache_hits
+
+    result.seconds = time.perf_counter() - started
+    result.ops = len(result.latencies)
+    return result
+
+
+async def run_join(ctx: BenchmarkContext, ops: int) -> ScenarioResult:
+    """
+    Поток заявок на вступление: смесь известных пользователей из базы и новых заявителей.
+    Время считается до полной обработки очереди, задержка - время работы handle_join_request.
+    """
+    result = ScenarioResult()
+    requests_before = ctx.session.requests
+    join_queue.start(ctx.bot, ctx.storage)
+    notifier.start(ctx.bot)
+
+    started = time.perf_counter()
+    for _ in range(ops):
+        # Треть заявок от новых пользователей, которых нет в базе
+        index = ctx.random.randrange(int(ctx.rows * 1.5) or 1)
+        update = ctx.join_request(index, CHANNEL_IDS[index % len(CHANNEL_IDS)])
+        op_started = time.perf_counter()
+        await ctx.dp.feed_update(ctx.bot, update)
+        result.latencies.append(time.perf_counter() - op_started)
+    await join_queue.close()
+    await notifier.close()
+    result.seconds = time.perf_counter() - started
+    result.ops = ops
+    result.extra['api_requests'] = ctx.session.requests - requests_before
+    return result
+
+
+async def run_sweep(ctx: BenchmarkContext) -> ScenarioResult:
+    """
+    Одна проверка истекших подписок: удаление из каналов и обновление статусов.
+    """
+    result = ScenarioResult()
+    requests_before = ctx.session.requests
+    started = time.perf_counter()
+    stats = await check_subscriptions_with_stats(ctx.bot, ctx.storage)
+    result.seconds = time.perf_counter() - started
+    result.latencies.append(result.seconds)
+    result.ops = stats.get('expired_count', 0) + stats.get('failed_count', 0)
+    result.extra['expired'] = stats.get('expired_count', 0)
+    result.extra['failed'] = stats.get('failed_count', 0)
+    result.extra['retried'] = stats.get('retried_count', 0)
+    result.extra['api_requests'] = ctx.session.requests - requests_before
+    return result
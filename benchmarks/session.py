@@ -0,0 +1,82 @@
+import asyncio
+import json
+import random
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+
+# Методы, которые возвращают сообщение; остальные в боте используются как "действие" и возвращают True
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendDocument"}
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия aiogram без сети: имитирует задержку Bot API и ответы 429 Too Many Requests.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.03,
+        jitter: float = 0.01,
+        rate_limit_every: int = 0,
+        retry_after: int = 1,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.calls: Counter[str] = Counter()
+        self.rate_limited = 0
+        # Последний запрос каждого метода: сценарии берут из него клавиатуру для следующего шага
+        self.last: dict[str, TelegramMethod] = {}
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None):
+        api_method = method.__api_method__
+        self.requests += 1
+        self.calls[api_method] += 1
+        self.last[api_method] = method
+        await asyncio.sleep(max(0.0, self._random.gauss(self.latency, self.jitter)))
+
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            status_code, content = 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        else:
+            status_code, content = 200, {"ok": True, "result": self._result(bot, api_method, method)}
+
+        response = self.check_response(bot=bot, method=method, status_code=status_code, content=json.dumps(content))
+        return response.result
+
+    def _result(self, bot: Bot, api_method: str, method: TelegramMethod):
+        if api_method in MESSAGE_METHODS:
+            chat_id = getattr(method, "chat_id", None) or 0
+            return {
+                "message_id": self.requests,
+                "date": 1,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": getattr(method, "text", None) or "",
+            }
+        if api_method == "getChatMember":
+            return {"status": "left", "user": {"id": method.user_id, "is_bot": False, "first_name": "User"}}
+        if api_method == "getMe":
+            return {"id": bot.id, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        return True
+
+    async def stream_content(self, url: str, headers: dict | None = None, timeout: int = 30, chunk_size: int = 65536, raise_for_status: bool = True):
+        # Сценарии файлы не скачивают: загрузка имитируется той же задержкой и отдает пустое содержимое
+        self.calls["download"] += 1
+        await asyncio.sleep(max(0.0, self._random.gauss(self.latency, self.jitter)))
+        yield b""
+
+    async def close(self):
+        pass
@@ -5,39 +5,78 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
-from src.config import BOT_TOKEN
-from src.database.database import initialize_db
+from src.config import BOT_TOKEN, BOT_MODE, METRICS_PORT, LOG_DIR, LOG_LEVEL
+from src.database.storage import create_storage
 from src.handlers.join_requests import join_router
 from src.handlers.admin_commands import admin_router
 from src.utils.scheduler import setup_scheduler
+from src.utils.notifier import notifier
+from src.utils.join_queue import join_queue
+from src.utils.expiry import expiry_scheduler
+from src.utils.ledger import ledger
+from src.utils.membership import membership
+from src.web.webhook import run_webhook
+from src.web.metrics import metrics_server
+from src.utils.metrics import BotApiMetricsMiddleware
+from src.utils.log_search import LOG_FILE_NAME
 
-os.makedirs("logs", exist_ok=True)
-logger.add("logs/bot.log", rotation="10 MB", compression="zip", level="INFO")
+os.makedirs(LOG_DIR, exist_ok=True)
+# enqueue=True: запись на диск идет в фоновом потоке и не блокирует цикл событий,
+# serialize=True: строки JSON, по которым /log ищет записи с фильтрами
+logger.add(
+    os.path.join(LOG_DIR, LOG_FILE_NAME),
+    rotation="10 MB",
+    compression="zip",
+    level=LOG_LEVEL,
+    enqueue=True,
+    serialize=True,
+)
 
 
 async def main():
     logger.info("Запуск бота...")
 
     try:
-        await initialize_db()
+        storage = create_storage()
+        await storage.open()
 
         bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        dp = Dispatcher()
+        bot.session.middleware(BotApiMetricsMiddleware())
+        # Хранилище доступно обработчикам как параметр db
+        dp = Dispatcher(db=storage)
 
         dp.include_router(admin_router)
         dp.include_router(join_router)
         
         # Планировщик
-        setup_scheduler(bot)
+        setup_scheduler(bot, storage)
+        notifier.start(bot)
+        ledger.start(storage)
+        join_queue.start(bot, storage)
+        expiry_scheduler.start(bot, storage)
+        if METRICS_PORT:
+            await metrics_server.start()
 
-        # await bot.delete_webhook(drop_pending_updates=True)
         logger.info("sБот успешно запущен и готов к работе!")
         
         try:
-            await dp.start_polling(bot)
+            if BOT_MODE == "webhook":
+                await run_webhook(bot, dp)
+            else:
+                # Иначе getUpdates конфликтует с ранее установленным webhook
+                await bot.delete_webhook()
+                await dp.start_polling(bot)
         finally:
+            await expiry_scheduler.close()
+            await join_queue.close()
+            await metrics_server.stop()
+            await notifier.close()
+            # Остаток буфера истории подписок записывается до закрытия БД
+            await ledger.close()
             await bot.session.close()
             logger.info("Сессия бота закрыта.")
+            logger.info(f"Статистика кэша участия в каналах: {membership.stats()}")
+            await storage.close()
             
     except Exception as e:
         logger.critical(f"Критическая ошибка при инициализации: {e}")
@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 from loguru import logger
 
@@ -8,6 +9,61 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = os.getenv("ADMIN_ID")
 CHANNEL_ID = os.getenv("CHANNEL_ID")
 DB_NAME = os.getenv("DB_NAME", "database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+# Сколько отрисованных страниц /active, /expiring и /all держать в памяти
+LIST_CACHE_SIZE = int(os.getenv("LIST_CACHE_SIZE", "256"))
+# Кэш участия пользователей в каналах: размер и время жизни записей "в канале" и "не в канале", секунды
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+MEMBERSHIP_TTL = float(os.getenv("MEMBERSHIP_TTL", "3600"))
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "300"))
+# Хранилище пользователей: sqlite или memory (без сохранения на диск, для тестов и бенчмарков)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+
+# Лимиты Bot API: ~30 запросов в секунду на бота и ~1 сообщение в секунду в один чат
+BOT_RATE_LIMIT = float(os.getenv("BOT_RATE_LIMIT", "25"))
+CHAT_RATE_LIMIT = float(os.getenv("CHAT_RATE_LIMIT", "1"))
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "8"))
+PIPELINE_MAX_RETRIES = int(os.getenv("PIPELINE_MAX_RETRIES", "3"))
+
+# Очередь заявок на вступление: размер, пачки и поведение при переполнении (wait или drop)
+JOIN_QUEUE_SIZE = int(os.getenv("JOIN_QUEUE_SIZE", "10000"))
+JOIN_BATCH_SIZE = int(os.getenv("JOIN_BATCH_SIZE", "100"))
+JOIN_BATCH_WINDOW = float(os.getenv("JOIN_BATCH_WINDOW", "2"))
+JOIN_QUEUE_POLICY = os.getenv("JOIN_QUEUE_POLICY", "wait")
+JOIN_QUEUE_TIMEOUT = float(os.getenv("JOIN_QUEUE_TIMEOUT", "5"))
+
+# HTTP-эндпоинт с метриками в формате OpenMetrics, METRICS_PORT=0 отключает его
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+# Таймеры истечения подписок держат в памяти подписки, истекающие в ближайшие N дней
+EXPIRY_HORIZON_DAYS = int(os.getenv("EXPIRY_HORIZON_DAYS", "3"))
+
+# Логи: каталог с текущим и ротированными файлами и предел строк в ответе на /log с фильтрами
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SEARCH_LIMIT = int(os.getenv("LOG_SEARCH_LIMIT", "2000"))
+
+# История подписок пишется в БД пачками: по таймеру или при накоплении LEDGER_BATCH_SIZE событий
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "5"))
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "1000"))
+LEDGER_MAX_BUFFER = int(os.getenv("LEDGER_MAX_BUFFER", "100000"))
+
+# Сводки уведомлений администратору
+NOTIFY_FLUSH_INTERVAL = float(os.getenv("NOTIFY_FLUSH_INTERVAL", "60"))
+NOTIFY_FILE_THRESHOLD = int(os.getenv("NOTIFY_FILE_THRESHOLD", "50"))
 
 if not all([BOT_TOKEN, ADMIN_ID, CHANNEL_ID]):
     logger.error("Не удалось загрузить переменные окружения. Убедитесь, что создан файл .env")
@@ -15,7 +71,23 @@ if not all([BOT_TOKEN, ADMIN_ID, CHANNEL_ID]):
 
 try:
     ADMIN_ID = int(ADMIN_ID)
-    CHANNEL_ID = int(CHANNEL_ID)
-except ValueError:
+    # CHANNEL_ID может содержать несколько каналов через запятую, первый считается основным
+    CHANNEL_IDS = list(dict.fromkeys(int(channel_id) for channel_id in CHANNEL_ID.split(",") if channel_id.strip()))
+    CHANNEL_ID = CHANNEL_IDS[0]
+except (ValueError, IndexError):
     logger.error("ADMIN_ID и CHANNEL_ID должны быть числами")
-    raise ValueError("ADMIN_ID и CHANNEL_ID должны быть целочисленными значениями") 
\ No newline at end of file
+    raise ValueError("ADMIN_ID и CHANNEL_ID должны быть целочисленными значениями")
+
+if BOT_MODE not in ("polling", "webhook"):
+    logger.error(f"Неизвестный режим работы BOT_MODE={BOT_MODE}")
+    raise ValueError("BOT_MODE должен быть 'polling' или 'webhook'")
+
+# Без секретного токена webhook принимает обновления от любого, кто знает адрес, поэтому он обязателен.
+# Telegram допускает в токене 1-256 символов: латиница, цифры, "_" и "-"
+if BOT_MODE == "webhook" and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET or ""):
+    logger.error("Режим webhook требует WEBHOOK_SECRET")
+    raise ValueError("WEBHOOK_SECRET обязателен в режиме webhook: 1-256 символов A-Z, a-z, 0-9, _ и -")
+
+if STORAGE_BACKEND not in ("sqlite", "memory"):
+    logger.error(f"Неизвестное хранилище STORAGE_BACKEND={STORAGE_BACKEND}")
+    raise ValueError("STORAGE_BACKEND должен быть 'sqlite' или 'memory'")
@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """
+    LRU-кэш строк пользователей с ограниченным временем жизни.
+    Строки хранятся по ключу (channel_id, user_id), доступ также по username в пределах канала.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, int], tuple[float, dict]] = OrderedDict()
+        self._usernames: dict[tuple[str, int], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, channel_id: int, user_id: int) -> dict | None:
+        key = (channel_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self.invalidate(channel_id, user_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(user)
+
+    def get_by_username(self, username: str, channel_id: int) -> dict | None:
+        user_id = self._usernames.get((username, channel_id))
+        if user_id is None:
+            self.misses += 1
+            return None
+        return self.get(channel_id, user_id)
+
+    def put(self, user: dict):
+        if self.max_size <= 0:
+            return
+        channel_id, user_id = user['channel_id'], user['user_id']
+        self.invalidate(channel_id, user_id)
+        self._entries[(channel_id, user_id)] = (time.monotonic() + self.ttl, dict(user))
+        if user.get('username'):
+            self._usernames[(user['username'], channel_id)] = user_id
+        while len(self._entries) > self.max_size:
+            self.invalidate(*next(iter(self._entries)))
+
+    def refresh(self, user: dict):
+        # Обновляет только уже закэшированные строки, чтобы массовые операции не вытесняли горячие записи
+        if (user['channel_id'], user['user_id']) in self._entries:
+            self.put(user)
+
+    def invalidate(self, channel_id: int, user_id: int):
+        entry = self._entries.pop((channel_id, user_id), None)
+        if entry is not None:
+            username = entry[1].get('username')
+            if username and self._usernames.get((username, channel_id)) == user_id:
+                del self._usernames[(username, channel_id)]
+
+    def clear(self):
+        self._entries.clear()
+        self._usernames.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -1,143 +1,944 @@
+import re
+from typing import Callable
+
 import aiosqlite
 from loguru import logger
 from datetime import datetime
-from src.config import DB_NAME
-
-
-async def initialize_db():
-    logger.info("Инициализация базы данных...")
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    full_name TEXT NOT NULL,
-                    status TEXT NOT NULL,
-                    subscription_end_date DATE,
-                    last_application_date DATETIME
+from src.config import DB_NAME, DB_POOL_SIZE, USER_CACHE_SIZE, USER_CACHE_TTL, CHANNEL_ID
+from src.database.pool import ConnectionPool
+from src.database.cache import UserCache
+from src.database.migrations import apply_migrations
+from src.utils.metrics import metrics
+
+# Не больше 999 параметров в одном запросе (лимит старых сборок SQLite)
+BULK_CHUNK_SIZE = 500
+
+# Сколько совпадений полнотекстового поиска ранжируется, прежде чем выдать страницу
+SEARCH_CANDIDATES = 1000
+
+UPSERT_USER_QUERY = """
+    INSERT INTO users (channel_id, user_id, full_name, username, status, last_application_date)
+    VALUES (?, ?, ?, ?, 'pending', ?)
+    ON CONFLICT(channel_id, user_id) DO UPDATE SET
+        full_name = excluded.full_name,
+        username = excluded.username,
+        last_application_date = excluded.last_application_date
+    RETURNING *
+"""
+
+IMPORT_USER_QUERY = """
+    INSERT INTO users (channel_id, user_id, username, full_name, status, subscription_end_date, last_application_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(channel_id, user_id) DO UPDATE SET
+        username = excluded.username,
+        full_name = excluded.full_name,
+        status = excluded.status,
+        subscription_end_date = excluded.subscription_end_date,
+        last_application_date = COALESCE(excluded.last_application_date, users.last_application_date)
+"""
+
+IMPORT_COLUMNS = ('channel_id', 'user_id', 'username', 'full_name', 'status', 'subscription_end_date', 'last_application_date')
+
+# Сколько завершенных запусков хранить в журнале
+SWEEP_RUNS_KEEP = 30
+
+# Срок события истечения берется из последней выдачи или продления подписки этого пользователя
+INSERT_EVENT_QUERY = """
+    INSERT INTO subscription_events (created_at, channel_id, user_id, kind, days, end_date)
+    VALUES (?, ?, ?, ?, COALESCE(?, (
+        SELECT days FROM subscription_events
+        WHERE channel_id = ? AND user_id = ? AND kind IN ('grant', 'extend')
+        ORDER BY id DESC LIMIT 1
+    ), 0), ?)
+"""
+
+def _timed_query(func):
+    # Время каждой операции с БД попадает в гистограмму с именем функции в метке query
+    return metrics.timed('bot_db_query_seconds', query=func.__name__)(func)
+
+
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _channel_filter(channel_id: int | None) -> tuple[str, tuple]:
+    if channel_id is None:
+        return "", ()
+    return " AND channel_id = ?", (channel_id,)
+
+
+def _keyset_segments(keyset: tuple[str | None, int] | None, forward: bool, null_dates: bool = True) -> list[tuple[str | None, tuple]]:
+    """
+    Условия для строк после ключа keyset в порядке (subscription_end_date, id), пустые даты SQLite ставит первыми.
+    Каждое условие - один диапазон индекса, поэтому страница читается поиском по индексу, а не его сканированием.
+    Строки с пустой датой и с датой идут разными отрезками: следующий читается, только если предыдущий не заполнил страницу.
+    null_dates=False - в списке нет строк с пустой датой, отрезок для них не нужен.
+    """
+    if keyset is None:
+        return [(None, ())]
+    end_date, row_id = keyset
+    if end_date is None:
+        if forward:
+            return [("subscription_end_date IS NULL AND id > ?", (row_id,)), ("subscription_end_date IS NOT NULL", ())]
+        return [("subscription_end_date IS NULL AND id < ?", (row_id,))]
+    if forward:
+        return [("(subscription_end_date, id) > (?, ?)", (end_date, row_id))]
+    segments = [("(subscription_end_date, id) < (?, ?)", (end_date, row_id))]
+    if null_dates:
+        segments.append(("subscription_end_date IS NULL", ()))
+    return segments
+
+
+def search_tokens(text: str) -> list[str]:
+    """
+    Слова запроса для полнотекстового поиска: буквы и цифры, без знаков и подчеркиваний,
+    так же, как их разбивает токенизатор unicode61 индекса users_fts; ё заменяется на е, как в индексе.
+    """
+    return re.findall(r"[^\W_]+", text.lower().replace("ё", "е"))
+
+
+class SQLiteStorage:
+    """
+    Хранилище пользователей в SQLite: один пишущий и несколько читающих соединений, кэш строк пользователей.
+    """
+
+    def __init__(
+        self,
+        db_name: str = DB_NAME,
+        readers: int = DB_POOL_SIZE,
+        cache_size: int = USER_CACHE_SIZE,
+        cache_ttl: float = USER_CACHE_TTL,
+    ):
+        self._pool = ConnectionPool(db_name, readers=readers)
+        self._cache = UserCache(cache_size, cache_ttl)
+        self._change_listeners: list[Callable[[list[dict]], None]] = []
+
+    def _get_pool(self) -> ConnectionPool:
+        if not self._pool.is_open:
+            raise RuntimeError("База данных не инициализирована: сначала вызовите open()")
+        return self._pool
+
+    @property
+    def generation(self) -> int:
+        """
+        Поколение данных: растет после каждой транзакции записи в users.
+        """
+        return self._pool.generation
+
+    def add_change_listener(self, listener: Callable[[list[dict]], None]):
+        """
+        Подписка на изменения статуса и даты окончания подписки: listener получает измененные строки после COMMIT.
+        """
+        self._change_listeners.append(listener)
+
+    def _notify_changed(self, rows: list[dict]):
+        if not rows:
+            return
+        for listener in self._change_listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике изменений пользователей: {e}")
+
+    async def open(self):
+        logger.info("Инициализация базы данных...")
+        try:
+            await self._pool.open()
+            # Строки из одноканальной схемы переносятся в канал по умолчанию (первый из CHANNEL_ID)
+            await apply_migrations(self._pool, {'default_channel_id': CHANNEL_ID})
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при применении миграций БД: {e}")
+            raise
+        finally:
+            logger.info("Инициализация базы данных завершена.")
+
+    async def close(self):
+        if not self._pool.is_open:
+            return
+        logger.info(f"Статистика кэша пользователей: {self._cache.stats()}")
+        try:
+            await self._pool.close()
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при закрытии соединений с БД: {e}")
+        finally:
+            self._cache.clear()
+
+    def get_cached_user(self, user_id: int, channel_id: int) -> dict | None:
+        """
+        Пользователь из кэша без обращения к БД, None при промахе.
+        """
+        return self._cache.get(channel_id, user_id)
+
+    def get_cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    async def _release_username(self, db: aiosqlite.Connection, username: str, user_id: int):
+        # username уникален в Telegram: освобождаем его во всех каналах, если он остался за другим пользователем.
+        # Уникальный индекс (username, channel_id) ловит только совпадения внутри канала, поэтому освобождаем до записи
+        cursor = await db.execute(
+            "UPDATE users SET username = NULL WHERE username = ? AND user_id <> ? RETURNING channel_id, user_id",
+            (username, user_id),
+        )
+        for channel_id, previous_owner in await cursor.fetchall():
+            self._cache.invalidate(channel_id, previous_owner)
+
+    async def _upsert_user_row(self, db: aiosqlite.Connection, params: tuple) -> dict:
+        _, user_id, _, username, _ = params
+        if username:
+            await self._release_username(db, username, user_id)
+        cursor = await db.execute(UPSERT_USER_QUERY, params)
+        rows = await cursor.fetchall()
+        user = dict(rows[0])
+        self._cache.put(user)
+        return user
+
+    @_timed_query
+    async def upsert_user(self, channel_id: int, user_id: int, full_name: str, username: str | None) -> dict:
+        """
+        Добавляет пользователя в канал со статусом pending или обновляет его данные одним запросом.
+        Возвращает актуальную строку пользователя, включая статус и дату окончания подписки.
+        """
+        last_application_date = datetime.now()
+
+        if username:
+            username = username.lower()
+
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                user = await self._upsert_user_row(db, (channel_id, user_id, full_name, username, last_application_date))
+            logger.info(f"Пользователь {user_id} добавлен/обновлен в БД (канал {channel_id}).")
+            return user
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при добавлении/обновлении пользователя {user_id}: {e}")
+            raise
+
+    @_timed_query
+    async def bulk_upsert_users(self, applicants: list[tuple[int, int, str, str | None]]) -> list[dict]:
+        """
+        upsert_user для пачки заявителей (channel_id, user_id, full_name, username) в одной транзакции.
+        """
+        last_application_date = datetime.now()
+        users = []
+        if not applicants:
+            return users
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                for channel_id, user_id, full_name, username in applicants:
+                    params = (channel_id, user_id, full_name, username.lower() if username else username, last_application_date)
+                    users.append(await self._upsert_user_row(db, params))
+            logger.info(f"Добавлено/обновлено {len(users)} пользователей в БД.")
+            return users
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при массовом добавлении/обновлении {len(applicants)} пользователей: {e}")
+            raise
+
+    @_timed_query
+    async def import_users(self, rows: list[tuple]) -> int:
+        """
+        Загружает пачку строк (в порядке IMPORT_COLUMNS) одной транзакцией с семантикой upsert.
+        """
+        if not rows:
+            return 0
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                owners = {}
+                for _, user_id, username, *_ in rows:
+                    if username:
+                        owners.setdefault(username, set()).add(user_id)
+                if all(len(user_ids) == 1 for user_ids in owners.values()):
+                    for username, (user_id,) in owners.items():
+                        await self._release_username(db, username, user_id)
+                    await db.executemany(IMPORT_USER_QUERY, rows)
+                else:
+                    # username переходит от одного пользователя пачки к другому: грузим построчно, как upsert_user
+                    for row in rows:
+                        _, user_id, username = row[:3]
+                        if username:
+                            await self._release_username(db, username, user_id)
+                        await db.execute(IMPORT_USER_QUERY, row)
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при импорте {len(rows)} пользователей: {e}")
+            raise
+
+        if len(self._cache):
+            for row in rows:
+                self._cache.invalidate(row[0], row[1])
+        if self._change_listeners:
+            self._notify_changed([dict(zip(IMPORT_COLUMNS, row)) for row in rows])
+        return len(rows)
+
+    async def iter_users(self, batch_size: int = 1000):
+        """
+        Все строки users порциями по batch_size через курсор, без загрузки таблицы в память.
+        """
+        async with self._get_pool().reader() as db:
+            cursor = await db.execute("SELECT * FROM users ORDER BY id")
+            try:
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+            finally:
+                await cursor.close()
+
+    @_timed_query
+    async def get_user(self, user_id: int, channel_id: int) -> dict | None:
+        cached = self._cache.get(channel_id, user_id)
+        if cached is not None:
+            return cached
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute("SELECT * FROM users WHERE channel_id = ? AND user_id = ?", (channel_id, user_id))
+                user = await cursor.fetchone()
+            if not user:
+                return None
+            user = dict(user)
+            self._cache.put(user)
+            return user
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при получении пользователя {user_id}: {e}")
+            raise
+
+    @_timed_query
+    async def get_user_channels(self, user_id: int) -> list[dict]:
+        """
+        Строки пользователя во всех каналах, начиная с последней заявки.
+        """
+        return await self._execute_user_query(
+            "SELECT * FROM users WHERE user_id = ? ORDER BY last_application_date DESC, id DESC",
+            (user_id,)
+        )
+
+    @_timed_query
+    async def find_users(self, user_ids: list[int], usernames: list[str]) -> list[dict]:
+        """
+        Строки пользователей во всех каналах по списку ID и username: один запрос на каждые BULK_CHUNK_SIZE значений.
+        """
+        keys = [('user_id', user_id) for user_id in dict.fromkeys(user_ids)]
+        keys += [('username', username) for username in dict.fromkeys(username.lower() for username in usernames)]
+        users: dict[int, dict] = {}
+        try:
+            async with self._get_pool().reader() as db:
+                for chunk in _chunks(keys):
+                    ids = [value for column, value in chunk if column == 'user_id']
+                    names = [value for column, value in chunk if column == 'username']
+                    conditions = []
+                    if ids:
+                        conditions.append(f"user_id IN ({', '.join('?' * len(ids))})")
+                    if names:
+                        conditions.append(f"username IN ({', '.join('?' * len(names))})")
+                    cursor = await db.execute(f"SELECT * FROM users WHERE {' OR '.join(conditions)}", (*ids, *names))
+                    for row in await cursor.fetchall():
+                        users[row['id']] = dict(row)
+            return [users[row_id] for row_id in sorted(users)]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при поиске {len(keys)} пользователей по ID и username: {e}")
+            raise
+
+    @_timed_query
+    async def get_users_by_ids(self, user_ids: list[int], channel_id: int) -> list[dict]:
+        users = []
+        try:
+            async with self._get_pool().reader() as db:
+                for chunk in _chunks(list(user_ids)):
+                    placeholders = ", ".join("?" * len(chunk))
+                    cursor = await db.execute(
+                        f"SELECT * FROM users WHERE channel_id = ? AND user_id IN ({placeholders})",
+                        (channel_id, *chunk)
+                    )
+                    users.extend(dict(row) for row in await cursor.fetchall())
+            return users
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при получении {len(user_ids)} пользователей по ID: {e}")
+            raise
+
+    @_timed_query
+    async def update_user_status(self, user_id: int, status: str, channel_id: int | None = None) -> list[dict]:
+        # Без channel_id статус меняется во всех каналах пользователя (например, при блокировке)
+        query, params = "UPDATE users SET status = ? WHERE user_id = ?", [status, user_id]
+        if channel_id is not None:
+            query += " AND channel_id = ?"
+            params.append(channel_id)
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                cursor = await db.execute(query + " RETURNING *", params)
+                rows = [dict(row) for row in await cursor.fetchall()]
+            for row in rows:
+                self._cache.put(row)
+            self._notify_changed(rows)
+            logger.info(f"Статус пользователя {user_id} обновлен на {status}.")
+            return rows
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при обновлении статуса пользователя {user_id}: {e}")
+            raise
+
+    @_timed_query
+    async def update_subscription(self, user_id: int, end_date: str, channel_id: int):
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                cursor = await db.execute(
+                    "UPDATE users SET status = 'active', subscription_end_date = ? WHERE channel_id = ? AND user_id = ? RETURNING *",
+                    (end_date, channel_id, user_id)
                 )
-            """)
-            await db.commit()
-            logger.info("Таблица users успешно создана или уже существует.")
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при создании таблицы users: {e}")
-        raise
-    finally:
-        logger.info("Инициализация базы данных завершена.")
-
-
-async def add_user(user_id: int, full_name: str, username: str | None):
-    last_application_date = datetime.now()
-
-    if username:
-        username = username.lower()
-    
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute("SELECT status FROM users WHERE user_id = ?", (user_id,))
-            user = await cursor.fetchone()
-            if user:
-                await db.execute(
-                    "UPDATE users SET full_name = ?, username = ?, last_application_date = ? WHERE user_id = ?",
-                    (full_name, username, last_application_date, user_id)
+                rows = [dict(row) for row in await cursor.fetchall()]
+            self._cache.invalidate(channel_id, user_id)
+            for row in rows:
+                self._cache.put(row)
+            self._notify_changed(rows)
+            logger.info(f"Подписка для пользователя {user_id} в канале {channel_id} обновлена до {end_date}.")
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при обновлении подписки для пользователя {user_id}: {e}")
+            raise
+
+    async def _update_status_rows(
+        self,
+        db: aiosqlite.Connection,
+        user_ids: list[int],
+        status: str,
+        from_status: str | None,
+        channel_id: int | None,
+    ) -> list[dict]:
+        rows = []
+        for chunk in _chunks(list(user_ids)):
+            placeholders = ", ".join("?" * len(chunk))
+            query = f"UPDATE users SET status = ? WHERE user_id IN ({placeholders}) AND status IS NOT ?"
+            params = [status, *chunk, status]
+            if from_status is not None:
+                query += " AND status = ?"
+                params.append(from_status)
+            if channel_id is not None:
+                query += " AND channel_id = ?"
+                params.append(channel_id)
+            cursor = await db.execute(query + " RETURNING *", params)
+            rows.extend(dict(row) for row in await cursor.fetchall())
+        return rows
+
+    @_timed_query
+    async def bulk_update_status(self, user_ids: list[int], status: str, from_status: str | None = None, channel_id: int | None = None) -> list[int]:
+        """
+        Меняет статус сразу для списка пользователей в одной транзакции.
+        Без channel_id затрагиваются строки пользователей во всех каналах.
+        Возвращает ID пользователей, у которых статус действительно изменился.
+        """
+        if not user_ids:
+            return []
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                rows = await self._update_status_rows(db, user_ids, status, from_status, channel_id)
+            for row in rows:
+                self._cache.refresh(row)
+            self._notify_changed(rows)
+            changed = list(dict.fromkeys(row['user_id'] for row in rows))
+            logger.info(f"Статус {status} установлен для {len(changed)} из {len(user_ids)} пользователей.")
+            return changed
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при массовом обновлении статуса на {status}: {e}")
+            raise
+
+    async def _update_subscription_rows(self, db: aiosqlite.Connection, user_ids: list[int], end_date: str, channel_id: int) -> list[dict]:
+        rows = []
+        for chunk in _chunks(list(user_ids)):
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = await db.execute(
+                f"UPDATE users SET status = 'active', subscription_end_date = ? WHERE channel_id = ? AND user_id IN ({placeholders}) RETURNING *",
+                (end_date, channel_id, *chunk)
+            )
+            rows.extend(dict(row) for row in await cursor.fetchall())
+        return rows
+
+    @_timed_query
+    async def bulk_update_subscription(self, user_ids: list[int], end_date: str, channel_id: int) -> list[int]:
+        if not user_ids:
+            return []
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                rows = await self._update_subscription_rows(db, user_ids, end_date, channel_id)
+            for row in rows:
+                self._cache.refresh(row)
+            self._notify_changed(rows)
+            changed = [row['user_id'] for row in rows]
+            logger.info(f"Подписка до {end_date} в канале {channel_id} установлена для {len(changed)} из {len(user_ids)} пользователей.")
+            return changed
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при массовом обновлении подписки до {end_date}: {e}")
+            raise
+
+    @_timed_query
+    async def bulk_update_subscriptions(self, keys: list[tuple[int, int]], end_date: str) -> list[tuple[int, int]]:
+        """
+        bulk_update_subscription для пар (channel_id, user_id) из разных каналов в одной транзакции.
+        Возвращает пары, для которых подписка обновлена.
+        """
+        if not keys:
+            return []
+        by_channel: dict[int, list[int]] = {}
+        for channel_id, user_id in keys:
+            by_channel.setdefault(channel_id, []).append(user_id)
+        rows = []
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                for channel_id, user_ids in by_channel.items():
+                    rows.extend(await self._update_subscription_rows(db, user_ids, end_date, channel_id))
+            for row in rows:
+                self._cache.refresh(row)
+            self._notify_changed(rows)
+            logger.info(f"Подписка до {end_date} установлена для {len(rows)} из {len(keys)} пользователей в {len(by_channel)} каналах.")
+            return [(row['channel_id'], row['user_id']) for row in rows]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при массовом обновлении подписки до {end_date}: {e}")
+            raise
+
+    # --- Журнал проверок подписок ---
+    # Каждый запуск удаления истекших подписок записывает шаг по каждому пользователю, чтобы после
+    # перезапуска процесса продолжить с места остановки и не повторять уже выполненные запросы к Bot API.
+
+    @_timed_query
+    async def create_sweep_run(self, users: list[dict]) -> int:
+        """
+        Создает запуск проверки и записывает в журнал шаг pending для пользователей, которые все еще активны.
+        """
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        try:
+            async with self._get_pool().transaction() as db:
+                cursor = await db.execute("INSERT INTO sweep_runs (started_at) VALUES (?)", (now,))
+                run_id = cursor.lastrowid
+                by_channel: dict[int, list[int]] = {}
+                for user in users:
+                    by_channel.setdefault(user['channel_id'], []).append(user['user_id'])
+                for channel_id, user_ids in by_channel.items():
+                    for chunk in _chunks(list(dict.fromkeys(user_ids))):
+                        placeholders = ", ".join("?" * len(chunk))
+                        await db.execute(
+                            f"""
+                            INSERT OR IGNORE INTO sweep_journal (run_id, channel_id, user_id, step)
+                            SELECT ?, channel_id, user_id, 'pending' FROM users
+                            WHERE channel_id = ? AND status = 'active' AND user_id IN ({placeholders})
+                            """,
+                            (run_id, channel_id, *chunk)
+                        )
+            return run_id
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при создании записи о проверке подписок: {e}")
+            raise
+
+    @_timed_query
+    async def get_unfinished_sweep_run(self) -> int | None:
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute("SELECT id FROM sweep_runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1")
+                row = await cursor.fetchone()
+            return row['id'] if row else None
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при поиске незавершенной проверки подписок: {e}")
+            raise
+
+    @_timed_query
+    async def get_sweep_journal(self, run_id: int) -> list[dict]:
+        """
+        Пользователи запуска вместе с их шагом в журнале (поле step).
+        """
+        return await self._execute_user_query(
+            """
+            SELECT users.*, sweep_journal.step FROM sweep_journal
+            JOIN users ON users.channel_id = sweep_journal.channel_id AND users.user_id = sweep_journal.user_id
+            WHERE sweep_journal.run_id = ?
+            """,
+            (run_id,)
+        )
+
+    @_timed_query
+    async def mark_sweep_steps(self, run_id: int, keys: list[tuple[int, int]], step: str):
+        """
+        Записывает шаг step для пар (channel_id, user_id) запуска run_id.
+        """
+        if not keys:
+            return
+        try:
+            async with self._get_pool().transaction() as db:
+                await db.executemany(
+                    "UPDATE sweep_journal SET step = ? WHERE run_id = ? AND channel_id = ? AND user_id = ?",
+                    [(step, run_id, channel_id, user_id) for channel_id, user_id in keys]
+                )
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при записи шага {step} в журнал проверки {run_id}: {e}")
+            raise
+
+    @_timed_query
+    async def complete_sweep_users(self, run_id: int, channel_id: int, user_ids: list[int]) -> list[int]:
+        """
+        В одной транзакции переводит удаленных из канала пользователей в статус expired и отмечает их
+        в журнале шагом done. Возвращает ID пользователей, у которых статус действительно изменился.
+        """
+        if not user_ids:
+            return []
+        try:
+            async with self._get_pool().transaction(bump=True) as db:
+                rows = await self._update_status_rows(db, user_ids, 'expired', 'active', channel_id)
+                await db.executemany(
+                    "UPDATE sweep_journal SET step = 'done' WHERE run_id = ? AND channel_id = ? AND user_id = ?",
+                    [(run_id, channel_id, user_id) for user_id in user_ids]
+                )
+            for row in rows:
+                self._cache.refresh(row)
+            self._notify_changed(rows)
+            return [row['user_id'] for row in rows]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при завершении удаления пользователей в проверке {run_id}: {e}")
+            raise
+
+    @_timed_query
+    async def finish_sweep_run(self, run_id: int):
+        """
+        Отмечает запуск завершенным и удаляет из журнала старые запуски.
+        """
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        try:
+            async with self._get_pool().transaction() as db:
+                await db.execute("UPDATE sweep_runs SET finished_at = ? WHERE id = ?", (now, run_id))
+                cursor = await db.execute(
+                    "SELECT id FROM sweep_runs WHERE finished_at IS NOT NULL ORDER BY id DESC LIMIT 1 OFFSET ?",
+                    (SWEEP_RUNS_KEEP - 1,)
+                )
+                oldest_kept = await cursor.fetchone()
+                if oldest_kept:
+                    await db.execute("DELETE FROM sweep_journal WHERE run_id < ?", (oldest_kept['id'],))
+                    await db.execute("DELETE FROM sweep_runs WHERE id < ?", (oldest_kept['id'],))
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при завершении проверки подписок {run_id}: {e}")
+            raise
+
+    # --- История подписок ---
+
+    @_timed_query
+    async def append_subscription_events(self, events: list[tuple]) -> int:
+        """
+        Записывает события (created_at, channel_id, user_id, kind, days, end_date) одной транзакцией
+        и в ней же увеличивает дневные сводки subscription_rollups. Возвращает число записанных событий.
+        """
+        if not events:
+            return 0
+        try:
+            async with self._get_pool().transaction() as db:
+                cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM subscription_events")
+                last_id = (await cursor.fetchone())[0]
+                await db.executemany(
+                    INSERT_EVENT_QUERY,
+                    [
+                        (created_at, channel_id, user_id, kind, days, channel_id, user_id, end_date)
+                        for created_at, channel_id, user_id, kind, days, end_date in events
+                    ]
                 )
-            else:
                 await db.execute(
-                    "INSERT INTO users (user_id, full_name, username, status, last_application_date) VALUES (?, ?, ?, ?, ?)",
-                    (user_id, full_name, username, 'pending', last_application_date)
+                    """
+                    INSERT INTO subscription_rollups (day, channel_id, kind, days, count)
+                    SELECT date(created_at), channel_id, kind, days, COUNT(*) FROM subscription_events
+                    WHERE id > ? GROUP BY date(created_at), channel_id, kind, days
+                    ON CONFLICT (day, channel_id, kind, days) DO UPDATE SET count = count + excluded.count
+                    """,
+                    (last_id,)
                 )
-            await db.commit()
-            logger.info(f"Пользователь {user_id} добавлен/обновлен в БД.")
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при добавлении/обновлении пользователя {user_id}: {e}")
-        raise
-
-
-async def get_user(user_id: int) -> dict | None:
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-            user = await cursor.fetchone()
-            return dict(user) if user else None
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при получении пользователя {user_id}: {e}")
-        raise
-
-
-async def update_user_status(user_id: int, status: str):
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute("UPDATE users SET status = ? WHERE user_id = ?", (status, user_id))
-            await db.commit()
-            logger.info(f"Статус пользователя {user_id} обновлен на {status}.")
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при обновлении статуса пользователя {user_id}: {e}")
-        raise
+            return len(events)
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при записи {len(events)} событий истории подписок: {e}")
+            raise
 
+    @_timed_query
+    async def get_subscription_rollup(self, day: str, kind: str, days: int, channel_id: int) -> int:
+        """
+        Количество событий kind со сроком days за день day (YYYY-MM-DD): поиск по первичному ключу сводки.
+        """
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(
+                    "SELECT count FROM subscription_rollups WHERE day = ? AND channel_id = ? AND kind = ? AND days = ?",
+                    (day, channel_id, kind, days)
+                )
+                row = await cursor.fetchone()
+            return row['count'] if row else 0
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при чтении сводки истории подписок за {day}: {e}")
+            raise
 
-async def update_subscription(user_id: int, end_date: str):
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute(
-                "UPDATE users SET status = 'active', subscription_end_date = ? WHERE user_id = ?",
-                (end_date, user_id)
-            )
-            await db.commit()
-            logger.info(f"Подписка для пользователя {user_id} обновлена до {end_date}.")
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при обновлении подписки для пользователя {user_id}: {e}")
-        raise
-
-
-async def _execute_user_query(query: str, params: tuple) -> list[dict]:
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(query, params)
-            users = await cursor.fetchall()
-            return [dict(row) for row in users]
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при выполнении запроса пользователей: {e}")
-        raise
-
-async def get_users_by_status(status: str) -> list[dict]:
-    return await _execute_user_query("""
-        SELECT * FROM users 
-        WHERE status = ? 
-        ORDER BY subscription_end_date IS NULL, subscription_end_date ASC
-    """, (status,))
-
-async def get_users_expiring_soon(status: str = 'active', days: int = 10) -> list[dict]:
-    return await _execute_user_query("""
-        SELECT * FROM users 
-        WHERE status = ? 
-        AND subscription_end_date IS NOT NULL
-        AND subscription_end_date <= date('now', '+' || ? || ' days')
-        AND subscription_end_date >= date('now')
-        ORDER BY subscription_end_date ASC
-    """, (status, days))
-
-async def get_all_users() -> list[dict]:
-    return await _execute_user_query("SELECT * FROM users", ())
-
-
-async def find_user_by_id_or_username(identifier: str) -> dict | None:    
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            db.row_factory = aiosqlite.Row
-            if identifier.startswith('@'):
-                username = identifier[1:].lower() 
-                cursor = await db.execute("SELECT * FROM users WHERE username = ?", (username,))
-            else:
-                try:
-                    user_id = int(identifier)
-                    cursor = await db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-                except ValueError:
-                    return None
-            user = await cursor.fetchone()
-            return dict(user) if user else None
-    except aiosqlite.Error as e:
-        logger.error(f"Ошибка при поиске пользователя по '{identifier}': {e}")
-        raise 
\ No newline at end of file
+    @_timed_query
+    async def get_daily_rollups(self, day: str, channel_id: int | None = None) -> list[dict]:
+        """
+        Все сводки за день: строки (channel_id, kind, days, count).
+        """
+        channel_sql, channel_params = _channel_filter(channel_id)
+        return await self._execute_user_query(
+            f"SELECT channel_id, kind, days, count FROM subscription_rollups WHERE day = ?{channel_sql} ORDER BY channel_id, kind, days",
+            (day, *channel_params)
+        )
+
+    @_timed_query
+    async def get_subscription_history(self, user_id: int, channel_id: int | None = None, limit: int = 50) -> list[dict]:
+        channel_sql, channel_params = _channel_filter(channel_id)
+        return await self._execute_user_query(
+            f"SELECT * FROM subscription_events WHERE user_id = ?{channel_sql} ORDER BY id DESC LIMIT ?",
+            (user_id, *channel_params, limit)
+        )
+
+    async def _execute_user_query(self, query: str, params: tuple) -> list[dict]:
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(query, params)
+                users = await cursor.fetchall()
+                return [dict(row) for row in users]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при выполнении запроса пользователей: {e}")
+            raise
+
+    @_timed_query
+    async def get_users_by_status(self, status: str, channel_id: int | None = None) -> list[dict]:
+        channel_sql, channel_params = _channel_filter(channel_id)
+        return await self._execute_user_query(f"""
+            SELECT * FROM users 
+            WHERE status = ?{channel_sql}
+            ORDER BY subscription_end_date IS NULL, subscription_end_date ASC
+        """, (status, *channel_params))
+
+    @_timed_query
+    async def get_users_expiring_soon(self, status: str = 'active', days: int = 10, channel_id: int | None = None) -> list[dict]:
+        channel_sql, channel_params = _channel_filter(channel_id)
+        return await self._execute_user_query(f"""
+            SELECT * FROM users 
+            WHERE status = ? 
+            AND subscription_end_date IS NOT NULL
+            AND subscription_end_date <= date('now', '+' || ? || ' days')
+            AND subscription_end_date >= date('now'){channel_sql}
+            ORDER BY subscription_end_date ASC
+        """, (status, days, *channel_params))
+
+    @_timed_query
+    async def get_all_users(self) -> list[dict]:
+        return await self._execute_user_query("SELECT * FROM users", ())
+
+    @_timed_query
+    async def get_users_page(
+        self,
+        status: str | None = None,
+        expiring_days: int | None = None,
+        channel_id: int | None = None,
+        keyset: tuple[str | None, int] | None = None,
+        forward: bool = True,
+        limit: int = 20,
+    ) -> tuple[list[dict], int]:
+        """
+        Одна страница пользователей по ключу (subscription_end_date, id) и общее количество строк.
+        keyset - ключ последней (forward=True) или первой (forward=False) строки соседней страницы.
+        """
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if expiring_days is not None:
+            conditions.append("subscription_end_date IS NOT NULL")
+            conditions.append("subscription_end_date <= date('now', '+' || ? || ' days')")
+            conditions.append("subscription_end_date >= date('now')")
+            params.append(expiring_days)
+        if channel_id is not None:
+            conditions.append("channel_id = ?")
+            params.append(channel_id)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "ASC" if forward else "DESC"
+
+        try:
+            async with self._get_pool().reader() as db:
+                rows = []
+                for condition, condition_params in _keyset_segments(keyset, forward, null_dates=expiring_days is None):
+                    page_conditions = conditions + [condition] if condition else conditions
+                    page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+                    cursor = await db.execute(f"""
+                        SELECT * FROM users {page_where}
+                        ORDER BY subscription_end_date {order}, id {order}
+                        LIMIT ?
+                    """, (*params, *condition_params, limit - len(rows)))
+                    rows += [dict(row) for row in await cursor.fetchall()]
+                    if len(rows) >= limit:
+                        break
+                if expiring_days is None:
+                    # Без фильтра по дате общее количество берется из счетчиков, а не подсчетом строк
+                    counter_where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                    cursor = await db.execute(f"SELECT COALESCE(SUM(count), 0) FROM status_counters {counter_where}", params)
+                else:
+                    cursor = await db.execute(f"SELECT COUNT(*) FROM users {where}", params)
+                total = (await cursor.fetchone())[0]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при получении страницы пользователей: {e}")
+            raise
+
+        if not forward:
+            rows.reverse()
+        return rows, total
+
+    @_timed_query
+    async def get_expired_users(self, today: str, channel_id: int, status: str = 'active') -> list[dict]:
+        # date(x) = x отсекает пустые и некорректные даты: для них date() возвращает NULL
+        return await self._execute_user_query("""
+            SELECT * FROM users
+            WHERE status = ?
+            AND subscription_end_date < ?
+            AND date(subscription_end_date) = subscription_end_date
+            AND channel_id = ?
+            ORDER BY subscription_end_date ASC
+        """, (status, today, channel_id))
+
+    @_timed_query
+    async def get_users_with_invalid_end_date(self, status: str = 'active', channel_id: int | None = None) -> list[dict]:
+        channel_sql, channel_params = _channel_filter(channel_id)
+        return await self._execute_user_query(f"""
+            SELECT * FROM users
+            WHERE status = ?
+            AND (subscription_end_date IS NULL OR date(subscription_end_date) IS NOT subscription_end_date){channel_sql}
+        """, (status, *channel_params))
+
+    @_timed_query
+    async def count_users_by_status(self, status: str, channel_id: int | None = None) -> int:
+        # Счетчики ведутся триггерами на users, поэтому подсчет не зависит от размера таблицы
+        channel_sql, channel_params = _channel_filter(channel_id)
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(
+                    f"SELECT COALESCE(SUM(count), 0) FROM status_counters WHERE status = ?{channel_sql}",
+                    (status, *channel_params)
+                )
+                row = await cursor.fetchone()
+                return row[0]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при подсчете пользователей со статусом {status}: {e}")
+            raise
+
+    @_timed_query
+    async def count_distinct_users(self) -> int:
+        """
+        Количество разных пользователей во всех каналах: пользователь из нескольких каналов считается один раз.
+        Счетчики ведутся по строкам каналов, поэтому здесь - проход по индексу idx_users_user_id.
+        """
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute("SELECT COUNT(DISTINCT user_id) FROM users")
+                row = await cursor.fetchone()
+                return row[0]
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при подсчете пользователей: {e}")
+            raise
+
+    @_timed_query
+    async def get_status_counts(self, channel_id: int | None = None) -> dict[str, int]:
+        """
+        Количество пользователей по статусам из счетчиков status_counters.
+        """
+        channel_sql, channel_params = _channel_filter(channel_id)
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(
+                    f"SELECT status, SUM(count) AS count FROM status_counters WHERE count > 0{channel_sql} GROUP BY status",
+                    channel_params
+                )
+                return {row['status']: row['count'] for row in await cursor.fetchall()}
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при чтении счетчиков пользователей: {e}")
+            raise
+
+    @_timed_query
+    async def get_expiry_counts(self, date_from: str, date_to: str, channel_id: int | None = None) -> dict[str, int]:
+        """
+        Количество активных подписок по датам окончания в диапазоне [date_from, date_to] из счетчиков expiry_counters.
+        Строк не больше, чем дней в диапазоне, независимо от размера таблицы users.
+        """
+        channel_sql, channel_params = _channel_filter(channel_id)
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(
+                    f"""
+                    SELECT end_date, SUM(count) AS count FROM expiry_counters
+                    WHERE end_date BETWEEN ? AND ? AND count > 0{channel_sql}
+                    GROUP BY end_date
+                    """,
+                    (date_from, date_to, *channel_params)
+                )
+                return {row['end_date']: row['count'] for row in await cursor.fetchall()}
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при чтении счетчиков дат окончания подписок: {e}")
+            raise
+
+    @_timed_query
+    async def search_users(self, text: str, limit: int = 20, offset: int = 0, channel_id: int | None = None) -> tuple[list[dict], bool, bool]:
+        """
+        Поиск пользователей по началу слов в full_name и username через индекс FTS5, лучшие совпадения первыми.
+        Ранжируются только первые SEARCH_CANDIDATES совпадений, чтобы короткий запрос вроде одной буквы
+        не сортировал всю таблицу. Возвращает страницу, признак следующей страницы и признак того,
+        что совпадений больше, чем кандидатов (запрос стоит уточнить).
+        """
+        tokens = search_tokens(text)
+        if not tokens:
+            return [], False, False
+        # Каждое слово запроса - префикс слова в имени или username: "ив петр" находит "Иван Петров"
+        match = " ".join(f'"{token}"*' for token in tokens)
+        channel_sql = " AND users.channel_id = ?" if channel_id is not None else ""
+        channel_params = (channel_id,) if channel_id is not None else ()
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(
+                    f"""
+                    SELECT users.* FROM (
+                        SELECT rowid, rank FROM users_fts WHERE users_fts MATCH ? LIMIT ?
+                    ) AS hits
+                    JOIN users ON users.id = hits.rowid
+                    WHERE 1{channel_sql}
+                    ORDER BY hits.rank, users.id
+                    LIMIT ? OFFSET ?
+                    """,
+                    (match, SEARCH_CANDIDATES, *channel_params, limit + 1, offset)
+                )
+                rows = [dict(row) for row in await cursor.fetchall()]
+                cursor = await db.execute(
+                    "SELECT COUNT(*) FROM (SELECT rowid FROM users_fts WHERE users_fts MATCH ? LIMIT ?)",
+                    (match, SEARCH_CANDIDATES + 1)
+                )
+                truncated = (await cursor.fetchone())[0] > SEARCH_CANDIDATES
+            return rows[:limit], len(rows) > limit, truncated
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при полнотекстовом поиске пользователей по '{text}': {e}")
+            raise
+
+    @_timed_query
+    async def find_user_by_id_or_username(self, identifier: str, channel_id: int | None = None) -> dict | None:    
+        """
+        Ищет пользователя по ID или @username. Без channel_id возвращается строка с самой поздней заявкой.
+        """
+        if identifier.startswith('@'):
+            condition, value = "username = ?", identifier[1:].lower()
+        else:
+            try:
+                value = int(identifier)
+            except ValueError:
+                return None
+            if channel_id is not None:
+                return await self.get_user(value, channel_id)
+            condition = "user_id = ?"
+
+        if channel_id is not None:
+            cached = self._cache.get_by_username(value, channel_id)
+            if cached is not None:
+                return cached
+
+        channel_sql, channel_params = _channel_filter(channel_id)
+        try:
+            async with self._get_pool().reader() as db:
+                cursor = await db.execute(
+                    f"SELECT * FROM users WHERE {condition}{channel_sql} ORDER BY last_application_date DESC, id DESC LIMIT 1",
+                    (value, *channel_params)
+                )
+                user = await cursor.fetchone()
+            if not user:
+                return None
+            user = dict(user)
+            self._cache.put(user)
+            return user
+        except aiosqlite.Error as e:
+            logger.error(f"Ошибка при поиске пользователя по '{identifier}': {e}")
+            raise
@@ -0,0 +1,583 @@
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+from loguru import logger
+
+from src.database.database import IMPORT_COLUMNS, SEARCH_CANDIDATES, SWEEP_RUNS_KEEP, _timed_query, search_tokens
+
+# Ключ порядка списков (subscription_end_date, id): пустые даты идут первыми, как в SQLite
+_NULL_DATE = (0, '')
+# Больше любого символа слова: token + _MAX_CHAR ограничивает сверху все слова с префиксом token
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def _order_key(row: dict) -> tuple:
+    end_date = row['subscription_end_date']
+    return (*_NULL_DATE, row['id']) if end_date is None else (1, end_date, row['id'])
+
+
+def _keyset_key(keyset: tuple[str | None, int]) -> tuple:
+    end_date, row_id = keyset
+    return (*_NULL_DATE, row_id) if end_date is None else (1, end_date, row_id)
+
+
+def _is_date(value) -> bool:
+    # То же, что date(x) = x в SQLite: строка ровно в формате YYYY-MM-DD с существующей датой
+    if not isinstance(value, str) or len(value) != 10 or value[4] != '-' or value[7] != '-':
+        return False
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _fold(token: str) -> str:
+    # Как remove_diacritics у токенизатора unicode61: й -> и, ё -> е, é -> e
+    decomposed = unicodedata.normalize('NFD', token)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _search_tokens(text: str | None) -> set[str]:
+    return {_fold(token) for token in search_tokens(text)} if text else set()
+
+
+class MemoryStorage:
+    """
+    Хранилище пользователей в памяти процесса с теми же операциями, что у SQLiteStorage.
+    Строки упорядочены по (subscription_end_date, id) отдельно для каждого статуса и канала, поэтому
+    страницы списков, истекшие и истекающие подписки находятся бинарным поиском, а не перебором.
+    Данные не сохраняются между запусками.
+    """
+
+    def __init__(self):
+        self._change_listeners: list[Callable[[list[dict]], None]] = []
+        # Поколение данных: растет при каждом изменении строк пользователей
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        self._rows: dict[int, dict] = {}
+        self._keys: dict[tuple[int, int], int] = {}
+        self._by_user: defaultdict[int, set[int]] = defaultdict(set)
+        self._usernames: defaultdict[str, dict[int, int]] = defaultdict(dict)
+        self._next_id = 1
+        # (channel_id | None, status | None) -> отсортированные ключи _order_key
+        self._order: defaultdict[tuple, list[tuple]] = defaultdict(list)
+        self._status_counts: Counter[tuple[int, str]] = Counter()
+        self._expiry_counts: Counter[tuple[int, str]] = Counter()
+        # Слова имени и username -> id строк; отсортированный список слов для поиска по префиксу
+        self._tokens: dict[str, set[int]] = {}
+        self._sorted_tokens: list[str] = []
+        self._row_tokens: dict[int, tuple[set[str], set[str]]] = {}
+
+        self._sweep_runs: dict[int, dict] = {}
+        self._sweep_journal: dict[int, dict[tuple[int, int], str]] = {}
+        self._next_run_id = 1
+
+        self._events: list[dict] = []
+        self._user_events: defaultdict[int, list[dict]] = defaultdict(list)
+        self._grant_days: dict[tuple[int, int], int] = {}
+        self._rollups: Counter[tuple[str, int, str, int]] = Counter()
+
+    def add_change_listener(self, listener: Callable[[list[dict]], None]):
+        """
+        Подписка на изменения статуса и даты окончания подписки: listener получает измененные строки.
+        """
+        self._change_listeners.append(listener)
+
+    def _notify_changed(self, rows: list[dict]):
+        if not rows:
+            return
+        for listener in self._change_listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике изменений пользователей: {e}")
+
+    async def open(self):
+        logger.info("Хранилище пользователей в памяти: данные не сохраняются после остановки бота.")
+
+    async def close(self):
+        logger.info(f"Хранилище в памяти закрыто, пользователей: {len(self._rows)}.")
+        self._reset()
+
+    def get_cached_user(self, user_id: int, channel_id: int) -> dict | None:
+        row_id = self._keys.get((channel_id, user_id))
+        return dict(self._rows[row_id]) if row_id is not None else None
+
+    def get_cache_stats(self) -> dict:
+        return {}
+
+    # --- Индексы ---
+
+    def _order_groups(self, row: dict) -> tuple:
+        channel_id, status = row['channel_id'], row['status']
+        return (None, None), (None, status), (channel_id, None), (channel_id, status)
+
+    def _index(self, row: dict):
+        row_id, channel_id, status, end_date = row['id'], row['channel_id'], row['status'], row['subscription_end_date']
+        self.generation += 1
+        key = _order_key(row)
+        for group in self._order_groups(row):
+            insort(self._order[group], key)
+        self._status_counts[(channel_id, status)] += 1
+        if status == 'active' and end_date is not None:
+            self._expiry_counts[(channel_id, end_date)] += 1
+        if row['username']:
+            self._usernames[row['username']][channel_id] = row_id
+        self._by_user[row['user_id']].add(row_id)
+
+        name_tokens, username_tokens = _search_tokens(row['full_name']), _search_tokens(row['username'])
+        self._row_tokens[row_id] = (name_tokens, username_tokens)
+        for token in name_tokens | username_tokens:
+            rows = self._tokens.get(token)
+            if rows is None:
+                rows = self._tokens[token] = set()
+                insort(self._sorted_tokens, token)
+            rows.add(row_id)
+
+    def _unindex(self, row: dict):
+        row_id, channel_id, status, end_date = row['id'], row['channel_id'], row['status'], row['subscription_end_date']
+        key = _order_key(row)
+        for group in self._order_groups(row):
+            keys = self._order[group]
+            del keys[bisect_left(keys, key)]
+        self._status_counts[(channel_id, status)] -= 1
+        if status == 'active' and end_date is not None:
+            self._expiry_counts[(channel_id, end_date)] -= 1
+            if self._expiry_counts[(channel_id, end_date)] <= 0:
+                del self._expiry_counts[(channel_id, end_date)]
+        if row['username'] and self._usernames[row['username']].get(channel_id) == row_id:
+            del self._usernames[row['username']][channel_id]
+            if not self._usernames[row['username']]:
+                del self._usernames[row['username']]
+        self._by_user[row['user_id']].discard(row_id)
+
+        name_tokens, username_tokens = self._row_tokens.pop(row_id)
+        for token in name_tokens | username_tokens:
+            rows = self._tokens[token]
+            rows.discard(row_id)
+            if not rows:
+                del self._tokens[token]
+                del self._sorted_tokens[bisect_left(self._sorted_tokens, token)]
+
+    def _update_row(self, row_id: int, **changes) -> dict:
+        row = self._rows[row_id]
+        self._unindex(row)
+        row.update(changes)
+        self._index(row)
+        return dict(row)
+
+    def _release_username(self, username: str, user_id: int):
+        # username уникален в Telegram: освобождаем его во всех каналах, если он остался за другим пользователем
+        for row_id in list(self._usernames.get(username, {}).values()):
+            if self._rows[row_id]['user_id'] != user_id:
+                self._update_row(row_id, username=None)
+
+    def _insert_row(self, channel_id: int, user_id: int, **values) -> dict:
+        row = {
+            'id': self._next_id,
+            'channel_id': channel_id,
+            'user_id': user_id,
+            'username': None,
+            'full_name': '',
+            'status': 'pending',
+            'subscription_end_date': None,
+            'last_application_date': None,
+            **values,
+        }
+        self._next_id += 1
+        self._rows[row['id']] = row
+        self._keys[(channel_id, user_id)] = row['id']
+        self._index(row)
+        return dict(row)
+
+    def _copies(self, row_ids) -> list[dict]:
+        return [dict(self._rows[row_id]) for row_id in row_ids]
+
+    def _ordered(self, channel_id: int | None, status: str | None, low: tuple = (), high: tuple | None = None) -> list[tuple]:
+        # Ключи группы в диапазоне [low, high]: префикс ключа сравнивается как в кортежах Python
+        keys = self._order.get((channel_id, status), [])
+        start = bisect_left(keys, low) if low else 0
+        end = bisect_right(keys, high) if high is not None else len(keys)
+        return keys[start:end]
+
+    # --- Пользователи ---
+
+    def _upsert_user_row(self, channel_id: int, user_id: int, full_name: str, username: str | None, applied_at: str) -> dict:
+        if username:
+            self._release_username(username, user_id)
+        row_id = self._keys.get((channel_id, user_id))
+        if row_id is None:
+            return self._insert_row(channel_id, user_id, full_name=full_name, username=username, last_application_date=applied_at)
+        return self._update_row(row_id, full_name=full_name, username=username, last_application_date=applied_at)
+
+    @_timed_query
+    async def upsert_user(self, channel_id: int, user_id: int, full_name: str, username: str | None) -> dict:
+        user = self._upsert_user_row(channel_id, user_id, full_name, username.lower() if username else username, str(datetime.now()))
+        logger.info(f"Пользователь {user_id} добавлен/обновлен в БД (канал {channel_id}).")
+        return user
+
+    @_timed_query
+    async def bulk_upsert_users(self, applicants: list[tuple[int, int, str, str | None]]) -> list[dict]:
+        applied_at = str(datetime.now())
+        users = [
+            self._upsert_user_row(channel_id, user_id, full_name, username.lower() if username else username, applied_at)
+            for channel_id, user_id, full_name, username in applicants
+        ]
+        if users:
+            logger.info(f"Добавлено/обновлено {len(users)} пользователей в БД.")
+        return users
+
+    @_timed_query
+    async def import_users(self, rows: list[tuple]) -> int:
+        for row in rows:
+            values = dict(zip(IMPORT_COLUMNS, row))
+            channel_id, user_id = values.pop('channel_id'), values.pop('user_id')
+            if values['username']:
+                self._release_username(values['username'], user_id)
+            row_id = self._keys.get((channel_id, user_id))
+            if row_id is None:
+                self._insert_row(channel_id, user_id, **values)
+            else:
+                if values['last_application_date'] is None:
+                    values['last_application_date'] = self._rows[row_id]['last_application_date']
+                self._update_row(row_id, **values)
+        if self._change_listeners:
+            self._notify_changed([dict(zip(IMPORT_COLUMNS, row)) for row in rows])
+        return len(rows)
+
+    async def iter_users(self, batch_size: int = 1000):
+        row_ids = sorted(self._rows)
+        for i in range(0, len(row_ids), batch_size):
+            batch = [dict(self._rows[row_id]) for row_id in row_ids[i:i + batch_size] if row_id in self._rows]
+            if batch:
+                yield batch
+
+    @_timed_query
+    async def get_user(self, user_id: int, channel_id: int) -> dict | None:
+        return self.get_cached_user(user_id, channel_id)
+
+    @_timed_query
+    async def get_user_channels(self, user_id: int) -> list[dict]:
+        rows = self._copies(self._by_user.get(user_id, ()))
+        return sorted(rows, key=lambda row: (row['last_application_date'] or '', row['id']), reverse=True)
+
+    @_timed_query
+    async def find_users(self, user_ids: list[int], usernames: list[str]) -> list[dict]:
+        row_ids = {row_id for user_id in user_ids for row_id in self._by_user.get(user_id, ())}
+        row_ids |= {row_id for username in usernames for row_id in self._usernames.get(username.lower(), {}).values()}
+        return self._copies(sorted(row_ids))
+
+    @_timed_query
+    async def get_users_by_ids(self, user_ids: list[int], channel_id: int) -> list[dict]:
+        row_ids = dict.fromkeys(self._keys.get((channel_id, user_id)) for user_id in user_ids)
+        return self._copies(row_id for row_id in row_ids if row_id is not None)
+
+    @_timed_query
+    async def find_user_by_id_or_username(self, identifier: str, channel_id: int | None = None) -> dict | None:
+        if identifier.startswith('@'):
+            row_ids = list(self._usernames.get(identifier[1:].lower(), {}).values())
+        else:
+            try:
+                row_ids = list(self._by_user.get(int(identifier), ()))
+            except ValueError:
+                return None
+        rows = [row for row in self._copies(row_ids) if channel_id is None or row['channel_id'] == channel_id]
+        if not rows:
+            return None
+        return max(rows, key=lambda row: (row['last_application_date'] or '', row['id']))
+
+    @_timed_query
+    async def search_users(self, text: str, limit: int = 20, offset: int = 0, channel_id: int | None = None) -> tuple[list[dict], bool, bool]:
+        """
+        Поиск по началу слов в full_name и username, как у индекса users_fts в SQLite.
+        Ранжирование приближает bm25(1.0, 2.0): совпадения в username весят вдвое больше, точные слова выше префиксов.
+        """
+        tokens = [_fold(token) for token in search_tokens(text)]
+        if not tokens:
+            return [], False, False
+        # Строки собираются по самому редкому префиксу, остальные слова запроса проверяются по словам строки
+        ranges = sorted(
+            (bisect_left(self._sorted_tokens, token + _MAX_CHAR) - bisect_left(self._sorted_tokens, token), token)
+            for token in tokens
+        )
+        start = bisect_left(self._sorted_tokens, ranges[0][1])
+        matched = set().union(*(self._tokens[token] for token in self._sorted_tokens[start:start + ranges[0][0]]))
+        for _, token in ranges[1:]:
+            matched = {
+                row_id for row_id in matched
+                if any(row_token.startswith(token) for row_tokens in self._row_tokens[row_id] for row_token in row_tokens)
+            }
+        if not matched:
+            return [], False, False
+
+        candidates = sorted(matched)
+        truncated = len(candidates) > SEARCH_CANDIDATES
+
+        def score(row_id: int) -> float:
+            name_tokens, username_tokens = self._row_tokens[row_id]
+            total = 0.0
+            for token in tokens:
+                for row_tokens, weight in ((name_tokens, 1.0), (username_tokens, 2.0)):
+                    if token in row_tokens:
+                        total += weight * 2
+                    elif any(row_token.startswith(token) for row_token in row_tokens):
+                        total += weight
+            return -total
+
+        ranked = [
+            row_id for row_id in candidates[:SEARCH_CANDIDATES]
+            if channel_id is None or self._rows[row_id]['channel_id'] == channel_id
+        ]
+        ranked.sort(key=lambda row_id: (score(row_id), row_id))
+        page = ranked[offset:offset + limit + 1]
+        return self._copies(page[:limit]), len(page) > limit, truncated
+
+    def _set_status(self, row_ids: list[int], status: str) -> list[dict]:
+        return [self._update_row(row_id, status=status) for row_id in row_ids]
+
+    @_timed_query
+    async def update_user_status(self, user_id: int, status: str, channel_id: int | None = None) -> list[dict]:
+        row_ids = [
+            row_id for row_id in sorted(self._by_user.get(user_id, ()))
+            if channel_id is None or self._rows[row_id]['channel_id'] == channel_id
+        ]
+        rows = self._set_status(row_ids, status)
+        self._notify_changed(rows)
+        logger.info(f"Статус пользователя {user_id} обновлен на {status}.")
+        return rows
+
+    @_timed_query
+    async def update_subscription(self, user_id: int, end_date: str, channel_id: int):
+        row_id = self._keys.get((channel_id, user_id))
+        if row_id is not None:
+            self._notify_changed([self._update_row(row_id, status='active', subscription_end_date=end_date)])
+        logger.info(f"Подписка для пользователя {user_id} в канале {channel_id} обновлена до {end_date}.")
+
+    def _update_status_rows(self, user_ids: list[int], status: str, from_status: str | None, channel_id: int | None) -> list[dict]:
+        row_ids = [
+            row_id
+            for user_id in dict.fromkeys(user_ids)
+            for row_id in sorted(self._by_user.get(user_id, ()))
+            if self._rows[row_id]['status'] != status
+            and (from_status is None or self._rows[row_id]['status'] == from_status)
+            and (channel_id is None or self._rows[row_id]['channel_id'] == channel_id)
+        ]
+        return self._set_status(row_ids, status)
+
+    @_timed_query
+    async def bulk_update_status(self, user_ids: list[int], status: str, from_status: str | None = None, channel_id: int | None = None) -> list[int]:
+        rows = self._update_status_rows(user_ids, status, from_status, channel_id)
+        self._notify_changed(rows)
+        changed = list(dict.fromkeys(row['user_id'] for row in rows))
+        if user_ids:
+            logger.info(f"Статус {status} установлен для {len(changed)} из {len(user_ids)} пользователей.")
+        return changed
+
+    @_timed_query
+    async def bulk_update_subscription(self, user_ids: list[int], end_date: str, channel_id: int) -> list[int]:
+        row_ids = dict.fromkeys(self._keys.get((channel_id, user_id)) for user_id in user_ids)
+        rows = [
+            self._update_row(row_id, status='active', subscription_end_date=end_date)
+            for row_id in row_ids if row_id is not None
+        ]
+        self._notify_changed(rows)
+        changed = [row['user_id'] for row in rows]
+        if user_ids:
+            logger.info(f"Подписка до {end_date} в канале {channel_id} установлена для {len(changed)} из {len(user_ids)} пользователей.")
+        return changed
+
+    @_timed_query
+    async def bulk_update_subscriptions(self, keys: list[tuple[int, int]], end_date: str) -> list[tuple[int, int]]:
+        row_ids = dict.fromkeys(self._keys.get(key) for key in keys)
+        rows = [
+            self._update_row(row_id, status='active', subscription_end_date=end_date)
+            for row_id in row_ids if row_id is not None
+        ]
+        self._notify_changed(rows)
+        if keys:
+            logger.info(f"Подписка до {end_date} установлена для {len(rows)} из {len(keys)} пользователей.")
+        return [(row['channel_id'], row['user_id']) for row in rows]
+
+    # --- Выборки и счетчики ---
+
+    @_timed_query
+    async def get_all_users(self) -> list[dict]:
+        return self._copies(self._rows)
+
+    @_timed_query
+    async def get_users_by_status(self, status: str, channel_id: int | None = None) -> list[dict]:
+        keys = self._ordered(channel_id, status)
+        # Пустые даты в этой выборке идут последними
+        nulls = bisect_left(keys, (1,))
+        return self._copies(key[-1] for key in keys[nulls:] + keys[:nulls])
+
+    @_timed_query
+    async def get_users_expiring_soon(self, status: str = 'active', days: int = 10, channel_id: int | None = None) -> list[dict]:
+        today = date.today()
+        keys = self._ordered(channel_id, status, (1, today.isoformat()), (1, (today + timedelta(days=days)).isoformat(), float('inf')))
+        return self._copies(key[-1] for key in keys)
+
+    @_timed_query
+    async def get_users_page(
+        self,
+        status: str | None = None,
+        expiring_days: int | None = None,
+        channel_id: int | None = None,
+        keyset: tuple[str | None, int] | None = None,
+        forward: bool = True,
+        limit: int = 20,
+    ) -> tuple[list[dict], int]:
+        keys = self._order.get((channel_id, status), [])
+        start, end = 0, len(keys)
+        if expiring_days is not None:
+            today = date.today()
+            start = bisect_left(keys, (1, today.isoformat()))
+            end = bisect_right(keys, (1, (today + timedelta(days=expiring_days)).isoformat(), float('inf')))
+        total = max(0, end - start)
+        if forward:
+            first = max(start, bisect_right(keys, _keyset_key(keyset))) if keyset is not None else start
+            page = keys[first:min(end, first + limit)]
+        else:
+            last = min(end, bisect_left(keys, _keyset_key(keyset))) if keyset is not None else end
+            page = keys[max(start, last - limit):last]
+        return self._copies(key[-1] for key in page), total
+
+    @_timed_query
+    async def get_expired_users(self, today: str, channel_id: int, status: str = 'active') -> list[dict]:
+        keys = self._ordered(channel_id, status, (1,), (1, today))
+        return self._copies(key[-1] for key in keys if key[1] < today and _is_date(key[1]))
+
+    @_timed_query
+    async def get_users_with_invalid_end_date(self, status: str = 'active', channel_id: int | None = None) -> list[dict]:
+        return self._copies(key[-1] for key in self._ordered(channel_id, status) if not _is_date(self._rows[key[-1]]['subscription_end_date']))
+
+    @_timed_query
+    async def count_users_by_status(self, status: str, channel_id: int | None = None) -> int:
+        return len(self._order.get((channel_id, status), ()))
+
+    @_timed_query
+    async def count_distinct_users(self) -> int:
+        return sum(1 for row_ids in self._by_user.values() if row_ids)
+
+    @_timed_query
+    async def get_status_counts(self, channel_id: int | None = None) -> dict[str, int]:
+        counts = Counter()
+        for (row_channel_id, status), count in self._status_counts.items():
+            if count > 0 and (channel_id is None or row_channel_id == channel_id):
+                counts[status] += count
+        return dict(counts)
+
+    @_timed_query
+    async def get_expiry_counts(self, date_from: str, date_to: str, channel_id: int | None = None) -> dict[str, int]:
+        counts = Counter()
+        for (row_channel_id, end_date), count in self._expiry_counts.items():
+            if date_from <= end_date <= date_to and (channel_id is None or row_channel_id == channel_id):
+                counts[end_date] += count
+        return dict(counts)
+
+    # --- Журнал проверок подписок ---
+
+    @_timed_query
+    async def create_sweep_run(self, users: list[dict]) -> int:
+        run_id = self._next_run_id
+        self._next_run_id += 1
+        self._sweep_runs[run_id] = {'started_at': datetime.now().isoformat(sep=' ', timespec='seconds'), 'finished_at': None}
+        journal = self._sweep_journal[run_id] = {}
+        for user in users:
+            key = (user['channel_id'], user['user_id'])
+            row_id = self._keys.get(key)
+            if row_id is not None and self._rows[row_id]['status'] == 'active':
+                journal.setdefault(key, 'pending')
+        return run_id
+
+    @_timed_query
+    async def get_unfinished_sweep_run(self) -> int | None:
+        unfinished = [run_id for run_id, run in self._sweep_runs.items() if run['finished_at'] is None]
+        return max(unfinished, default=None)
+
+    @_timed_query
+    async def get_sweep_journal(self, run_id: int) -> list[dict]:
+        users = []
+        for key, step in self._sweep_journal.get(run_id, {}).items():
+            row_id = self._keys.get(key)
+            if row_id is not None:
+                users.append({**self._rows[row_id], 'step': step})
+        return users
+
+    @_timed_query
+    async def mark_sweep_steps(self, run_id: int, keys: list[tuple[int, int]], step: str):
+        journal = self._sweep_journal.get(run_id, {})
+        for key in keys:
+            if key in journal:
+                journal[key] = step
+
+    @_timed_query
+    async def complete_sweep_users(self, run_id: int, channel_id: int, user_ids: list[int]) -> list[int]:
+        rows = self._update_status_rows(user_ids, 'expired', 'active', channel_id)
+        journal = self._sweep_journal.get(run_id, {})
+        for user_id in user_ids:
+            if (channel_id, user_id) in journal:
+                journal[(channel_id, user_id)] = 'done'
+        self._notify_changed(rows)
+        return [row['user_id'] for row in rows]
+
+    @_timed_query
+    async def finish_sweep_run(self, run_id: int):
+        if run_id in self._sweep_runs:
+            self._sweep_runs[run_id]['finished_at'] = datetime.now().isoformat(sep=' ', timespec='seconds')
+        finished = sorted((run_id for run_id, run in self._sweep_runs.items() if run['finished_at'] is not None), reverse=True)
+        if len(finished) >= SWEEP_RUNS_KEEP:
+            oldest_kept = finished[SWEEP_RUNS_KEEP - 1]
+            for old_run_id in [run_id for run_id in self._sweep_runs if run_id < oldest_kept]:
+                del self._sweep_runs[old_run_id]
+                self._sweep_journal.pop(old_run_id, None)
+
+    # --- История подписок ---
+
+    @_timed_query
+    async def append_subscription_events(self, events: list[tuple]) -> int:
+        for created_at, channel_id, user_id, kind, days, end_date in events:
+            if days is None:
+                # Срок события истечения берется из последней выдачи или продления подписки
+                days = self._grant_days.get((channel_id, user_id), 0)
+            elif kind in ('grant', 'extend'):
+                self._grant_days[(channel_id, user_id)] = days
+            event = {
+                'id': len(self._events) + 1,
+                'created_at': created_at,
+                'channel_id': channel_id,
+                'user_id': user_id,
+                'kind': kind,
+                'days': days,
+                'end_date': end_date,
+            }
+            self._events.append(event)
+            self._user_events[user_id].append(event)
+            self._rollups[(created_at[:10], channel_id, kind, days)] += 1
+        return len(events)
+
+    @_timed_query
+    async def get_subscription_rollup(self, day: str, kind: str, days: int, channel_id: int) -> int:
+        return self._rollups.get((day, channel_id, kind, days), 0)
+
+    @_timed_query
+    async def get_daily_rollups(self, day: str, channel_id: int | None = None) -> list[dict]:
+        return [
+            {'channel_id': row_channel_id, 'kind': kind, 'days': days, 'count': count}
+            for (row_day, row_channel_id, kind, days), count in sorted(self._rollups.items())
+            if row_day == day and (channel_id is None or row_channel_id == channel_id)
+        ]
+
+    @_timed_query
+    async def get_subscription_history(self, user_id: int, channel_id: int | None = None, limit: int = 50) -> list[dict]:
+        events = [
+            dict(event) for event in reversed(self._user_events.get(user_id, []))
+            if channel_id is None or event['channel_id'] == channel_id
+        ]
+        return events[:limit]
@@ -0,0 +1,317 @@
+from loguru import logger
+
+from src.database.pool import ConnectionPool
+
+# Упорядоченный список миграций: (версия, описание, SQL-выражения).
+# Текущая версия схемы хранится в PRAGMA user_version, каждая миграция применяется в своей транзакции.
+# Строки, которые возвращает выражение миграции, пишутся в лог: так видно, какие данные миграция изменила.
+MIGRATIONS: list[tuple[int, str, tuple[str, ...]]] = [
+    (1, "таблица users", (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            subscription_end_date DATE,
+            last_application_date DATETIME
+        )
+        """,
+    )),
+    (2, "индекс по статусу и дате окончания подписки", (
+        "CREATE INDEX IF NOT EXISTS idx_users_status_end_date ON users (status, subscription_end_date)",
+    )),
+    (3, "уникальный индекс по username в нижнем регистре", (
+        "UPDATE users SET username = NULL WHERE username = ''",
+        "UPDATE users SET username = lower(username) WHERE username <> lower(username)",
+        # При дубликатах username остается у пользователя с самой поздней заявкой, у остальных он сбрасывается
+        """
+        SELECT user_id, username FROM users
+        WHERE username IS NOT NULL AND EXISTS (
+            SELECT 1 FROM users AS other
+            WHERE other.username = users.username
+            AND (
+                COALESCE(other.last_application_date, '') > COALESCE(users.last_application_date, '')
+                OR (COALESCE(other.last_application_date, '') = COALESCE(users.last_application_date, '') AND other.user_id > users.user_id)
+            )
+        )
+        """,
+        """
+        UPDATE users SET username = NULL
+        WHERE username IS NOT NULL AND EXISTS (
+            SELECT 1 FROM users AS other
+            WHERE other.username = users.username
+            AND (
+                COALESCE(other.last_application_date, '') > COALESCE(users.last_application_date, '')
+                OR (COALESCE(other.last_application_date, '') = COALESCE(users.last_application_date, '') AND other.user_id > users.user_id)
+            )
+        )
+        """,
+        # Миграция 4 заменяет этот индекс на (username, channel_id), уникальность между каналами
+        # с версии 11 проверяют триггеры
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username)",
+    )),
+    (4, "подписки пользователей в разрезе каналов", (
+        """
+        CREATE TABLE users_by_channel (
+            id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            full_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            subscription_end_date DATE,
+            last_application_date DATETIME,
+            UNIQUE (channel_id, user_id)
+        )
+        """,
+        # Существующие строки относятся к каналу, с которым бот работал до миграции
+        """
+        INSERT INTO users_by_channel (channel_id, user_id, username, full_name, status, subscription_end_date, last_application_date)
+        SELECT :default_channel_id, user_id, username, full_name, status, subscription_end_date, last_application_date
+        FROM users ORDER BY user_id
+        """,
+        "DROP TABLE users",
+        "ALTER TABLE users_by_channel RENAME TO users",
+        "CREATE INDEX idx_users_status_end_date ON users (status, subscription_end_date)",
+        # Один пользователь хранит свой username в строке каждого канала, поэтому индекс уникален только внутри канала.
+        # Владельца username во всех каналах проверяют триггеры миграции 11
+        "CREATE UNIQUE INDEX idx_users_username ON users (username, channel_id)",
+        "CREATE INDEX idx_users_user_id ON users (user_id)",
+    )),
+    (5, "журнал проверок подписок", (
+        """
+        CREATE TABLE IF NOT EXISTS sweep_runs (
+            id INTEGER PRIMARY KEY,
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME
+        )
+        """,
+        # step: pending - ждет удаления из канала, kicked - удален, done - статус обновлен,
+        # failed - не удалось удалить, skipped - подписку продлили до удаления
+        """
+        CREATE TABLE IF NOT EXISTS sweep_journal (
+            run_id INTEGER NOT NULL REFERENCES sweep_runs (id),
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            step TEXT NOT NULL,
+            PRIMARY KEY (run_id, channel_id, user_id)
+        ) WITHOUT ROWID
+        """,
+    )),
+    (6, "история подписок и дневные сводки", (
+        # kind: grant, extend, expire, ban, unban, reject; days - срок из SUBSCRIPTION_PERIODS, 0 если срока нет
+        """
+        CREATE TABLE IF NOT EXISTS subscription_events (
+            id INTEGER PRIMARY KEY,
+            created_at DATETIME NOT NULL,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            end_date DATE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_subscription_events_user ON subscription_events (user_id, channel_id, id)",
+        """
+        CREATE TABLE IF NOT EXISTS subscription_rollups (
+            day DATE NOT NULL,
+            channel_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, channel_id, kind, days)
+        ) WITHOUT ROWID
+        """,
+    )),
+    (7, "счетчики пользователей по статусам и датам окончания подписки", (
+        """
+        CREATE TABLE IF NOT EXISTS status_counters (
+            channel_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (channel_id, status)
+        ) WITHOUT ROWID
+        """,
+        # Только активные подписки: по ним строится прогноз истечений
+        """
+        CREATE TABLE IF NOT EXISTS expiry_counters (
+            channel_id INTEGER NOT NULL,
+            end_date DATE NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (channel_id, end_date)
+        ) WITHOUT ROWID
+        """,
+        "DELETE FROM status_counters",
+        "DELETE FROM expiry_counters",
+        """
+        INSERT INTO status_counters (channel_id, status, count)
+        SELECT channel_id, status, COUNT(*) FROM users GROUP BY channel_id, status
+        """,
+        """
+        INSERT INTO expiry_counters (channel_id, end_date, count)
+        SELECT channel_id, subscription_end_date, COUNT(*) FROM users
+        WHERE status = 'active' AND subscription_end_date IS NOT NULL
+        GROUP BY channel_id, subscription_end_date
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_counters_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO status_counters (channel_id, status, count) VALUES (NEW.channel_id, NEW.status, 1)
+            ON CONFLICT (channel_id, status) DO UPDATE SET count = count + 1;
+            INSERT INTO expiry_counters (channel_id, end_date, count)
+            SELECT NEW.channel_id, NEW.subscription_end_date, 1
+            WHERE NEW.status = 'active' AND NEW.subscription_end_date IS NOT NULL
+            ON CONFLICT (channel_id, end_date) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_counters_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE channel_id = OLD.channel_id AND status = OLD.status;
+            UPDATE expiry_counters SET count = count - 1
+            WHERE OLD.status = 'active' AND channel_id = OLD.channel_id AND end_date = OLD.subscription_end_date;
+            DELETE FROM expiry_counters WHERE channel_id = OLD.channel_id AND end_date = OLD.subscription_end_date AND count <= 0;
+        END
+        """,
+        # Срабатывает только при изменении полей, от которых зависят счетчики
+        """
+        CREATE TRIGGER IF NOT EXISTS users_counters_update AFTER UPDATE OF channel_id, status, subscription_end_date ON users
+        WHEN OLD.channel_id IS NOT NEW.channel_id
+            OR OLD.status IS NOT NEW.status
+            OR OLD.subscription_end_date IS NOT NEW.subscription_end_date
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE channel_id = OLD.channel_id AND status = OLD.status;
+            INSERT INTO status_counters (channel_id, status, count) VALUES (NEW.channel_id, NEW.status, 1)
+            ON CONFLICT (channel_id, status) DO UPDATE SET count = count + 1;
+            UPDATE expiry_counters SET count = count - 1
+            WHERE OLD.status = 'active' AND channel_id = OLD.channel_id AND end_date = OLD.subscription_end_date;
+            DELETE FROM expiry_counters WHERE channel_id = OLD.channel_id AND end_date = OLD.subscription_end_date AND count <= 0;
+            INSERT INTO expiry_counters (channel_id, end_date, count)
+            SELECT NEW.channel_id, NEW.subscription_end_date, 1
+            WHERE NEW.status = 'active' AND NEW.subscription_end_date IS NOT NULL
+            ON CONFLICT (channel_id, end_date) DO UPDATE SET count = count + 1;
+        END
+        """,
+    )),
+    (8, "полнотекстовый индекс по имени и username", (
+        # Внешнее содержимое: индекс хранит только токены, строки читаются из users по rowid = users.id.
+        # unicode61 не считает ё вариантом е, поэтому имя индексируется с заменой ё на е.
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            full_name, username,
+            content = 'users', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4'
+        )
+        """,
+        "INSERT INTO users_fts (users_fts) VALUES ('delete-all')",
+        """
+        INSERT INTO users_fts (rowid, full_name, username)
+        SELECT id, replace(replace(full_name, 'ё', 'е'), 'Ё', 'Е'), username FROM users
+        """,
+        # Совпадение в username весит больше, чем в имени
+        "INSERT INTO users_fts (users_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0)')",
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO users_fts (rowid, full_name, username)
+            VALUES (NEW.id, replace(replace(NEW.full_name, 'ё', 'е'), 'Ё', 'Е'), NEW.username);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, username)
+            VALUES ('delete', OLD.id, replace(replace(OLD.full_name, 'ё', 'е'), 'Ё', 'Е'), OLD.username);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF full_name, username ON users
+        WHEN OLD.full_name IS NOT NEW.full_name OR OLD.username IS NOT NEW.username
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, username)
+            VALUES ('delete', OLD.id, replace(replace(OLD.full_name, 'ё', 'е'), 'Ё', 'Е'), OLD.username);
+            INSERT INTO users_fts (rowid, full_name, username)
+            VALUES (NEW.id, replace(replace(NEW.full_name, 'ё', 'е'), 'Ё', 'Е'), NEW.username);
+        END
+        """,
+    )),
+    (9, "индекс для списка всех пользователей", (
+        # /all без фильтра по статусу идет в порядке (subscription_end_date, id): без индекса каждая страница
+        # сортирует всю таблицу во временном B-дереве
+        "CREATE INDEX IF NOT EXISTS idx_users_end_date_id ON users (subscription_end_date, id)",
+    )),
+    (10, "один владелец username во всех каналах", (
+        # До этой версии username освобождался только при повторе в том же канале. Оставляем его за пользователем,
+        # подавшим заявку последним
+        """
+        SELECT channel_id, user_id, username FROM users
+        WHERE username IS NOT NULL AND user_id <> (
+            SELECT owner.user_id FROM users AS owner
+            WHERE owner.username = users.username
+            ORDER BY owner.last_application_date IS NULL, owner.last_application_date DESC, owner.id DESC
+            LIMIT 1
+        )
+        """,
+        """
+        UPDATE users SET username = NULL
+        WHERE username IS NOT NULL AND user_id <> (
+            SELECT owner.user_id FROM users AS owner
+            WHERE owner.username = users.username
+            ORDER BY owner.last_application_date IS NULL, owner.last_application_date DESC, owner.id DESC
+            LIMIT 1
+        )
+        """,
+    )),
+    (11, "username в нижнем регистре и у одного пользователя", (
+        # Запись сама освобождает username у прежнего владельца (_release_username), триггеры не дают
+        # сохранить строку, если этого не сделали
+        """
+        CREATE TRIGGER IF NOT EXISTS users_username_insert BEFORE INSERT ON users
+        WHEN NEW.username IS NOT NULL
+        BEGIN
+            SELECT RAISE(ABORT, 'username должен быть в нижнем регистре') WHERE NEW.username <> lower(NEW.username);
+            SELECT RAISE(ABORT, 'username занят другим пользователем')
+            WHERE EXISTS (SELECT 1 FROM users WHERE username = NEW.username AND user_id <> NEW.user_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS users_username_update BEFORE UPDATE OF username, user_id ON users
+        WHEN NEW.username IS NOT NULL
+        BEGIN
+            SELECT RAISE(ABORT, 'username должен быть в нижнем регистре') WHERE NEW.username <> lower(NEW.username);
+            SELECT RAISE(ABORT, 'username занят другим пользователем')
+            WHERE EXISTS (SELECT 1 FROM users WHERE username = NEW.username AND user_id <> NEW.user_id);
+        END
+        """,
+    )),
+]
+
+
+async def get_schema_version(pool: ConnectionPool) -> int:
+    async with pool.reader() as db:
+        cursor = await db.execute("PRAGMA user_version")
+        return (await cursor.fetchone())[0]
+
+
+async def apply_migrations(pool: ConnectionPool, params: dict | None = None) -> int:
+    """
+    Применяет недостающие миграции. params - именованные параметры, доступные SQL-выражениям миграций.
+    """
+    params = params or {}
+    current = await get_schema_version(pool)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        async with pool.transaction() as db:
+            for statement in statements:
+                cursor = await db.execute(statement, {k: v for k, v in params.items() if f":{k}" in statement})
+                rows = await cursor.fetchall()
+                if rows:
+                    logger.warning(f"Миграция {version} изменяет строки ({len(rows)}): {[tuple(row) for row in rows]}")
+            await db.execute(f"PRAGMA user_version = {version}")
+        logger.info(f"Применена миграция {version}: {description}.")
+        current = version
+    logger.info(f"Версия схемы БД: {current}.")
+    return current
@@ -0,0 +1,105 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from loguru import logger
+
+# Настройки, применяемые к каждому соединению. journal_mode=WAL позволяет читателям
+# работать параллельно с писателем, synchronous=NORMAL в режиме WAL избавляет от fsync на каждый commit.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+class ConnectionPool:
+    """
+    Долгоживущие соединения с SQLite: одно соединение-писатель и небольшой пул читателей.
+    """
+
+    def __init__(self, db_name: str, readers: int = 4, cached_statements: int = 256):
+        self.db_name = db_name
+        self.readers_count = max(1, readers)
+        self.cached_statements = cached_statements
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all_readers: list[aiosqlite.Connection] = []
+        # Число завершенных транзакций, изменивших пользователей: по нему кэши над БД понимают, что данные изменились
+        self.generation = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # isolation_level=None: транзакциями управляем явно через BEGIN/COMMIT,
+        # cached_statements - кэш подготовленных выражений sqlite3 на каждом соединении.
+        conn = await aiosqlite.connect(
+            self.db_name,
+            isolation_level=None,
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = aiosqlite.Row
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def open(self):
+        if self.is_open:
+            return
+        # Писатель открывается первым, чтобы база и WAL-журнал были созданы до подключения читателей
+        self._writer = await self._connect()
+        for _ in range(self.readers_count):
+            conn = await self._connect()
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+        logger.info(f"Пул соединений с БД открыт: 1 писатель, {self.readers_count} читателей.")
+
+    async def close(self):
+        if not self.is_open:
+            return
+        async with self._write_lock:
+            for conn in self._all_readers:
+                await conn.close()
+            self._all_readers.clear()
+            self._readers = asyncio.Queue()
+            try:
+                await self._writer.execute("PRAGMA optimize")
+            except aiosqlite.Error as e:
+                logger.warning(f"Не удалось выполнить PRAGMA optimize при закрытии БД: {e}")
+            await self._writer.close()
+            self._writer = None
+        logger.info("Пул соединений с БД закрыт.")
+
+    @asynccontextmanager
+    async def reader(self):
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def transaction(self, bump: bool = False):
+        """
+        Эксклюзивный доступ к писателю в рамках одной транзакции: COMMIT при успехе, ROLLBACK при ошибке.
+        bump=True - транзакция пишет в users, после COMMIT растет поколение данных. Журнал проверки и история
+        подписок поколение не меняют, иначе каждая их запись сбрасывала бы кэш страниц списков.
+        """
+        async with self._write_lock:
+            conn = self._writer
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            else:
+                await conn.commit()
+                if bump:
+                    self.generation += 1
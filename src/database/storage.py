@@ -0,0 +1,122 @@
+from typing import AsyncIterator, Callable, Protocol
+
+from src.config import STORAGE_BACKEND
+
+
+class Storage(Protocol):
+    """
+    Операции хранилища пользователей, которые используют обработчики и фоновые задачи.
+    Экземпляр создается в main.py и передается обработчикам через контекст диспетчера (параметр db).
+    """
+
+    async def open(self): ...
+
+    async def close(self): ...
+
+    @property
+    def generation(self) -> int: ...
+
+    def add_change_listener(self, listener: Callable[[list[dict]], None]): ...
+
+    def get_cached_user(self, user_id: int, channel_id: int) -> dict | None: ...
+
+    def get_cache_stats(self) -> dict: ...
+
+    # --- Пользователи ---
+
+    async def upsert_user(self, channel_id: int, user_id: int, full_name: str, username: str | None) -> dict: ...
+
+    async def bulk_upsert_users(self, applicants: list[tuple[int, int, str, str | None]]) -> list[dict]: ...
+
+    async def import_users(self, rows: list[tuple]) -> int: ...
+
+    def iter_users(self, batch_size: int = 1000) -> AsyncIterator[list[dict]]: ...
+
+    async def get_user(self, user_id: int, channel_id: int) -> dict | None: ...
+
+    async def get_user_channels(self, user_id: int) -> list[dict]: ...
+
+    async def get_users_by_ids(self, user_ids: list[int], channel_id: int) -> list[dict]: ...
+
+    async def find_users(self, user_ids: list[int], usernames: list[str]) -> list[dict]: ...
+
+    async def find_user_by_id_or_username(self, identifier: str, channel_id: int | None = None) -> dict | None: ...
+
+    async def search_users(self, text: str, limit: int = 20, offset: int = 0, channel_id: int | None = None) -> tuple[list[dict], bool, bool]: ...
+
+    async def update_user_status(self, user_id: int, status: str, channel_id: int | None = None) -> list[dict]: ...
+
+    async def update_subscription(self, user_id: int, end_date: str, channel_id: int): ...
+
+    async def bulk_update_status(self, user_ids: list[int], status: str, from_status: str | None = None, channel_id: int | None = None) -> list[int]: ...
+
+    async def bulk_update_subscription(self, user_ids: list[int], end_date: str, channel_id: int) -> list[int]: ...
+
+    async def bulk_update_subscriptions(self, keys: list[tuple[int, int]], end_date: str) -> list[tuple[int, int]]: ...
+
+    # --- Выборки и счетчики ---
+
+    async def get_all_users(self) -> list[dict]: ...
+
+    async def get_users_by_status(self, status: str, channel_id: int | None = None) -> list[dict]: ...
+
+    async def get_users_expiring_soon(self, status: str = 'active', days: int = 10, channel_id: int | None = None) -> list[dict]: ...
+
+    async def get_users_page(
+        self,
+        status: str | None = None,
+        expiring_days: int | None = None,
+        channel_id: int | None = None,
+        keyset: tuple[str | None, int] | None = None,
+        forward: bool = True,
+        limit: int = 20,
+    ) -> tuple[list[dict], int]: ...
+
+    async def get_expired_users(self, today: str, channel_id: int, status: str = 'active') -> list[dict]: ...
+
+    async def get_users_with_invalid_end_date(self, status: str = 'active', channel_id: int | None = None) -> list[dict]: ...
+
+    async def count_users_by_status(self, status: str, channel_id: int | None = None) -> int: ...
+
+    async def count_distinct_users(self) -> int: ...
+
+    async def get_status_counts(self, channel_id: int | None = None) -> dict[str, int]: ...
+
+    async def get_expiry_counts(self, date_from: str, date_to: str, channel_id: int | None = None) -> dict[str, int]: ...
+
+    # --- Журнал проверок подписок ---
+
+    async def create_sweep_run(self, users: list[dict]) -> int: ...
+
+    async def get_unfinished_sweep_run(self) -> int | None: ...
+
+    async def get_sweep_journal(self, run_id: int) -> list[dict]: ...
+
+    async def mark_sweep_steps(self, run_id: int, keys: list[tuple[int, int]], step: str): ...
+
+    async def complete_sweep_users(self, run_id: int, channel_id: int, user_ids: list[int]) -> list[int]: ...
+
+    async def finish_sweep_run(self, run_id: int): ...
+
+    # --- История подписок ---
+
+    async def append_subscription_events(self, events: list[tuple]) -> int: ...
+
+    async def get_subscription_rollup(self, day: str, kind: str, days: int, channel_id: int) -> int: ...
+
+    async def get_daily_rollups(self, day: str, channel_id: int | None = None) -> list[dict]: ...
+
+    async def get_subscription_history(self, user_id: int, channel_id: int | None = None, limit: int = 50) -> list[dict]: ...
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """
+    Хранилище по имени: sqlite - файл DB_NAME, memory - данные только в памяти процесса (тесты, бенчмарки).
+    """
+    if backend == "sqlite":
+        from src.database.database import SQLiteStorage
+        return SQLiteStorage()
+    if backend == "memory":
+        from src.database.memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Неизвестное хранилище: {backend}")
@@ -1,21 +1,40 @@
 from aiogram import Router, F, Bot
-from aiogram.filters import Command, BaseFilter
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, CommandObject, BaseFilter
+from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from loguru import logger
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import asyncio
+import html
+import io
 import os
 import glob
+import tempfile
+import time
 
-from src.config import ADMIN_ID, CHANNEL_ID
-from src.database import database as db
-from src.utils.user_utils import get_user_mention
+from src.config import ADMIN_ID, CHANNEL_IDS, LOG_DIR
+from src.database.database import SEARCH_CANDIDATES, search_tokens
+from src.database.storage import Storage
+from src.utils.user_utils import get_user_mention, get_channel_note
 from src.keyboards.inline import get_subscription_keyboard
 from src.utils.filter import setup_admin_router
 from src.utils.scheduler import check_subscriptions_with_stats
+from src.utils.notifier import notifier, split_messages
+from src.utils.metrics import setup_router_metrics, format_perf_lines
+from src.utils.ledger import ledger
+from src.utils.page_cache import list_page_cache
+from src.utils.membership import membership
+from src.utils.log_search import parse_filters, search_logs
+from src.utils.pipeline import run_bot_actions
+from src.utils.bulk import (
+    BULK_MAX_IDENTIFIERS, BulkReport, Identifiers, describe_user, group_found_users,
+    kick_from_channel, latest_application, parse_identifiers, read_identifiers_file,
+)
+from src.utils.transfer import EXPORT_FORMATS, detect_format, export_filename, export_users, import_users_file
 
 admin_router = Router()
 admin_router = setup_admin_router(admin_router)
+admin_router = setup_router_metrics(admin_router, "admin")
 
 @admin_router.message(Command("start"))
 async def start_command(message: Message):
@@ -52,33 +71,47 @@ async def help_command(message: Message):
         "👥 <b>Управление пользователями:</b>\n"
         "- <code>/ban @username</code> - заблокировать пользователя\n"
         "- <code>/unban @username</code> - разблокировать пользователя\n"
-        "- <code>/extend @username</code> - продлить подписку\n\n"
+        "- <code>/extend @username [ID канала]</code> - продлить подписку\n"
+        "- <code>/find текст</code> - найти пользователей по началу имени или username\n"
+        "- <code>/ban_many</code>, <code>/unban_many</code> ID @username ... - массовая блокировка и разблокировка\n"
+        "- <code>/extend_many дни [ID канала] ID @username ...</code> - массовое продление с одобрением заявок\n"
+        "  (список можно приложить файлом: .txt или .csv, например из /export)\n\n"
         "📊 <b>Просмотр списков:</b>\n"
         "- <code>/active</code> - активные пользователи\n"
         "- <code>/expiring</code> - истекающие подписки (10 дней)\n"
         "- <code>/all</code> - все пользователи\n\n"
         "🔍 <b>Проверка подписок:</b>\n"
-        "- <code>/check_subs</code> - проверить и очистить истекшие\n\n"
+        "- <code>/check_subs</code> - проверить и очистить истекшие\n"
+        "- <code>/stats [ID канала]</code> - статистика и прогноз истечений на 90 дней\n\n"
         "📋 <b>Системные команды:</b>\n"
-        "- <code>/log</code> - получить файлы логов\n\n"
+        "- <code>/log</code> - получить файлы логов\n"
+        "- <code>/log since=2h level=ERROR user=ID</code> - найти записи в логах\n"
+        "- <code>/perf</code> - задержки обработчиков, БД и Bot API\n"
+        "- <code>/export [csv|jsonl]</code> - выгрузить базу пользователей\n"
+        "- <code>/import</code> - загрузить пользователей из файла (подпись к файлу или ответ на него)\n\n"
         "💡 <b>Примеры:</b>\n"
         "<code>/ban @john_doe</code>\n"
         "<code>/extend 123456789</code>\n"
-        "<code>/unban @jane_smith</code>"
+        "<code>/unban @jane_smith</code>\n"
+        "<code>/extend_many 30 123456789 @john_doe</code>"
     )
     
     await message.answer(help_text, parse_mode='HTML')
 
-# Функция бана
-async def process_ban(user_id: int, bot: Bot):
+# Функция бана: блокировка действует во всех каналах бота
+async def process_ban(db: Storage, user_id: int, bot: Bot):
     logger.info(f"Начало процесса блокировки пользователя {user_id}.")
-    await db.update_user_status(user_id, 'banned')
-    try:
-        await bot.ban_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        await bot.unban_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        logger.info(f"Пользователь {user_id} был удален из канала.")
-    except Exception as e:
-        logger.warning(f"Не удалось удалить пользователя {user_id} из чата (возможно, его там нет): {e}")
+    for row in await db.update_user_status(user_id, 'banned'):
+        ledger.record('ban', row['channel_id'], user_id)
+    for channel_id in CHANNEL_IDS:
+        try:
+            # Через общий ограничитель частоты запросов к Bot API
+            await kick_from_channel(bot, channel_id, user_id)
+            logger.info(f"Пользователь {user_id} был удален из канала {channel_id}.")
+            notifier.add(f"🚫 Пользователь ID: {user_id} заблокирован и удален из канала{get_channel_note(channel_id, html=False)}.")
+        except Exception as e:
+            logger.warning(f"Не удалось удалить пользователя {user_id} из чата {channel_id} (возможно, его там нет): {e}")
+            notifier.add(f"🚫 Пользователь ID: {user_id} заблокирован (в канале{get_channel_note(channel_id, html=False)} не найден).")
     try:
         # await bot.decline_chat_join_request(chat_id=CHANNEL_ID, user_id=user_id, hide_request=True)
         logger.info(f"Заявка на вступление от {user_id} отклонена.")
@@ -86,7 +119,7 @@ async def process_ban(user_id: int, bot: Bot):
         logger.warning(f"Не удалось отклонить заявку от {user_id} (возможно, ее нет): {e}")
 
 @admin_router.message(Command("ban"))
-async def ban_user_command(message: Message, bot: Bot):
+async def ban_user_command(message: Message, bot: Bot, db: Storage):
     args = message.text.split()
     if len(args) < 2:
         await message.answer("⚠️ Укажите ID или @username пользователя.\nПример: `/ban 123456` или `/ban @nickname`")
@@ -100,12 +133,12 @@ async def ban_user_command(message: Message, bot: Bot):
         return
     
     user_id = user_data['user_id']
-    await process_ban(user_id, bot)
+    await process_ban(db, user_id, bot)
     user_mention = get_user_mention(user_data)
     await message.answer(f"🚫 Пользователь <b>{user_mention}</b> заблокирован.", parse_mode='HTML')
 
 @admin_router.message(Command("unban"))
-async def unban_user_command(message: Message):
+async def unban_user_command(message: Message, db: Storage):
     args = message.text.split()
     if len(args) < 2:
         await message.answer("⚠️ Укажите ID или @username пользователя.\nПример: `/unban 123456` или `/unban @nickname`")
@@ -118,46 +151,239 @@ async def unban_user_command(message: Message):
         await message.answer("❌ Пользователь с таким ID или никнеймом не найден в базе данных.")
         return
     
-    if user_data['status'] != 'banned':
+    user_id = user_data['user_id']
+    # Снимаем блокировку во всех каналах, где она была
+    banned_channels = [row['channel_id'] for row in await db.get_user_channels(user_id) if row['status'] == 'banned']
+    unbanned_ids = await db.bulk_update_status([user_id], 'rejected', from_status='banned')
+    if not unbanned_ids:
         await message.answer("ℹ️ Этот пользователь не заблокирован.")
         return
+    for channel_id in banned_channels:
+        ledger.record('unban', channel_id, user_id)
 
-    user_id = user_data['user_id']
-    await db.update_user_status(user_id, 'rejected')
     user_mention = get_user_mention(user_data)
     await message.answer(f"✅ Пользователь <b>{user_mention}</b> разблокирован. Теперь он может снова подать заявку.", parse_mode='HTML')
     logger.info(f"Пользователь {user_id} разблокирован.")
 
 
 @admin_router.message(Command("extend"))
-async def extend_subscription_command(message: Message):
+async def extend_subscription_command(message: Message, db: Storage):
     args = message.text.split()
     if len(args) < 2:
         await message.answer("⚠️ Укажите ID или @username пользователя.\nПример: `/extend 123456` или `/extend @nickname`")
         return
 
     identifier = args[1]
-    user_data = await db.find_user_by_id_or_username(identifier)
+    channel_id = None
+    if len(args) > 2:
+        try:
+            channel_id = int(args[2])
+        except ValueError:
+            channel_id = None
+        if channel_id not in CHANNEL_IDS:
+            await message.answer("⚠️ Бот не обслуживает канал с таким ID.")
+            return
+
+    # Без ID канала продлевается подписка в канале, куда пользователь подавал заявку последним
+    user_data = await db.find_user_by_id_or_username(identifier, channel_id)
 
     if not user_data:
         await message.answer("❌ Пользователь с таким ID или никнеймом не найден в базе данных.")
         return
 
     user_id = user_data['user_id']
+    channel_id = user_data['channel_id']
     user_mention = get_user_mention(user_data)
-    keyboard = get_subscription_keyboard(user_id)
+    keyboard = get_subscription_keyboard(user_id, channel_id)
     
-    text = f"Выберите новый срок подписки для пользователя <b>{user_mention}</b>.\n<i>Текущая подписка будет полностью сброшена.</i>"
+    text = f"Выберите новый срок подписки для пользователя <b>{user_mention}</b>{get_channel_note(channel_id)}.\n<i>Текущая подписка будет полностью сброшена.</i>"
     
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
 
+# Массовые команды: список ID и @username в тексте команды, в файле с этой подписью или в файле, на который дан ответ
+MAX_EXTEND_DAYS = 3650
+
+
+async def read_bulk_identifiers(message: Message, bot: Bot, args: list[str], usage: str) -> Identifiers | None:
+    identifiers = parse_identifiers(" ".join(args))
+    document = message.document or (message.reply_to_message.document if message.reply_to_message else None)
+    if document is not None:
+        if document.file_size and document.file_size > MAX_DOWNLOAD_SIZE:
+            await message.answer("⚠️ Файл больше 20 МБ: Bot API не позволяет боту его скачать.")
+            return None
+        try:
+            buffer = await bot.download(document, destination=io.BytesIO())
+            identifiers = identifiers.merge(read_identifiers_file(buffer.getvalue()))
+        except (UnicodeDecodeError, OSError, EOFError) as e:
+            logger.warning(f"Не удалось прочитать файл со списком пользователей: {e}")
+            await message.answer("⚠️ Не удалось прочитать файл: нужен текстовый список или CSV в UTF-8 (можно .gz).")
+            return None
+    if not identifiers:
+        await message.answer(usage, parse_mode='HTML')
+        return None
+    if len(identifiers) > BULK_MAX_IDENTIFIERS:
+        await message.answer(f"⚠️ Слишком много пользователей: {len(identifiers)}, за раз можно не больше {BULK_MAX_IDENTIFIERS}.")
+        return None
+    return identifiers
+
+
+async def send_bulk_report(message: Message, report: BulkReport):
+    text, details = report.render()
+    await message.answer(text, parse_mode=None)
+    if details:
+        document = BufferedInputFile(details.encode("utf-8"), filename="bulk_report.txt")
+        await message.answer_document(document, caption="Подробности")
+
+
+async def _find_bulk_users(db: Storage, identifiers: Identifiers, report: BulkReport) -> tuple[dict[int, list[dict]], list[dict]]:
+    # Все идентификаторы разрешаются одним запросом (на каждые BULK_CHUNK_SIZE значений)
+    rows = await db.find_users(identifiers.user_ids, identifiers.usernames)
+    users, not_found = group_found_users(identifiers, rows)
+    report.extend("Не найдены в базе", not_found)
+    report.extend("Не распознаны", identifiers.invalid)
+    return users, rows
+
+
+@admin_router.message(Command("ban_many"))
+async def ban_many_command(message: Message, bot: Bot, db: Storage, command: CommandObject):
+    usage = "⚠️ Укажите ID или @username через пробел или приложите файл со списком.\nПример: <code>/ban_many 123456 @nickname</code>"
+    identifiers = await read_bulk_identifiers(message, bot, (command.args or "").split(), usage)
+    if identifiers is None:
+        return
+
+    report = BulkReport("🚫 Массовая блокировка", requested=len(identifiers))
+    users, rows = await _find_bulk_users(db, identifiers, report)
+    if users:
+        status_message = await message.answer(f"⏳ Блокирую {len(users)} пользователей...")
+        banned_ids = set(await db.bulk_update_status(list(users), 'banned'))
+        for row in rows:
+            if row['user_id'] in banned_ids and row['status'] != 'banned':
+                ledger.record('ban', row['channel_id'], row['user_id'])
+        report.extend("Заблокированы", [describe_user(users[user_id][0]) for user_id in users if user_id in banned_ids])
+        report.extend("Уже были заблокированы", [describe_user(users[user_id][0]) for user_id in users if user_id not in banned_ids])
+
+        # Удаляем из всех каналов бота, как и /ban: пользователь мог вступить без заявки
+        result = await run_bot_actions(
+            [(channel_id, user_id) for user_id in users for channel_id in CHANNEL_IDS],
+            lambda key: kick_from_channel(bot, *key),
+            label=lambda key: f"{key[1]} (канал {key[0]})",
+        )
+        report.extend(
+            "Не удалось удалить из канала (возможно, их там нет)",
+            [describe_user({**users[user_id][0], 'channel_id': channel_id}, with_channel=True) for channel_id, user_id in result.failed],
+        )
+        await status_message.delete()
+    await send_bulk_report(message, report)
+    logger.info(f"Администратор {message.from_user.id} выполнил массовую блокировку: найдено {len(users)} из {len(identifiers)}.")
+
+
+@admin_router.message(Command("unban_many"))
+async def unban_many_command(message: Message, bot: Bot, db: Storage, command: CommandObject):
+    usage = "⚠️ Укажите ID или @username через пробел или приложите файл со списком.\nПример: <code>/unban_many 123456 @nickname</code>"
+    identifiers = await read_bulk_identifiers(message, bot, (command.args or "").split(), usage)
+    if identifiers is None:
+        return
+
+    report = BulkReport("✅ Массовая разблокировка", requested=len(identifiers))
+    users, rows = await _find_bulk_users(db, identifiers, report)
+    unbanned_ids = set(await db.bulk_update_status(list(users), 'rejected', from_status='banned'))
+    for row in rows:
+        if row['user_id'] in unbanned_ids and row['status'] == 'banned':
+            ledger.record('unban', row['channel_id'], row['user_id'])
+    report.extend("Разблокированы", [describe_user(users[user_id][0]) for user_id in users if user_id in unbanned_ids])
+    report.extend("Не были заблокированы", [describe_user(users[user_id][0]) for user_id in users if user_id not in unbanned_ids])
+    await send_bulk_report(message, report)
+    logger.info(f"Администратор {message.from_user.id} выполнил массовую разблокировку: {len(unbanned_ids)} из {len(identifiers)}.")
+
+
+@admin_router.message(Command("extend_many"))
+async def extend_many_command(message: Message, bot: Bot, db: Storage, command: CommandObject):
+    usage = (
+        "⚠️ Укажите срок в днях и ID или @username через пробел или приложите файл со списком.\n"
+        "Пример: <code>/extend_many 30 123456 @nickname</code>\n"
+        "С ID канала: <code>/extend_many 30 -1001234567890 123456</code>"
+    )
+    args = (command.args or "").split()
+    if not args or not args[0].isdigit() or not 1 <= int(args[0]) <= MAX_EXTEND_DAYS:
+        await message.answer(usage, parse_mode='HTML')
+        return
+    days = int(args.pop(0))
+    channel_id = None
+    # ID каналов отрицательные, поэтому не путаются с ID пользователей
+    if args and args[0].startswith('-'):
+        try:
+            channel_id = int(args.pop(0))
+        except ValueError:
+            channel_id = None
+        if channel_id not in CHANNEL_IDS:
+            await message.answer("⚠️ Бот не обслуживает канал с таким ID.")
+            return
+    identifiers = await read_bulk_identifiers(message, bot, args, usage)
+    if identifiers is None:
+        return
+
+    report = BulkReport(f"📅 Массовое продление подписки на {days} дней", requested=len(identifiers))
+    users, _ = await _find_bulk_users(db, identifiers, report)
+    targets = []
+    for user_id, user_rows in users.items():
+        if channel_id is not None:
+            user_rows = [row for row in user_rows if row['channel_id'] == channel_id]
+            if not user_rows:
+                report.add("Нет заявки в этом канале", describe_user(users[user_id][0]))
+                continue
+        # Без ID канала продлевается подписка в канале, куда пользователь подавал заявку последним
+        row = latest_application(user_rows)
+        if row['status'] == 'banned':
+            report.add("Пропущены: заблокированы", describe_user(row, with_channel=True))
+            continue
+        targets.append(row)
+
+    if targets:
+        status_message = await message.answer(f"⏳ Продлеваю подписку для {len(targets)} пользователей...")
+        approved = set()
+
+        async def approve(row: dict):
+            if await membership.approve_if_not_member(bot, row['channel_id'], row['user_id']):
+                approved.add((row['channel_id'], row['user_id']))
+
+        # Сначала одобряем заявки в каналах, подписку в БД обновляем только тем, для кого это удалось.
+        # Участие в канале берется из кэша, getChatMember вызывается только при промахе
+        result = await run_bot_actions(
+            targets,
+            approve,
+            label=lambda row: f"{row['user_id']} (канал {row['channel_id']})",
+        )
+        end_date = datetime.now() + timedelta(days=days)
+        end_date_str = end_date.strftime('%Y-%m-%d')
+        updated = set(await db.bulk_update_subscriptions(
+            [(row['channel_id'], row['user_id']) for row in result.succeeded], end_date_str
+        ))
+        for row in result.succeeded:
+            if (row['channel_id'], row['user_id']) in updated:
+                ledger.record('extend' if row['status'] == 'active' else 'grant', row['channel_id'], row['user_id'], days, end_date_str)
+
+        report.title += f" (до {end_date.strftime('%d.%m.%Y')})"
+        report.extend(
+            "Подписка продлена",
+            [describe_user(row, with_channel=True) for row in result.succeeded if (row['channel_id'], row['user_id']) in updated],
+        )
+        report.extend(
+            "Из них одобрены заявки",
+            [describe_user(row, with_channel=True) for row in result.succeeded if (row['channel_id'], row['user_id']) in approved],
+        )
+        report.extend("Не удалось одобрить заявку", [describe_user(row, with_channel=True) for row in result.failed])
+        await status_message.delete()
+    await send_bulk_report(message, report)
+    logger.info(f"Администратор {message.from_user.id} продлил подписку на {days} дней: {len(targets)} из {len(identifiers)}.")
+
+
 @admin_router.message(Command("check_subs"))
-async def check_subscriptions_command(message: Message, bot: Bot):
+async def check_subscriptions_command(message: Message, bot: Bot, db: Storage):
     await message.answer("🔄 Запускаю проверку подписок...")
     
     try:
-        stats = await check_subscriptions_with_stats(bot)
+        stats = await check_subscriptions_with_stats(bot, db)
     except Exception as e:
         logger.error(f"Ошибка при ручной проверке подписок: {e}")
         await message.answer(
@@ -167,19 +393,172 @@ async def check_subscriptions_command(message: Message, bot: Bot):
         )
 
 
+# Статистика подписок: счетчики в БД ведутся триггерами, поэтому /stats не сканирует таблицу users,
+# кроме подсчета разных пользователей во всех каналах - он идет по индексу user_id
+STATS_FORECAST_DAYS = 90
+STATUS_LABELS = {
+    'active': '✅ Активные',
+    'pending': '⏳ Ожидают решения',
+    'expired': '⌛ Истекшие',
+    'rejected': '❌ Отклоненные',
+    'banned': '🚫 Заблокированные',
+}
+
+
+async def format_stats(db: Storage, channel_id: int | None = None) -> str:
+    today = datetime.now().date()
+    counts = await db.get_status_counts(channel_id)
+    horizon = today + timedelta(days=STATS_FORECAST_DAYS - 1)
+    expiring = await db.get_expiry_counts(today.isoformat(), horizon.isoformat(), channel_id)
+    overdue = sum((await db.get_expiry_counts('0000-01-01', (today - timedelta(days=1)).isoformat(), channel_id)).values())
+
+    text = f"📊 <b>Статистика подписок</b>{get_channel_note(channel_id) if channel_id is not None else ''}\n\n"
+    if channel_id is None and len(CHANNEL_IDS) > 1:
+        # Счетчики ведутся по каналам: пользователь из нескольких каналов в них учтен несколько раз
+        text += f"Всего пользователей: <b>{await db.count_distinct_users()}</b>\n"
+        for channel in CHANNEL_IDS:
+            text += f"В канале <code>{channel}</code>: {sum((await db.get_status_counts(channel)).values())}\n"
+        text += "\n"
+    else:
+        text += f"Всего пользователей: <b>{sum(counts.values())}</b>\n"
+    for status, label in STATUS_LABELS.items():
+        text += f"{label}: {counts.get(status, 0)}\n"
+    for status in sorted(set(counts) - set(STATUS_LABELS)):
+        text += f"{status}: {counts[status]}\n"
+    if overdue:
+        text += f"\n⚠️ Истекли, но еще не удалены: {overdue}\n"
+
+    text += f"\n📅 <b>Истекут в ближайшие {STATS_FORECAST_DAYS} дней</b> (по неделям):\n"
+    week_start = today
+    while week_start <= horizon:
+        week_end = min(week_start + timedelta(days=6), horizon)
+        week_count = sum(
+            expiring.get((week_start + timedelta(days=offset)).isoformat(), 0)
+            for offset in range((week_end - week_start).days + 1)
+        )
+        text += f"{week_start.strftime('%d.%m')}–{week_end.strftime('%d.%m')}: {week_count}\n"
+        week_start = week_end + timedelta(days=1)
+    text += f"Итого: {sum(expiring.values())}"
+    return text
+
+
+@admin_router.message(Command("stats"))
+async def stats_command(message: Message, db: Storage):
+    args = message.text.split()
+    channel_id = None
+    if len(args) > 1:
+        try:
+            channel_id = int(args[1])
+        except ValueError:
+            channel_id = None
+        if channel_id not in CHANNEL_IDS:
+            await message.answer("⚠️ Бот не обслуживает канал с таким ID.")
+            return
+    try:
+        await message.answer(await format_stats(db, channel_id), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики: {e}")
+        await message.answer(f"❌ Не удалось получить статистику: {str(e)}")
+
+
 # Просмотр списка пользователей
 USERS_PER_PAGE = 20
 
-async def format_users_page(users: list[dict], page: int, list_type: str) -> tuple[str, object]:    
+LIST_FILTERS = {
+    'active': {'status': 'active'},
+    'expiring': {'status': 'active', 'expiring_days': 10},
+    'all': {},
+}
+
+
+def _page_key(user: dict) -> str:
+    # Ключ строки для callback_data: "<дата>_<id строки>", пустая дата - пустая строка
+    return f"{user.get('subscription_end_date') or ''}_{user['id']}"
+
+
+def _parse_page_key(date_str: str, row_id_str: str) -> tuple[str | None, int]:
+    return (date_str or None), int(row_id_str)
+
+
+def _row_keyset(user: dict) -> tuple[str | None, int]:
+    # Курсор в том виде, в каком он вернется из callback_data кнопки
+    return _parse_page_key(*_page_key(user).rsplit('_', 1))
+
+
+async def fetch_users_page(db: Storage, list_type: str, keyset: tuple[str | None, int] | None = None, forward: bool = True) -> tuple[list[dict], int]:
+    filters = LIST_FILTERS.get(list_type, LIST_FILTERS['all'])
+    return await db.get_users_page(keyset=keyset, forward=forward, limit=USERS_PER_PAGE, **filters)
+
+
+def _list_version(db: Storage) -> tuple[int, str]:
+    # Список /expiring зависит еще и от текущей даты: date('now') в SQLite считается по UTC
+    return db.generation, datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+async def render_users_page(
+    db: Storage,
+    list_type: str,
+    page: int = 1,
+    keyset: tuple[str | None, int] | None = None,
+    forward: bool = True,
+) -> tuple[tuple, tuple]:
+    """
+    Страница списка из кэша, а при промахе - из БД. Возвращает версию данных и (страница, текст, клавиатура),
+    где страница - (тип, номер, направление, курсор) фактически показанной страницы.
+    """
+    # Версия берется до запроса: запись, завершившаяся во время запроса, сменит версию и кэш не устареет
+    version = _list_version(db)
+    key = (list_type, page, forward, keyset)
+    rendered = list_page_cache.get(version, key)
+    if rendered is not None:
+        return version, rendered
+
+    users, total = await fetch_users_page(db, list_type, keyset, forward)
+    if keyset is not None and (not users or (not forward and len(users) < USERS_PER_PAGE)):
+        # Список изменился и до этой страницы больше не дойти - показываем его с начала
+        users, total = await fetch_users_page(db, list_type)
+        page, forward, keyset = 1, True, None
+    text, keyboard = await format_users_page(users, page, total, list_type)
+    rendered = ((list_type, page, forward, keyset), text, keyboard)
+    list_page_cache.put(version, key, rendered)
+    if users:
+        _link_neighbour_pages(version, list_type, page, forward, keyset, users, rendered)
+    return version, rendered
+
+
+def _link_neighbour_pages(version, list_type: str, page: int, forward: bool, keyset, users: list[dict], rendered: tuple):
+    # Кнопки "Назад" и "Вперёд" несут курсор текущей страницы, а не той, на которую ведут, поэтому при
+    # обратном проходе ключ запроса не совпадает с ключом, под которым соседняя страница уже отрисована.
+    # В пределах одной версии данных соседство точное: страница перед первой строкой этой страницы -
+    # полная страница, заканчивающаяся на строке курсора, и наоборот.
+    first, last = _row_keyset(users[0]), _row_keyset(users[-1])
+    list_page_cache.put(version, ('first', list_type, page, first), rendered)
+    if len(users) == USERS_PER_PAGE:
+        list_page_cache.put(version, ('last', list_type, page, last), rendered)
+    if keyset is None:
+        return
+    if forward:
+        previous = list_page_cache.peek(version, ('last', list_type, page - 1, keyset))
+        if previous is not None:
+            list_page_cache.put(version, (list_type, page - 1, False, first), previous)
+    else:
+        following = list_page_cache.peek(version, ('first', list_type, page + 1, keyset))
+        if following is not None:
+            list_page_cache.put(version, (list_type, page + 1, True, last), following)
+
+
+async def send_users_list(message: Message, db: Storage, list_type: str):
+    version, (page_id, text, keyboard) = await render_users_page(db, list_type)
+    sent = await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+    list_page_cache.mark_shown(sent.chat.id, sent.message_id, version, page_id)
+
+
+async def format_users_page(users: list[dict], page: int, total: int, list_type: str) -> tuple[str, object]:    
     if not users:
         return "Список пользователей пуст.", None
 
-    total_pages = (len(users) + USERS_PER_PAGE - 1) // USERS_PER_PAGE
+    total_pages = max(1, (total + USERS_PER_PAGE - 1) // USERS_PER_PAGE)
     page = max(1, min(page, total_pages))
-    
-    start_index = (page - 1) * USERS_PER_PAGE
-    end_index = start_index + USERS_PER_PAGE
-    page_users = users[start_index:end_index]
 
     if list_type == 'active':
         type_text = 'активные'
@@ -190,21 +569,22 @@ async def format_users_page(users: list[dict], page: int, list_type: str) -> tup
 
     text = f"<b>Список пользователей ({type_text}) - Страница {page}/{total_pages}</b>\n\n"
     
-    for user in page_users:
+    for user in users:
         user_mention = get_user_mention(user)
         user_id = user['user_id']
         status = user['status']
+        channel_note = get_channel_note(user['channel_id'])
         
         if list_type == 'active':
             end_date_str = user.get('subscription_end_date')
             if end_date_str:
                 try:
                     end_date = datetime.strptime(end_date_str, '%Y-%m-%d').strftime('%d.%m.%Y')
-                    text += f"ID: <code>{user_id}</code> - {user_mention} - до {end_date}\n"
+                    text += f"ID: <code>{user_id}</code> - {user_mention} - до {end_date}{channel_note}\n"
                 except ValueError:
-                    text += f"ID: <code>{user_id}</code> - {user_mention} - (неверная дата)\n"
+                    text += f"ID: <code>{user_id}</code> - {user_mention} - (неверная дата){channel_note}\n"
             else:
-                 text += f"ID: <code>{user_id}</code> - {user_mention} - (нет даты)\n"
+                 text += f"ID: <code>{user_id}</code> - {user_mention} - (нет даты){channel_note}\n"
         else:
             end_date_str = user.get('subscription_end_date')
             end_date = "N/A"
@@ -213,53 +593,54 @@ async def format_users_page(users: list[dict], page: int, list_type: str) -> tup
                     end_date = datetime.strptime(end_date_str, '%Y-%m-%d').strftime('%d.%m.%Y')
                 except ValueError:
                     end_date = "неверная дата"
-            text += f"ID: <code>{user_id}</code> - {user_mention} - <b>{status}</b> - до {end_date}\n"
+            text += f"ID: <code>{user_id}</code> - {user_mention} - <b>{status}</b> - до {end_date}{channel_note}\n"
 
     builder = InlineKeyboardBuilder()
     if page > 1:
-        builder.button(text="◀️ Назад", callback_data=f"list_{list_type}_{page - 1}")
+        builder.button(text="◀️ Назад", callback_data=f"list_{list_type}_{page - 1}_p_{_page_key(users[0])}")
     
     builder.button(text=f"Стр. {page}/{total_pages}", callback_data="noop")
 
     if page < total_pages:
-        builder.button(text="Вперёд ▶️", callback_data=f"list_{list_type}_{page + 1}")
+        builder.button(text="Вперёд ▶️", callback_data=f"list_{list_type}_{page + 1}_n_{_page_key(users[-1])}")
     
     return text, builder.as_markup()
 
 @admin_router.message(Command("active"))
-async def list_active_users(message: Message):
-    users = await db.get_users_by_status('active')
-    text, keyboard = await format_users_page(users, 1, 'active')
-    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+async def list_active_users(message: Message, db: Storage):
+    await send_users_list(message, db, 'active')
 
 @admin_router.message(Command("expiring"))
-async def subscription_stats_command(message: Message):
-    users = await db.get_users_expiring_soon('active', days=10)
-    text, keyboard = await format_users_page(users, 1, 'expiring')
-    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+async def subscription_stats_command(message: Message, db: Storage):
+    await send_users_list(message, db, 'expiring')
 
 @admin_router.message(Command("all"))
-async def list_all_users(message: Message):
-    users = await db.get_all_users()
-    text, keyboard = await format_users_page(users, 1, 'all')
-    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+async def list_all_users(message: Message, db: Storage):
+    await send_users_list(message, db, 'all')
 
 @admin_router.callback_query(F.data.startswith("list_"))
-async def paginate_list(call: CallbackQuery):
-    _, list_type, page_str = call.data.split("_")
-    page = int(page_str)
-
-    if list_type == 'active':
-        users = await db.get_users_by_status('active')
-    elif list_type == 'expiring':
-        users = await db.get_users_expiring_soon(10)
+async def paginate_list(call: CallbackQuery, db: Storage):
+    # list_<тип>_<страница>_<n|p>_<дата>_<id строки>
+    parts = call.data.split("_")
+    list_type = parts[1]
+    if len(parts) == 6:
+        page = int(parts[2])
+        forward = parts[3] == 'n'
+        keyset = _parse_page_key(parts[4], parts[5])
     else:
-        users = await db.get_all_users()
+        # Кнопки старого формата (list_<тип>_<страница>) открывают список с начала
+        page, forward, keyset = 1, True, None
+
+    version, (page_id, text, keyboard) = await render_users_page(db, list_type, page, keyset, forward)
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+    if list_page_cache.is_shown(chat_id, message_id, version, page_id):
+        # В сообщении уже эта страница с теми же данными: edit_text завершился бы ошибкой "message is not modified"
+        await call.answer()
+        return
 
-    text, keyboard = await format_users_page(users, page, list_type)
-    
     try:
         await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+        list_page_cache.mark_shown(chat_id, message_id, version, page_id)
     except Exception as e:
         logger.warning(f"Ошибка при обновлении списка (возможно, текст не изменился): {e}")
     finally:
@@ -269,10 +650,210 @@ async def paginate_list(call: CallbackQuery):
 async def noop_callback(call: CallbackQuery):
     await call.answer() 
 
+# Полнотекстовый поиск по имени и username
+FIND_PAGE_SIZE = 10
+FIND_MIN_LENGTH = 2
+# callback_data ограничена 64 байтами: find_<смещение>_<запрос>
+CALLBACK_DATA_LIMIT = 64
+
+
+def _find_callback(offset: int, query: str) -> str:
+    prefix = f"find_{offset}_"
+    data = (prefix + query).encode("utf-8")[:CALLBACK_DATA_LIMIT]
+    # Обрезанное слово остается префиксом, поэтому поиск по нему находит те же строки и больше
+    return data.decode("utf-8", "ignore")
+
+
+async def format_find_page(db: Storage, query: str, offset: int = 0) -> tuple[str, object]:
+    users, has_more, truncated = await db.search_users(query, FIND_PAGE_SIZE, offset)
+    if not users:
+        return f"🔍 По запросу «{html.escape(query)}» ничего не найдено.", None
+
+    page = offset // FIND_PAGE_SIZE + 1
+    text = f"🔍 <b>Поиск: {html.escape(query)}</b> - Страница {page}\n\n"
+    for number, user in enumerate(users, start=offset + 1):
+        end_date = user.get('subscription_end_date') or "N/A"
+        text += (
+            f"{number}. ID: <code>{user['user_id']}</code> - {get_user_mention(user)} - "
+            f"<b>{user['status']}</b> - до {end_date}{get_channel_note(user['channel_id'])}\n"
+        )
+    if truncated:
+        text += f"\n<i>Совпадений больше {SEARCH_CANDIDATES}, показаны лучшие из первых. Уточните запрос.</i>"
+
+    builder = InlineKeyboardBuilder()
+    if offset > 0:
+        builder.button(text="◀️ Назад", callback_data=_find_callback(max(0, offset - FIND_PAGE_SIZE), query))
+    builder.button(text=f"Стр. {page}", callback_data="noop")
+    if has_more:
+        builder.button(text="Вперёд ▶️", callback_data=_find_callback(offset + FIND_PAGE_SIZE, query))
+    return text, builder.as_markup()
+
+
+@admin_router.message(Command("find"))
+async def find_command(message: Message, db: Storage):
+    query = " ".join(search_tokens(message.text.partition(" ")[2]))
+    if len(query.replace(" ", "")) < FIND_MIN_LENGTH:
+        await message.answer(
+            "⚠️ Укажите хотя бы 2 буквы имени или username.\nПример: <code>/find иван пет</code>", parse_mode='HTML'
+        )
+        return
+    try:
+        text, keyboard = await format_find_page(db, query)
+    except Exception as e:
+        logger.error(f"Ошибка при поиске пользователей по '{query}': {e}")
+        await message.answer(f"❌ Не удалось выполнить поиск: {str(e)}")
+        return
+    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+
+
+@admin_router.callback_query(F.data.startswith("find_"))
+async def paginate_find(call: CallbackQuery, db: Storage):
+    _, offset_str, query = call.data.split("_", 2)
+    try:
+        text, keyboard = await format_find_page(db, query, int(offset_str))
+        await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+    except Exception as e:
+        logger.warning(f"Ошибка при листании результатов поиска: {e}")
+    finally:
+        await call.answer()
+
+
+@admin_router.message(Command("perf"))
+async def perf_command(message: Message):
+    lines = format_perf_lines()
+    if not lines:
+        await message.answer("📈 Метрики пока не собраны.")
+        return
+    for text in split_messages(lines, "📈 Задержки с момента запуска (p50/p95/p99):"):
+        await message.answer(text, parse_mode=None)
+
+# Выгрузка и загрузка базы пользователей
+# Лимиты Bot API: бот может отправить файл до 50 МБ и скачать файл до 20 МБ
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+IMPORT_PROGRESS_INTERVAL = 3
+
+
+@admin_router.message(Command("export"))
+async def export_command(message: Message, db: Storage):
+    args = message.text.split()
+    fmt = args[1].lower() if len(args) > 1 else 'csv'
+    if fmt not in EXPORT_FORMATS:
+        await message.answer("⚠️ Укажите формат: <code>/export csv</code> или <code>/export jsonl</code>", parse_mode='HTML')
+        return
+
+    await message.answer("📦 Готовлю выгрузку базы пользователей...")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = export_filename(fmt)
+            path = os.path.join(tmp, file_name)
+            count = await export_users(db, path, fmt)
+            file_size = os.path.getsize(path)
+            if file_size > MAX_UPLOAD_SIZE:
+                await message.answer(f"⚠️ Выгрузка слишком большая для отправки ({file_size / (1024 * 1024):.1f}MB).")
+                return
+            await message.answer_document(FSInputFile(path, filename=file_name), caption=f"Пользователей: {count}")
+        logger.info(f"Администратор {message.from_user.id} выгрузил {count} пользователей ({fmt}).")
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке пользователей: {e}")
+        await message.answer(f"❌ Не удалось выгрузить базу: {str(e)}")
+
+
+@admin_router.message(Command("import"))
+async def import_command(message: Message, bot: Bot, db: Storage):
+    document = message.document or (message.reply_to_message.document if message.reply_to_message else None)
+    if document is None:
+        await message.answer("⚠️ Отправьте файл .csv или .jsonl (можно .gz) с подписью /import или ответьте /import на сообщение с файлом.")
+        return
+    try:
+        fmt = detect_format(document.file_name or "")
+    except ValueError as e:
+        await message.answer(f"⚠️ {e}")
+        return
+    if document.file_size and document.file_size > MAX_DOWNLOAD_SIZE:
+        await message.answer("⚠️ Файл больше 20 МБ: Bot API не позволяет боту его скачать. Сожмите его gzip или разбейте на части.")
+        return
+
+    status_message = await message.answer("📥 Загружаю файл...")
+    last_update = time.monotonic()
+
+    async def progress(report):
+        nonlocal last_update
+        # Редактируем сообщение не чаще раза в несколько секунд, чтобы не упереться в лимиты Telegram
+        if time.monotonic() - last_update < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        try:
+            await status_message.edit_text(f"📥 Обработано строк: {report.processed}, загружено: {report.imported}, ошибок: {report.error_count}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс импорта: {e}")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "import")
+            await bot.download(document, destination=path)
+            report = await import_users_file(db, path, fmt, progress)
+    except Exception as e:
+        logger.error(f"Ошибка при импорте пользователей: {e}")
+        await message.answer(f"❌ Импорт прерван: {str(e)}\nПачки, загруженные до ошибки, сохранены.")
+        return
+
+    await message.answer(
+        f"✅ Импорт завершен.\nОбработано строк: {report.processed}\nЗагружено: {report.imported}\nОшибок: {report.error_count}"
+    )
+    if report.errors:
+        error_lines = [f"Строка {line}: {error}" for line, error in report.errors]
+        if report.error_count > len(report.errors):
+            error_lines.append(f"... и еще {report.error_count - len(report.errors)} ошибок")
+        document = BufferedInputFile("\n".join(error_lines).encode("utf-8"), filename="import_errors.txt")
+        await message.answer_document(document, caption="Ошибки валидации")
+    logger.info(f"Администратор {message.from_user.id} импортировал {report.imported} пользователей, ошибок {report.error_count}.")
+
+
+# Больше стольких найденных строк лога отправляется файлом, а не сообщениями
+LOG_INLINE_LINES = 20
+
+
 @admin_router.message(Command("log"))
+async def log_command(message: Message):
+    args = message.text.split()[1:]
+    if not args:
+        await send_log_files(message)
+        return
+    try:
+        log_filter = parse_filters(args)
+    except ValueError as e:
+        await message.answer(
+            f"⚠️ {html.escape(str(e))}\nПример: <code>/log since=2h level=WARNING user=123456789</code>", parse_mode='HTML'
+        )
+        return
+
+    try:
+        # Поиск по файлам - синхронное чтение с диска, выполняем его в потоке
+        result = await asyncio.to_thread(search_logs, log_filter)
+    except Exception as e:
+        logger.error(f"Ошибка при поиске по логам: {e}")
+        await message.answer(f"❌ Не удалось выполнить поиск по логам: {str(e)}")
+        return
+
+    if not result.matched:
+        await message.answer(f"🔍 Записей не найдено (просмотрено файлов: {result.files}).")
+        return
+    header = f"🔍 Найдено записей: {result.matched}"
+    if result.matched > len(result.lines):
+        header += f", показаны последние {len(result.lines)}"
+    if len(result.lines) <= LOG_INLINE_LINES:
+        for text in split_messages(list(result.lines), header + ":"):
+            await message.answer(text, parse_mode=None)
+    else:
+        document = BufferedInputFile("\n".join(result.lines).encode("utf-8"), filename="log_search.txt")
+        await message.answer_document(document, caption=header)
+    logger.info(f"Администратор {message.from_user.id} выполнил поиск по логам: {' '.join(args)}")
+
+
 async def send_log_files(message: Message):
     try:
-        logs_dir = "logs"
+        logs_dir = LOG_DIR
         
         if not os.path.exists(logs_dir):
             await message.answer("📂 Директория с логами не найдена.")
@@ -1,74 +1,75 @@
 from datetime import datetime, timedelta
 
 from aiogram import Router, F, Bot
-from aiogram.types import ChatJoinRequest, CallbackQuery
+from aiogram.types import ChatJoinRequest, ChatMemberUpdated, CallbackQuery
 from loguru import logger
 
-from src.config import ADMIN_ID, CHANNEL_ID
-from src.database import database as db
-from src.utils.user_utils import get_user_mention
+from src.config import CHANNEL_ID, CHANNEL_IDS
+from src.database.storage import Storage
+from src.utils.user_utils import get_user_mention, get_channel_note
 from src.utils.filter import setup_admin_router
 from src.handlers.admin_commands import process_ban
-from src.keyboards.inline import get_approval_keyboard, get_subscription_keyboard
+from src.keyboards.inline import get_approval_keyboard, get_subscription_keyboard, get_review_subscription_keyboard
+from src.utils.join_queue import join_queue, review_batches, format_review_card, format_applicant_message
+from src.utils.pipeline import run_bot_actions
+from src.utils.ledger import ledger
+from src.utils.membership import membership, is_chat_member
+from src.utils.rate_limiter import bot_limiter
+from src.utils.metrics import setup_router_metrics
 
 join_router = Router()
 join_router = setup_admin_router(join_router)
+join_router = setup_router_metrics(join_router, "join")
 
-# Обработчики
-@join_router.chat_join_request(F.chat.id == CHANNEL_ID)
-async def handle_join_request(request: ChatJoinRequest, bot: Bot):
-    user_id = request.from_user.id
-    full_name = request.from_user.full_name
-    username = request.from_user.username
-    logger.info(f"Получена новая заявка на вступление от {get_user_mention(request.from_user)}")
 
-    await db.add_user(user_id, full_name, username)
-    user_data = await db.get_user(user_id)
+def _callback_channel(parts: list[str], index: int) -> int:
+    # Кнопки, отправленные до поддержки нескольких каналов, относятся к основному каналу
+    return int(parts[index]) if len(parts) > index else CHANNEL_ID
 
-    if not user_data:
-        logger.error(f"Не удалось найти или создать пользователя {user_id} в БД.")
-        return
 
-    status = user_data.get('status')
+# Обработчики
+@join_router.chat_join_request(F.chat.id.in_(CHANNEL_IDS))
+async def handle_join_request(request: ChatJoinRequest, db: Storage):
+    user_id = request.from_user.id
+    channel_id = request.chat.id
+    logger.info(f"Получена новая заявка на вступление в канал {channel_id} от {get_user_mention(request.from_user)}")
+    # Заявку подают только те, кого нет в канале
+    membership.set(channel_id, user_id, False)
 
-    if status == 'banned':
+    # Известных заблокированных и активных пользователей обрабатываем сразу, не дожидаясь окна пачки:
+    # get_user берет строку из кэша, а при промахе читает ее из БД по ключу (channel_id, user_id)
+    known_user = await db.get_user(user_id, channel_id)
+    if known_user and known_user.get('status') == 'banned':
         await request.decline()
         logger.info(f"Заявка от заблокированного пользователя {user_id} отклонена.")
         return
-    elif status == 'active':
+    elif known_user and known_user.get('status') == 'active':
         await request.approve()
         logger.info(f"Заявка от активного пользователя {user_id} одобрена автоматически.")
         return
 
-    user_mention = get_user_mention(user_data)
-    message_text = f"Новая заявка на вступление.\nПользователь: <b>{user_mention}</b>"
+    await join_queue.submit(request)
 
-    if status == 'expired':
-        end_date_str = user_data.get('subscription_end_date')
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-                message_text += f"\n<i>(Предыдущая подписка истекла {end_date.strftime('%d.%m.%Y')})</i>"
-            except (ValueError, TypeError):
-                 logger.warning(f"Некорректный формат даты '{end_date_str}' для пользователя {user_id}")
 
-
-    keyboard = get_approval_keyboard(user_id)
-    await bot.send_message(ADMIN_ID, message_text, reply_markup=keyboard, parse_mode='HTML')
-    logger.info(f"Заявка от {user_id} отправлена администратору на рассмотрение.")
+@join_router.chat_member(F.chat.id.in_(CHANNEL_IDS))
+async def handle_chat_member(update: ChatMemberUpdated):
+    # Вступления и выходы из канала, в том числе одобренные не ботом: держат кэш участия актуальным
+    membership.set(update.chat.id, update.new_chat_member.user.id, is_chat_member(update.new_chat_member))
 
 @join_router.callback_query(F.data.startswith("approve_"))
-async def approve_user_prompt(call: CallbackQuery):
-    user_id = int(call.data.split("_")[1])
-    user_data = await db.get_user(user_id)
+async def approve_user_prompt(call: CallbackQuery, db: Storage):
+    parts = call.data.split("_")
+    user_id = int(parts[1])
+    channel_id = _callback_channel(parts, 2)
+    user_data = await db.get_user(user_id, channel_id)
     if not user_data:
         await call.answer("Пользователь не найден в базе данных.", show_alert=True)
         return
 
     user_mention = get_user_mention(user_data)
-    keyboard = get_subscription_keyboard(user_id)
+    keyboard = get_subscription_keyboard(user_id, channel_id)
     await call.message.edit_text(
-        f"Выберите длительность подписки для пользователя <b>{user_mention}</b>:",
+        f"Выберите длительность подписки для пользователя <b>{user_mention}</b>{get_channel_note(channel_id)}:",
         reply_markup=keyboard,
         parse_mode='HTML'
     )
@@ -76,38 +77,34 @@ async def approve_user_prompt(call: CallbackQuery):
 
 
 @join_router.callback_query(F.data.startswith("set_sub_"))
-async def set_subscription(call: CallbackQuery, bot: Bot):
+async def set_subscription(call: CallbackQuery, bot: Bot, db: Storage):
     parts = call.data.split("_")
     user_id_str = parts[2]  
     days_str = parts[3]    
     user_id = int(user_id_str)
     days = int(days_str)
+    channel_id = _callback_channel(parts, 4)
 
-    user_data = await db.get_user(user_id)
+    user_data = await db.get_user(user_id, channel_id)
     if not user_data:
         await call.answer("Пользователь не найден в базе данных.", show_alert=True)
         return
 
     try:
-        try:
-            chat_member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-            is_member = chat_member.status in ['member', 'administrator', 'creator']
-        except Exception:
-            is_member = False
-
-        if not is_member:
-            await bot.approve_chat_join_request(chat_id=CHANNEL_ID, user_id=user_id)
-            logger.info(f"Заявка пользователя {user_id} одобрена.")
+        # Участие в канале берется из кэша, getChatMember вызывается только при промахе
+        if await membership.approve_if_not_member(bot, channel_id, user_id):
+            logger.info(f"Заявка пользователя {user_id} в канал {channel_id} одобрена.")
         else:
-            logger.info(f"Пользователь {user_id} уже является участником канала.")
+            logger.info(f"Пользователь {user_id} уже является участником канала {channel_id}.")
 
         end_date = datetime.now() + timedelta(days=days)
         end_date_str = end_date.strftime('%Y-%m-%d')
-        await db.update_subscription(user_id, end_date_str)
+        await db.update_subscription(user_id, end_date_str, channel_id)
+        ledger.record('extend' if user_data['status'] == 'active' else 'grant', channel_id, user_id, days, end_date_str)
         
         user_mention = get_user_mention(user_data)
         await call.message.edit_text(
-            f"✅ Готово! Пользователь <b>{user_mention}</b> добавлен в канал до {end_date.strftime('%d.%m.%Y')}.",
+            f"✅ Готово! Пользователь <b>{user_mention}</b> добавлен в канал{get_channel_note(channel_id)} до {end_date.strftime('%d.%m.%Y')}.",
             parse_mode='HTML'
         )
         logger.info(f"Подписка пользователя {user_id} обновлена на {days} дней.")
@@ -119,16 +116,19 @@ async def set_subscription(call: CallbackQuery, bot: Bot):
         await call.answer()
 
 @join_router.callback_query(F.data.startswith("decline_"))
-async def decline_user(call: CallbackQuery, bot: Bot):
-    user_id = int(call.data.split("_")[1])
-    user_data = await db.get_user(user_id)
+async def decline_user(call: CallbackQuery, bot: Bot, db: Storage):
+    parts = call.data.split("_")
+    user_id = int(parts[1])
+    channel_id = _callback_channel(parts, 2)
+    user_data = await db.get_user(user_id, channel_id)
     if not user_data:
         await call.answer("Пользователь не найден.", show_alert=True)
         return
 
     try:
         # await bot.decline_chat_join_request(chat_id=CHANNEL_ID, user_id=user_id, hide_request=True)
-        await db.update_user_status(user_id, 'rejected')
+        await db.update_user_status(user_id, 'rejected', channel_id)
+        ledger.record('reject', channel_id, user_id)
         user_mention = get_user_mention(user_data)
         await call.message.edit_text(f"❌ Заявка от пользователя <b>{user_mention}</b> отклонена.", parse_mode='HTML')
         logger.info(f"Заявка от {user_id} отклонена администратором.")
@@ -140,11 +140,118 @@ async def decline_user(call: CallbackQuery, bot: Bot):
 
 
 @join_router.callback_query(F.data.startswith("ban_"))
-async def ban_user_callback(call: CallbackQuery, bot: Bot):
+async def ban_user_callback(call: CallbackQuery, bot: Bot, db: Storage):
     user_id = int(call.data.split("_")[1])
-    await process_ban(user_id, bot)
-    user_data = await db.get_user(user_id)
+    await process_ban(db, user_id, bot)
+    user_data = await db.find_user_by_id_or_username(str(user_id))
     if user_data:
         user_mention = get_user_mention(user_data)
         await call.message.edit_text(f"🚫 Пользователь <b>{user_mention}</b> заблокирован.", parse_mode='HTML')
-    await call.answer()
\ No newline at end of file
+    await call.answer()
+
+
+# Групповое рассмотрение заявок
+@join_router.callback_query(F.data.startswith("rv_page_"))
+async def review_page(call: CallbackQuery):
+    _, _, batch_id_str, page_str = call.data.split("_")
+    text, keyboard = format_review_card(int(batch_id_str), int(page_str))
+    try:
+        await call.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+    except Exception as e:
+        logger.warning(f"Ошибка при обновлении карточки заявок (возможно, текст не изменился): {e}")
+    finally:
+        await call.answer()
+
+
+@join_router.callback_query(F.data.startswith("rv_user_"))
+async def review_single_user(call: CallbackQuery, db: Storage):
+    _, _, batch_id_str, user_id_str = call.data.split("_")
+    user_id = int(user_id_str)
+    batch = review_batches.get(int(batch_id_str))
+    channel_id = batch[0]['channel_id'] if batch else CHANNEL_ID
+    user_data = await db.get_user(user_id, channel_id)
+    if not user_data:
+        await call.answer("Пользователь не найден в базе данных.", show_alert=True)
+        return
+
+    await call.message.answer(format_applicant_message(user_data), reply_markup=get_approval_keyboard(user_id, channel_id), parse_mode='HTML')
+    await call.answer()
+
+
+@join_router.callback_query(F.data.startswith("rv_approve_"))
+async def review_approve_prompt(call: CallbackQuery):
+    batch_id = int(call.data.split("_")[2])
+    users = review_batches.get(batch_id)
+    if not users:
+        await call.answer("Эта группа заявок уже обработана или устарела.", show_alert=True)
+        return
+
+    await call.message.edit_text(
+        f"Выберите длительность подписки для <b>{len(users)}</b> пользователей из группы:",
+        reply_markup=get_review_subscription_keyboard(batch_id),
+        parse_mode='HTML'
+    )
+    await call.answer()
+
+
+async def _pending_batch_users(db: Storage, batch_id: int) -> list[dict] | None:
+    users = review_batches.pop(batch_id)
+    if not users:
+        return None
+    # Пользователей, по которым уже принято решение по отдельности, пропускаем
+    current = await db.get_users_by_ids([user['user_id'] for user in users], users[0]['channel_id'])
+    return [user for user in current if user['status'] not in ('active', 'banned')]
+
+
+async def _approve_join_request(bot: Bot, user: dict):
+    await bot_limiter.acquire()
+    await bot.approve_chat_join_request(chat_id=user['channel_id'], user_id=user['user_id'])
+    membership.set(user['channel_id'], user['user_id'], True)
+
+
+@join_router.callback_query(F.data.startswith("rv_sub_"))
+async def review_approve_all(call: CallbackQuery, bot: Bot, db: Storage):
+    _, _, batch_id_str, days_str = call.data.split("_")
+    users = await _pending_batch_users(db, int(batch_id_str))
+    if users is None:
+        await call.answer("Эта группа заявок уже обработана или устарела.", show_alert=True)
+        return
+    await call.answer("Одобряю заявки...")
+
+    result = await run_bot_actions(
+        users,
+        lambda user: _approve_join_request(bot, user),
+        label=lambda user: user['user_id'],
+    )
+    end_date = datetime.now() + timedelta(days=int(days_str))
+    approved_ids = []
+    if users:
+        approved_ids = await db.bulk_update_subscription(
+            [user['user_id'] for user in result.succeeded], end_date.strftime('%Y-%m-%d'), users[0]['channel_id']
+        )
+        for user_id in approved_ids:
+            ledger.record('grant', users[0]['channel_id'], user_id, int(days_str), end_date.strftime('%Y-%m-%d'))
+
+    text = f"✅ Одобрено заявок: <b>{len(approved_ids)}</b>, подписка до {end_date.strftime('%d.%m.%Y')}."
+    if result.failed:
+        failed = ", ".join(f"<code>{user['user_id']}</code>" for user in result.failed)
+        text += f"\n⚠️ Не удалось одобрить ({len(result.failed)}): {failed}"
+    await call.message.edit_text(text, parse_mode='HTML')
+    logger.info(f"Групповое одобрение: одобрено {len(approved_ids)}, ошибок {len(result.failed)}.")
+
+
+@join_router.callback_query(F.data.startswith("rv_decline_"))
+async def review_decline_all(call: CallbackQuery, db: Storage):
+    users = await _pending_batch_users(db, int(call.data.split("_")[2]))
+    if users is None:
+        await call.answer("Эта группа заявок уже обработана или устарела.", show_alert=True)
+        return
+
+    declined_ids = []
+    if users:
+        declined_ids = await db.bulk_update_status([user['user_id'] for user in users], 'rejected', channel_id=users[0]['channel_id'])
+        for user_id in declined_ids:
+            ledger.record('reject', users[0]['channel_id'], user_id)
+    await call.message.edit_text(f"❌ Отклонено заявок: <b>{len(declined_ids)}</b>.", parse_mode='HTML')
+    logger.info(f"Групповое отклонение: отклонено {len(declined_ids)} заявок.")
+    await call.answer()
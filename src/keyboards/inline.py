@@ -1,21 +1,57 @@
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder    
 
-def get_approval_keyboard(user_id: int):
+SUBSCRIPTION_PERIODS = {
+    "1 неделя": 7, "2 недели": 14, "1 месяц": 30,
+    "2 месяца": 60, "3 месяца": 90
+}
+
+
+def get_approval_keyboard(user_id: int, channel_id: int):
     builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Одобрить", callback_data=f"approve_{user_id}")
-    builder.button(text="❌ Отклонить", callback_data=f"decline_{user_id}")
+    builder.button(text="✅ Одобрить", callback_data=f"approve_{user_id}_{channel_id}")
+    builder.button(text="❌ Отклонить", callback_data=f"decline_{user_id}_{channel_id}")
     builder.button(text="🚫 Заблокировать", callback_data=f"ban_{user_id}")
     builder.adjust(2, 1)
     return builder.as_markup()
 
 
-def get_subscription_keyboard(user_id: int):
+def get_subscription_keyboard(user_id: int, channel_id: int):
+    builder = InlineKeyboardBuilder()
+    for text, days in SUBSCRIPTION_PERIODS.items():
+        builder.button(text=text, callback_data=f"set_sub_{user_id}_{days}_{channel_id}")
+    builder.adjust(3)
+    return builder.as_markup()
+
+
+def get_review_keyboard(batch_id: int, users: list[tuple[int, str]], page: int, total_pages: int):
+    # users - пары (user_id, подпись кнопки) для текущей страницы карточки
     builder = InlineKeyboardBuilder()
-    periods = {
-        "1 неделя": 7, "2 недели": 14, "1 месяц": 30,
-        "2 месяца": 60, "3 месяца": 90
-    }
-    for text, days in periods.items():
-        builder.button(text=text, callback_data=f"set_sub_{user_id}_{days}")
+    for user_id, label in users:
+        builder.button(text=label, callback_data=f"rv_user_{batch_id}_{user_id}")
+    builder.adjust(2)
+
+    navigation = []
+    if page > 1:
+        navigation.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"rv_page_{batch_id}_{page - 1}"))
+    if total_pages > 1:
+        navigation.append(InlineKeyboardButton(text=f"Стр. {page}/{total_pages}", callback_data="noop"))
+    if page < total_pages:
+        navigation.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"rv_page_{batch_id}_{page + 1}"))
+    if navigation:
+        builder.row(*navigation)
+
+    builder.row(
+        InlineKeyboardButton(text="✅ Одобрить всех", callback_data=f"rv_approve_{batch_id}"),
+        InlineKeyboardButton(text="❌ Отклонить всех", callback_data=f"rv_decline_{batch_id}"),
+    )
+    return builder.as_markup()
+
+
+def get_review_subscription_keyboard(batch_id: int):
+    builder = InlineKeyboardBuilder()
+    for text, days in SUBSCRIPTION_PERIODS.items():
+        builder.button(text=text, callback_data=f"rv_sub_{batch_id}_{days}")
     builder.adjust(3)
-    return builder.as_markup()
\ No newline at end of file
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data=f"rv_page_{batch_id}_1"))
+    return builder.as_markup()
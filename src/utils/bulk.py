@@ -0,0 +1,157 @@
+import csv
+import gzip
+import io
+import re
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+
+from src.config import CHANNEL_IDS
+from src.utils.membership import membership
+from src.utils.rate_limiter import bot_limiter
+from src.utils.user_utils import get_user_mention
+
+# Предел идентификаторов в одной массовой команде: файл с выгрузкой всей базы не должен уходить в бан целиком по ошибке
+BULK_MAX_IDENTIFIERS = 10000
+# Больше стольких строк подробностей отчет отправляется файлом
+BULK_INLINE_DETAILS = 20
+# Username в Telegram: 5-32 символа, латиница, цифры и _, начинается с буквы
+USERNAME_PATTERN = re.compile(r"@?([A-Za-z][A-Za-z0-9_]{4,31})")
+IDENTIFIER_SEPARATORS = re.compile(r"[\s,;]+")
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+@dataclass
+class Identifiers:
+    user_ids: list[int] = field(default_factory=list)
+    usernames: list[str] = field(default_factory=list)
+    invalid: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.user_ids) + len(self.usernames)
+
+    def add(self, token: str):
+        token = token.strip()
+        if not token:
+            return
+        if token.isdigit():
+            self.user_ids.append(int(token))
+            return
+        match = USERNAME_PATTERN.fullmatch(token)
+        if match:
+            self.usernames.append(match.group(1).lower())
+        else:
+            self.invalid.append(token)
+
+    def merge(self, other: 'Identifiers') -> 'Identifiers':
+        return Identifiers(
+            self.user_ids + other.user_ids,
+            self.usernames + other.usernames,
+            self.invalid + other.invalid,
+        ).deduplicate()
+
+    def deduplicate(self) -> 'Identifiers':
+        return Identifiers(
+            list(dict.fromkeys(self.user_ids)),
+            list(dict.fromkeys(self.usernames)),
+            list(dict.fromkeys(self.invalid)),
+        )
+
+
+def parse_identifiers(text: str) -> Identifiers:
+    """
+    Разбирает список ID и @username, разделенных пробелами, переводами строк, запятыми или точкой с запятой.
+    """
+    identifiers = Identifiers()
+    for token in IDENTIFIER_SEPARATORS.split(text):
+        identifiers.add(token)
+    return identifiers.deduplicate()
+
+
+def read_identifiers_file(data: bytes) -> Identifiers:
+    """
+    Идентификаторы из файла: простой список или CSV с заголовком (например, выгрузка /export),
+    из которого берется колонка user_id, а если ее нет - username. Файл может быть сжат gzip.
+    """
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    text = data.decode('utf-8-sig')
+    header = text.split("\n", 1)[0].lower()
+    if 'user_id' not in header and 'username' not in header:
+        return parse_identifiers(text)
+
+    identifiers = Identifiers()
+    for row in csv.DictReader(io.StringIO(text)):
+        row = {(key or '').strip().lower(): value for key, value in row.items()}
+        value = row.get('user_id') or row.get('username') or ''
+        identifiers.add(value)
+    return identifiers.deduplicate()
+
+
+def group_found_users(identifiers: Identifiers, rows: list[dict]) -> tuple[dict[int, list[dict]], list[str]]:
+    """
+    Раскладывает строки из БД по пользователям. Возвращает {user_id: строки по каналам} и ненайденные идентификаторы.
+    """
+    users: dict[int, list[dict]] = {}
+    usernames = set()
+    for row in rows:
+        users.setdefault(row['user_id'], []).append(row)
+        if row['username']:
+            usernames.add(row['username'])
+    not_found = [str(user_id) for user_id in identifiers.user_ids if user_id not in users]
+    not_found += [f"@{username}" for username in identifiers.usernames if username not in usernames]
+    return users, not_found
+
+
+def describe_user(row: dict, with_channel: bool = False) -> str:
+    label = f"{row['user_id']} {get_user_mention(row)}".rstrip()
+    if with_channel and len(CHANNEL_IDS) > 1:
+        label += f" (канал {row['channel_id']})"
+    return label
+
+
+def latest_application(rows: list[dict]) -> dict:
+    # Как в /extend без ID канала: канал, куда пользователь подавал заявку последним
+    return max(rows, key=lambda row: (str(row['last_application_date'] or ''), row['id']))
+
+
+@dataclass
+class BulkReport:
+    """
+    Итог массовой команды: счетчики по разделам и строки подробностей для администратора.
+    """
+    title: str
+    requested: int = 0
+    sections: dict[str, list[str]] = field(default_factory=dict)
+
+    def add(self, section: str, line: str):
+        self.sections.setdefault(section, []).append(line)
+
+    def extend(self, section: str, lines: list[str]):
+        if lines:
+            self.sections.setdefault(section, []).extend(lines)
+
+    def render(self) -> tuple[str, str | None]:
+        """
+        Текст сводки и, если подробностей много, содержимое файла для отправки документом.
+        """
+        summary = [f"{self.title}", f"Запрошено: {self.requested}"]
+        summary += [f"{section}: {len(lines)}" for section, lines in self.sections.items()]
+        details = [
+            line
+            for section, lines in self.sections.items()
+            for line in [f"\n{section}:", *lines]
+        ]
+        detail_count = sum(len(lines) for lines in self.sections.values())
+        if detail_count <= BULK_INLINE_DETAILS:
+            return "\n".join(summary + details), None
+        return "\n".join(summary), "\n".join(details).strip()
+
+
+async def kick_from_channel(bot: Bot, channel_id: int, user_id: int):
+    # ban + unban удаляет пользователя из канала, не оставляя его в черном списке Telegram
+    await bot_limiter.acquire()
+    await bot.ban_chat_member(chat_id=channel_id, user_id=user_id)
+    await bot_limiter.acquire()
+    await bot.unban_chat_member(chat_id=channel_id, user_id=user_id)
+    membership.set(channel_id, user_id, False)
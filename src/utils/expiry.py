@@ -0,0 +1,156 @@
+import asyncio
+import heapq
+from datetime import date, datetime, time, timedelta
+
+from aiogram import Bot
+from loguru import logger
+
+from src.config import CHANNEL_IDS, EXPIRY_HORIZON_DAYS
+from src.database.storage import Storage
+from src.utils.scheduler import expire_users, resume_interrupted_sweep
+
+# Даже без изменений расписания просыпаемся не реже раза в час, чтобы не зависеть от переводов часов
+MAX_SLEEP = 3600
+
+
+def expires_at(end_date: str) -> datetime | None:
+    """
+    Момент истечения подписки: дата окончания включается, доступ заканчивается в полночь следующего дня.
+    """
+    try:
+        return datetime.combine(date.fromisoformat(end_date) + timedelta(days=1), time.min)
+    except (TypeError, ValueError):
+        return None
+
+
+class ExpiryScheduler:
+    """
+    Таймеры истечения подписок на min-куче. В памяти держатся только подписки, истекающие
+    в ближайшие horizon_days дней; окно перезагружается из БД каждую полночь.
+    """
+
+    def __init__(self, horizon_days: int = EXPIRY_HORIZON_DAYS):
+        self.horizon_days = max(1, horizon_days)
+        self._heap: list[tuple[datetime, int, int, str]] = []
+        # Актуальная дата окончания по (channel_id, user_id); записи кучи с другой датой устарели
+        self._scheduled: dict[tuple[int, int], str] = {}
+        self._horizon: datetime = datetime.min
+        self._reload_at: datetime = datetime.min
+        self._wakeup = asyncio.Event()
+        self._bot: Bot | None = None
+        self._db: Storage | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def start(self, bot: Bot, db: Storage):
+        self._bot = bot
+        self._db = db
+        if self._task is None:
+            db.add_change_listener(self.reschedule)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def schedule(self, user: dict):
+        key = (user['channel_id'], user['user_id'])
+        end_date = user.get('subscription_end_date')
+        at = expires_at(end_date) if user.get('status') == 'active' else None
+        if at is None or at > self._horizon:
+            # Подписка не активна или истекает позже окна - ее подхватит следующая перезагрузка
+            self._scheduled.pop(key, None)
+            return
+        if self._scheduled.get(key) == end_date:
+            return
+        self._scheduled[key] = end_date
+        is_earliest = not self._heap or at < self._heap[0][0]
+        heapq.heappush(self._heap, (at, user['channel_id'], user['user_id'], end_date))
+        if is_earliest:
+            self._wakeup.set()
+
+    def reschedule(self, users: list[dict]):
+        # Вызывается базой после изменения статуса или даты окончания подписки
+        for user in users:
+            self.schedule(user)
+
+    async def _load(self):
+        now = datetime.now()
+        self._horizon = datetime.combine(now.date() + timedelta(days=self.horizon_days), time.min)
+        self._reload_at = datetime.combine(now.date() + timedelta(days=1), time.min)
+        horizon_date = (now.date() + timedelta(days=self.horizon_days)).isoformat()
+        loaded = 0
+        for channel_id in CHANNEL_IDS:
+            # Активные подписки с датой окончания раньше horizon_date истекают до конца окна
+            for user in await self._db.get_expired_users(horizon_date, channel_id):
+                self.schedule(user)
+                loaded += 1
+        logger.info(f"Таймеры истечения подписок загружены: {loaded} подписок до {self._horizon:%d.%m.%Y %H:%M}.")
+
+    def _pop_due(self, now: datetime) -> list[tuple[int, int, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, channel_id, user_id, end_date = heapq.heappop(self._heap)
+            if self._scheduled.get((channel_id, user_id)) == end_date:
+                del self._scheduled[(channel_id, user_id)]
+                due.append((channel_id, user_id, end_date))
+        return due
+
+    async def _expire(self, due: list[tuple[int, int, str]]):
+        today = datetime.now().date().isoformat()
+        users = []
+        for channel_id in CHANNEL_IDS:
+            user_ids = [user_id for due_channel_id, user_id, _ in due if due_channel_id == channel_id]
+            if not user_ids:
+                continue
+            # Перед удалением сверяемся с БД: подписку могли продлить, пока таймер ждал
+            for user in await self._db.get_users_by_ids(user_ids, channel_id):
+                end_date = user.get('subscription_end_date')
+                if user['status'] == 'active' and expires_at(end_date) is not None and end_date < today:
+                    users.append(user)
+        if not users:
+            return
+        logger.info(f"Истекли подписки у {len(users)} пользователей, удаление по таймеру...")
+        result, expired_count = await expire_users(self._bot, self._db, users)
+        logger.info(f"По таймеру удалено {expired_count} пользователей, ошибок {len(result.failed)}.")
+
+    async def _run(self):
+        try:
+            # Удаление, прерванное остановкой бота, продолжаем до загрузки таймеров
+            await resume_interrupted_sweep(self._bot, self._db)
+        except Exception as e:
+            logger.error(f"Не удалось продолжить прерванную проверку подписок: {e}")
+        while True:
+            try:
+                now = datetime.now()
+                if now >= self._reload_at:
+                    await self._load()
+                due = self._pop_due(now)
+                if due:
+                    await self._expire(due)
+                    continue
+
+                next_at = min(self._heap[0][0], self._reload_at) if self._heap else self._reload_at
+                self._wakeup.clear()
+                timeout = min(MAX_SLEEP, max(0.0, (next_at - datetime.now()).total_seconds()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Пропущенные удаления подберет ежедневная страховочная проверка
+                logger.error(f"Ошибка в таймерах истечения подписок: {e}")
+                await asyncio.sleep(60)
+
+
+expiry_scheduler = ExpiryScheduler()
@@ -0,0 +1,237 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.types import ChatJoinRequest
+from loguru import logger
+
+from src.config import (
+    ADMIN_ID, JOIN_BATCH_SIZE, JOIN_BATCH_WINDOW, JOIN_QUEUE_POLICY, JOIN_QUEUE_SIZE, JOIN_QUEUE_TIMEOUT,
+)
+from src.database.storage import Storage
+from src.keyboards.inline import get_approval_keyboard, get_review_keyboard
+from src.utils.notifier import notifier
+from src.utils.pipeline import run_bot_actions
+from src.utils.rate_limiter import bot_limiter
+from src.utils.user_utils import get_user_mention, get_channel_note
+
+REVIEW_PAGE_SIZE = 10
+MAX_REVIEW_BATCHES = 100
+
+
+def format_expired_note(user: dict) -> str | None:
+    if user.get('status') != 'expired':
+        return None
+    end_date_str = user.get('subscription_end_date')
+    if not end_date_str:
+        return None
+    try:
+        return datetime.strptime(end_date_str, '%Y-%m-%d').strftime('%d.%m.%Y')
+    except (ValueError, TypeError):
+        logger.warning(f"Некорректный формат даты '{end_date_str}' для пользователя {user['user_id']}")
+        return None
+
+
+def format_applicant_message(user: dict) -> str:
+    message_text = f"Новая заявка на вступление{get_channel_note(user['channel_id'])}.\nПользователь: <b>{get_user_mention(user)}</b>"
+    expired_at = format_expired_note(user)
+    if expired_at:
+        message_text += f"\n<i>(Предыдущая подписка истекла {expired_at})</i>"
+    return message_text
+
+
+class ReviewBatches:
+    """
+    Группы заявок в один канал, отправленные администратору одной карточкой. Хранятся в памяти, старые вытесняются.
+    """
+
+    def __init__(self, max_batches: int = MAX_REVIEW_BATCHES):
+        self.max_batches = max_batches
+        self._batches: OrderedDict[int, list[dict]] = OrderedDict()
+        self._next_id = 1
+
+    def add(self, users: list[dict]) -> int:
+        batch_id = self._next_id
+        self._next_id += 1
+        self._batches[batch_id] = users
+        while len(self._batches) > self.max_batches:
+            self._batches.popitem(last=False)
+        return batch_id
+
+    def get(self, batch_id: int) -> list[dict] | None:
+        return self._batches.get(batch_id)
+
+    def pop(self, batch_id: int) -> list[dict] | None:
+        return self._batches.pop(batch_id, None)
+
+
+review_batches = ReviewBatches()
+
+
+def format_review_card(batch_id: int, page: int = 1) -> tuple[str, object]:
+    users = review_batches.get(batch_id)
+    if not users:
+        return "⚠️ Эта группа заявок уже обработана или устарела.", None
+
+    total_pages = (len(users) + REVIEW_PAGE_SIZE - 1) // REVIEW_PAGE_SIZE
+    page = max(1, min(page, total_pages))
+    start_index = (page - 1) * REVIEW_PAGE_SIZE
+    page_users = users[start_index:start_index + REVIEW_PAGE_SIZE]
+
+    text = f"<b>📥 Новые заявки на вступление: {len(users)}</b>{get_channel_note(users[0]['channel_id'])}\n\n"
+    buttons = []
+    for number, user in enumerate(page_users, start=start_index + 1):
+        user_mention = get_user_mention(user)
+        line = f"{number}. <b>{user_mention}</b> (ID: <code>{user['user_id']}</code>)"
+        expired_at = format_expired_note(user)
+        if expired_at:
+            line += f" <i>- подписка истекла {expired_at}</i>"
+        text += line + "\n"
+        buttons.append((user['user_id'], f"{number}. {user_mention}"))
+    text += "\nНажмите на пользователя, чтобы рассмотреть заявку отдельно."
+
+    return text, get_review_keyboard(batch_id, buttons, page, total_pages)
+
+
+class JoinRequestQueue:
+    """
+    Ограниченная очередь заявок на вступление, которая обрабатывается пачками.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = JOIN_QUEUE_SIZE,
+        batch_size: int = JOIN_BATCH_SIZE,
+        batch_window: float = JOIN_BATCH_WINDOW,
+        policy: str = JOIN_QUEUE_POLICY,
+        put_timeout: float = JOIN_QUEUE_TIMEOUT,
+    ):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self._queue: asyncio.Queue[ChatJoinRequest] = asyncio.Queue(maxsize)
+        self._bot: Bot | None = None
+        self._db: Storage | None = None
+        self._task: asyncio.Task | None = None
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def start(self, bot: Bot, db: Storage):
+        self._bot = bot
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout: float = 30):
+        if self._task is not None:
+            # Даем воркеру дообработать очередь, включая текущую пачку
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не удалось дообработать очередь заявок за {timeout} с.")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+            self._queue.task_done()
+        for i in range(0, len(pending), self.batch_size):
+            try:
+                await self._process_batch(pending[i:i + self.batch_size])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке заявок при остановке: {e}")
+
+    async def submit(self, request: ChatJoinRequest) -> bool:
+        try:
+            if self.policy == 'drop':
+                self._queue.put_nowait(request)
+            else:
+                await asyncio.wait_for(self._queue.put(request), self.put_timeout)
+            return True
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            # Заявка остается в Telegram без ответа, ее можно рассмотреть позже вручную
+            user_id = request.from_user.id
+            logger.warning(f"Очередь заявок переполнена ({self._queue.maxsize}), заявка от {user_id} пропущена.")
+            notifier.add(f"⚠️ Очередь заявок переполнена, заявка от ID: {user_id} {get_user_mention(request.from_user)} не обработана.")
+            return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._process_batch(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке пачки из {len(batch)} заявок: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process_batch(self, requests: list[ChatJoinRequest]):
+        # Несколько заявок одного пользователя в один канал схлопываем в последнюю
+        by_user = {(request.chat.id, request.from_user.id): request for request in requests}
+        users = await self._db.bulk_upsert_users([
+            (channel_id, user_id, request.from_user.full_name, request.from_user.username)
+            for (channel_id, user_id), request in by_user.items()
+        ])
+
+        decisions, pending = [], {}
+        for user in users:
+            request = by_user[(user['channel_id'], user['user_id'])]
+            if user['status'] == 'banned':
+                decisions.append((request, 'decline'))
+            elif user['status'] == 'active':
+                decisions.append((request, 'approve'))
+            else:
+                pending.setdefault(user['channel_id'], []).append(user)
+
+        if decisions:
+            await run_bot_actions(decisions, self._resolve, label=lambda decision: decision[0].from_user.id)
+        for channel_users in pending.values():
+            await self._send_for_review(channel_users)
+
+    async def _resolve(self, decision: tuple[ChatJoinRequest, str]):
+        request, action = decision
+        user_id = request.from_user.id
+        await bot_limiter.acquire()
+        if action == 'decline':
+            await request.decline()
+            logger.info(f"Заявка от заблокированного пользователя {user_id} отклонена.")
+        else:
+            await request.approve()
+            logger.info(f"Заявка от активного пользователя {user_id} одобрена автоматически.")
+
+    async def _send_for_review(self, users: list[dict]):
+        await bot_limiter.acquire(ADMIN_ID)
+        if len(users) == 1:
+            user = users[0]
+            keyboard = get_approval_keyboard(user['user_id'], user['channel_id'])
+            await self._bot.send_message(ADMIN_ID, format_applicant_message(user), reply_markup=keyboard, parse_mode='HTML')
+            logger.info(f"Заявка от {user['user_id']} отправлена администратору на рассмотрение.")
+            return
+
+        batch_id = review_batches.add(users)
+        text, keyboard = format_review_card(batch_id)
+        await self._bot.send_message(ADMIN_ID, text, reply_markup=keyboard, parse_mode='HTML')
+        logger.info(f"Группа из {len(users)} заявок отправлена администратору на рассмотрение (группа {batch_id}).")
+
+
+join_queue = JoinRequestQueue()
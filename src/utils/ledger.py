@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime
+
+from loguru import logger
+
+from src.config import LEDGER_BATCH_SIZE, LEDGER_FLUSH_INTERVAL, LEDGER_MAX_BUFFER
+from src.database.storage import Storage
+
+EVENT_KINDS = ('grant', 'extend', 'expire', 'ban', 'unban', 'reject')
+
+
+class SubscriptionLedger:
+    """
+    Буфер событий истории подписок с отложенной записью: обработчики только добавляют событие в память,
+    фоновая задача пишет накопленное пачками по таймеру или при заполнении пачки.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = LEDGER_FLUSH_INTERVAL,
+        batch_size: int = LEDGER_BATCH_SIZE,
+        max_buffer: int = LEDGER_MAX_BUFFER,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_buffer = max(self.batch_size, max_buffer)
+        self._events: list[tuple] = []
+        self._dropped = 0
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._db: Storage | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def start(self, db: Storage):
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def record(self, kind: str, channel_id: int, user_id: int, days: int | None = None, end_date: str | None = None):
+        """
+        Добавляет событие в буфер. days=None для истечения подписки означает срок последней выдачи.
+        """
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Неизвестный тип события истории подписок: {kind}")
+        if days is None and kind != 'expire':
+            days = 0
+        created_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+        self._events.append((created_at, channel_id, user_id, kind, days, end_date))
+        if len(self._events) > self.max_buffer:
+            # БД недоступна слишком долго: теряем самые старые события, но не растем в памяти без предела
+            overflow = len(self._events) - self.max_buffer
+            del self._events[:overflow]
+            self._dropped += overflow
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._lock:
+            written = 0
+            # До start() хранилища нет: события ждут в буфере
+            while self._events and self._db is not None:
+                batch = self._events[:self.batch_size]
+                try:
+                    await self._db.append_subscription_events(batch)
+                except Exception as e:
+                    logger.error(f"Не удалось записать {len(batch)} событий истории подписок, повтор при следующей записи: {e}")
+                    break
+                del self._events[:len(batch)]
+                written += len(batch)
+            if self._dropped:
+                logger.warning(f"Буфер истории подписок переполнен, потеряно событий: {self._dropped}.")
+                self._dropped = 0
+            return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+ledger = SubscriptionLedger()
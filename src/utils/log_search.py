@@ -0,0 +1,222 @@
+import glob
+import io
+import json
+import mmap
+import os
+import re
+import zipfile
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from loguru import logger
+
+from src.config import LOG_DIR, LOG_SEARCH_LIMIT
+
+LOG_FILE_NAME = "bot.log"
+# Строки старого текстового формата: "2024-05-01 12:00:00.123 | INFO     | module:func:1 - текст"
+PLAIN_LINE = re.compile(rb"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+) \| (\w+)\s*\|")
+RELATIVE_TIME = re.compile(r"^(\d+)([mhd])$")
+TIME_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+@dataclass
+class LogFilter:
+    since: float | None = None
+    until: float | None = None
+    level: int | None = None
+    substrings: list[bytes] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.since is None and self.until is None and self.level is None and not self.substrings
+
+
+@dataclass
+class LogSearchResult:
+    lines: deque = field(default_factory=lambda: deque(maxlen=LOG_SEARCH_LIMIT))
+    matched: int = 0
+    files: int = 0
+
+
+def _parse_time(value: str, now: datetime) -> float:
+    relative = RELATIVE_TIME.match(value)
+    if relative:
+        amount, unit = relative.groups()
+        return (now - timedelta(**{TIME_UNITS[unit]: int(amount)})).timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"некорректное время: {value!r} (примеры: 30m, 2h, 1d, 2024-05-01T12:00)")
+
+
+def parse_filters(args: list[str]) -> LogFilter:
+    """
+    Разбирает аргументы /log: since=, until=, level=, user= и произвольный текст для поиска подстроки.
+    """
+    now = datetime.now()
+    log_filter = LogFilter()
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        key = key.lower()
+        if not sep or key not in ('since', 'until', 'level', 'user'):
+            log_filter.substrings.append(arg.encode("utf-8"))
+        elif key == 'since':
+            log_filter.since = _parse_time(value, now)
+        elif key == 'until':
+            log_filter.until = _parse_time(value, now)
+        elif key == 'level':
+            try:
+                log_filter.level = logger.level(value.upper()).no
+            except ValueError:
+                raise ValueError(f"неизвестный уровень логов: {value!r}")
+        else:
+            if not value.lstrip('-').isdigit():
+                raise ValueError(f"некорректный user_id: {value!r}")
+            log_filter.substrings.append(value.encode("utf-8"))
+    return log_filter
+
+
+def _parse_line(line: bytes) -> tuple[float, int, str] | None:
+    # (время, номер уровня, текст для выдачи) для строки JSON-лога или старого текстового формата
+    if line.startswith(b"{"):
+        try:
+            record = json.loads(line)["record"]
+            return record["time"]["timestamp"], record["level"]["no"], _record_text(record)
+        except (ValueError, KeyError, TypeError):
+            return None
+    plain = PLAIN_LINE.match(line)
+    if not plain:
+        return None
+    timestamp, level = plain.groups()
+    try:
+        level_no = logger.level(level.decode()).no
+    except ValueError:
+        level_no = 0
+    return datetime.fromisoformat(timestamp.decode()).timestamp(), level_no, line.decode("utf-8", "replace").rstrip()
+
+
+def _record_text(record: dict) -> str:
+    time = datetime.fromtimestamp(record["time"]["timestamp"]).isoformat(sep=" ", timespec="milliseconds")
+    text = f"{time} | {record['level']['name']:<8} | {record['name']}:{record['function']}:{record['line']} - {record['message']}"
+    if record.get("exception"):
+        exception = record["exception"]
+        text += f"\n{exception.get('type')}: {exception.get('value')}"
+    return text
+
+
+def _line_start(buf: mmap.mmap, position: int) -> int:
+    if position == 0:
+        return 0
+    newline = buf.rfind(b"\n", 0, position)
+    return newline + 1
+
+
+def _seek_since(buf: mmap.mmap, since: float) -> int:
+    """
+    Бинарный поиск первой строки не раньше since: записи в файле лога идут по времени.
+    Строки без метки времени (продолжения трейсбеков) пропускаются вперед до ближайшей записи.
+    """
+    low, high = 0, len(buf)
+    while low < high:
+        middle = _line_start(buf, (low + high) // 2)
+        position, parsed = middle, None
+        while position < high and parsed is None:
+            end = buf.find(b"\n", position)
+            end = len(buf) if end == -1 else end
+            parsed = _parse_line(buf[position:end])
+            if parsed is None:
+                position = end + 1
+        if parsed is None or parsed[0] >= since:
+            if middle <= low:
+                break
+            high = middle
+        else:
+            low = buf.find(b"\n", position)
+            if low == -1:
+                return len(buf)
+            low += 1
+    return low
+
+
+def _scan_lines(lines, log_filter: LogFilter, result: LogSearchResult) -> bool:
+    """
+    Проверяет строки по фильтру. Возвращает False, если дальше идут записи позже until.
+    """
+    for line in lines:
+        # Подстроки проверяются до разбора JSON: большинство строк отсеивается без него
+        if log_filter.substrings and not all(substring in line for substring in log_filter.substrings):
+            continue
+        parsed = _parse_line(line)
+        if parsed is None:
+            continue
+        timestamp, level_no, text = parsed
+        # Совпадение могло прийтись на служебные поля JSON (время, номер строки), сверяем с текстом записи
+        if log_filter.substrings and not all(substring.decode("utf-8") in text for substring in log_filter.substrings):
+            continue
+        if log_filter.until is not None and timestamp > log_filter.until:
+            return False
+        if log_filter.since is not None and timestamp < log_filter.since:
+            continue
+        if log_filter.level is not None and level_no < log_filter.level:
+            continue
+        result.matched += 1
+        result.lines.append(text)
+    return True
+
+
+def _mapped_lines(buf: mmap.mmap, start: int):
+    position = start
+    size = len(buf)
+    while position < size:
+        end = buf.find(b"\n", position)
+        end = size if end == -1 else end
+        yield buf[position:end]
+        position = end + 1
+
+
+def _scan_plain(path: str, log_filter: LogFilter, result: LogSearchResult) -> bool:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            start = _seek_since(buf, log_filter.since) if log_filter.since is not None else 0
+            return _scan_lines(_mapped_lines(buf, start), log_filter, result)
+
+
+def _scan_zip(path: str, log_filter: LogFilter, result: LogSearchResult) -> bool:
+    # Сжатые логи нельзя отобразить в память, поэтому читаем их потоком построчно
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            with archive.open(name) as member:
+                lines = (line.rstrip(b"\r\n") for line in io.BufferedReader(member))
+                if not _scan_lines(lines, log_filter, result):
+                    return False
+    return True
+
+
+def log_files(log_dir: str = LOG_DIR) -> list[str]:
+    """
+    Текущий и ротированные файлы логов от старых к новым.
+    """
+    files = glob.glob(os.path.join(log_dir, "*.log")) + glob.glob(os.path.join(log_dir, "*.zip"))
+    return sorted(files, key=lambda path: (os.path.getmtime(path), path))
+
+
+def search_logs(log_filter: LogFilter, log_dir: str = LOG_DIR) -> LogSearchResult:
+    """
+    Ищет записи по фильтру во всех файлах логов. Возвращает последние LOG_SEARCH_LIMIT совпадений.
+    """
+    result = LogSearchResult()
+    for path in log_files(log_dir):
+        # Файл, закрытый до начала окна, целиком старше since
+        if log_filter.since is not None and os.path.getmtime(path) < log_filter.since:
+            continue
+        result.files += 1
+        scan = _scan_zip if path.endswith(".zip") else _scan_plain
+        try:
+            if not scan(path, log_filter, result):
+                break
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.warning(f"Не удалось прочитать файл лога {path}: {e}")
+    return result
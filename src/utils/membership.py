@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import ChatMember
+from loguru import logger
+
+from src.config import MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_NEGATIVE_TTL, MEMBERSHIP_TTL
+from src.utils.rate_limiter import bot_limiter
+
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+
+def is_chat_member(chat_member: ChatMember) -> bool:
+    # restricted - участник с ограничениями: в канале он, пока is_member=True
+    if chat_member.status == 'restricted':
+        return bool(getattr(chat_member, 'is_member', False))
+    return chat_member.status in MEMBER_STATUSES
+
+
+class MembershipCache:
+    """
+    LRU-кэш членства пользователей в каналах по ключу (channel_id, user_id).
+    Заполняется обновлениями chat_member и chat_join_request, действиями самого бота и ответами getChatMember.
+    Отрицательный результат живет меньше положительного: такого пользователя скорее одобрят в обход бота.
+    """
+
+    def __init__(self, max_size: int = MEMBERSHIP_CACHE_SIZE, ttl: float = MEMBERSHIP_TTL, negative_ttl: float = MEMBERSHIP_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[tuple[int, int], tuple[float, bool]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, channel_id: int, user_id: int) -> bool | None:
+        key = (channel_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, channel_id: int, user_id: int, is_member: bool):
+        if self.max_size <= 0:
+            return
+        key = (channel_id, user_id)
+        ttl = self.ttl if is_member else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, is_member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    async def is_member(self, bot: Bot, channel_id: int, user_id: int) -> bool:
+        """
+        Состоит ли пользователь в канале: из кэша, а при промахе - через getChatMember.
+        Если Telegram не знает пользователя или бот не видит канал, считаем, что пользователя в канале нет, и не кэшируем.
+        """
+        cached = self.get(channel_id, user_id)
+        if cached is not None:
+            return cached
+        await bot_limiter.acquire()
+        try:
+            chat_member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            logger.warning(f"Не удалось проверить участие пользователя {user_id} в канале {channel_id}: {e}")
+            return False
+        result = is_chat_member(chat_member)
+        self.set(channel_id, user_id, result)
+        return result
+
+    async def approve_if_not_member(self, bot: Bot, channel_id: int, user_id: int) -> bool:
+        """
+        Одобряет заявку, если пользователь еще не в канале. Возвращает True, если заявка была одобрена.
+        """
+        if await self.is_member(bot, channel_id, user_id):
+            return False
+        await bot_limiter.acquire()
+        try:
+            await bot.approve_chat_join_request(chat_id=channel_id, user_id=user_id)
+        except TelegramBadRequest as e:
+            if "USER_ALREADY_PARTICIPANT" not in str(e):
+                raise
+            # Устаревшая отрицательная запись: пользователь уже в канале
+            self.set(channel_id, user_id, True)
+            return False
+        self.set(channel_id, user_id, True)
+        return True
+
+
+membership = MembershipCache()
@@ -0,0 +1,237 @@
+import bisect
+import functools
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware, Router
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+# Границы корзин гистограмм в секундах: от быстрых запросов к БД до долгих вызовов Bot API
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Перцентили считаются по последним наблюдениям, чтобы память не росла со временем работы бота
+PERCENTILE_WINDOW = 2048
+
+METRICS_HELP = {
+    'bot_handler_seconds': "Время работы обработчиков aiogram",
+    'bot_db_query_seconds': "Время выполнения запросов к БД",
+    'bot_api_request_seconds': "Время выполнения запросов к Bot API",
+    'bot_api_requests': "Запросы к Bot API по методам и результатам",
+    'bot_api_retry_after': "Ответы Bot API с требованием подождать (429)",
+    'bot_api_retry_after_seconds': "Суммарное время ожидания, запрошенное Bot API",
+    'bot_sweep_seconds': "Длительность проверки истекших подписок",
+    'bot_sweep_users': "Пользователи, обработанные проверкой подписок",
+    'bot_sweep_throughput': "Пользователей в секунду при последней проверке подписок",
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Гистограмма OpenMetrics с накопительными корзинами и окном последних значений для перцентилей.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, window: int = PERCENTILE_WINDOW):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self._recent.append(value)
+
+    def percentile(self, q: float) -> float:
+        if not self._recent:
+            return 0.0
+        values = sorted(self._recent)
+        return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+    def samples(self, name: str, labels: tuple) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(float(bound))),))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {self.count}")
+        lines.append(f"{name}_count{_format_labels(labels)} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(self.sum)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в памяти: гистограммы, счетчики и текущие значения с метками.
+    """
+
+    def __init__(self):
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = self._key(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str, **labels):
+        """
+        Декоратор асинхронной функции: время выполнения пишется в гистограмму name.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def histograms(self) -> dict[str, dict[tuple, Histogram]]:
+        return self._histograms
+
+    def counter(self, name: str, **labels) -> float:
+        return self._counters.get(name, {}).get(self._key(labels), 0)
+
+    def counter_total(self, name: str) -> float:
+        return sum(self._counters.get(name, {}).values())
+
+    def clear(self):
+        self._histograms.clear()
+        self._counters.clear()
+        self._gauges.clear()
+
+    def render(self) -> str:
+        """
+        Все метрики в текстовом формате OpenMetrics.
+        """
+        lines = []
+        families = [(name, 'histogram', series) for name, series in self._histograms.items()]
+        families += [(name, 'counter', series) for name, series in self._counters.items()]
+        families += [(name, 'gauge', series) for name, series in self._gauges.items()]
+        for name, metric_type, series in sorted(families, key=lambda family: family[0]):
+            lines.append(f"# TYPE {name} {metric_type}")
+            if name in METRICS_HELP:
+                lines.append(f"# HELP {name} {METRICS_HELP[name]}")
+            for labels, value in sorted(series.items()):
+                if metric_type == 'histogram':
+                    lines.extend(value.samples(name, labels))
+                elif metric_type == 'counter':
+                    lines.append(f"{name}_total{_format_labels(labels)} {_format_value(value)}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware роутера: время работы обработчика по имени роутера и функции.
+    """
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        callback = getattr(handler_object, 'callback', None)
+        handler_name = getattr(callback, '__name__', type(event).__name__)
+        with metrics.timer('bot_handler_seconds', router=self.router_name, handler=handler_name):
+            return await handler(event, data)
+
+
+def setup_router_metrics(router: Router, name: str) -> Router:
+    middleware = HandlerMetricsMiddleware(name)
+    for observer in (router.message, router.callback_query, router.chat_join_request, router.chat_member):
+        observer.middleware(middleware)
+    return router
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: число, длительность и результат каждого запроса к Bot API.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, '__api_method__', type(method).__name__)
+        started = time.perf_counter()
+        result = 'ok'
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            result = 'retry_after'
+            metrics.inc('bot_api_retry_after', method=api_method)
+            metrics.inc('bot_api_retry_after_seconds', e.retry_after, method=api_method)
+            raise
+        except Exception as e:
+            result = type(e).__name__
+            raise
+        finally:
+            metrics.observe('bot_api_request_seconds', time.perf_counter() - started, method=api_method)
+            metrics.inc('bot_api_requests', method=api_method, result=result)
+
+
+def format_perf_lines() -> list[str]:
+    """
+    Строки отчета /perf: перцентили каждой гистограммы, самые медленные серии сначала.
+    """
+    lines = []
+    for name, series in sorted(metrics.histograms().items()):
+        rows = sorted(series.items(), key=lambda item: item[1].percentile(0.95), reverse=True)
+        for labels, histogram in rows:
+            label_text = ", ".join(value for _, value in labels) or "-"
+            lines.append(
+                f"{name} [{label_text}]: n={histogram.count}, "
+                f"p50={histogram.percentile(0.5) * 1000:.1f} мс, "
+                f"p95={histogram.percentile(0.95) * 1000:.1f} мс, "
+                f"p99={histogram.percentile(0.99) * 1000:.1f} мс"
+            )
+    retries = metrics.counter_total('bot_api_retry_after')
+    if retries:
+        lines.append(f"Ответов 429 от Bot API: {int(retries)}")
+    return lines
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+from loguru import logger
+
+from src.config import ADMIN_ID, NOTIFY_FILE_THRESHOLD, NOTIFY_FLUSH_INTERVAL
+from src.utils.rate_limiter import bot_limiter
+
+MESSAGE_LIMIT = 4096
+
+
+def split_messages(lines: list[str], header: str = "", limit: int = MESSAGE_LIMIT) -> list[str]:
+    # Строки длиннее лимита режем на части, остальные не разрываем между сообщениями
+    piece_size = limit - len(header) - 1
+    pieces = []
+    for line in lines:
+        if len(line) > piece_size:
+            pieces.extend(line[i:i + piece_size] for i in range(0, len(line), piece_size))
+        else:
+            pieces.append(line)
+
+    messages = []
+    current = header
+    for piece in pieces:
+        candidate = f"{current}\n{piece}" if current else piece
+        if len(candidate) > limit:
+            messages.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current and current != header:
+        messages.append(current)
+    return messages
+
+
+class NotificationAggregator:
+    """
+    Копит события для администратора и отправляет их сводками: по таймеру или по вызову flush().
+    """
+
+    def __init__(self, chat_id: int, file_threshold: int = NOTIFY_FILE_THRESHOLD, flush_interval: float = NOTIFY_FLUSH_INTERVAL):
+        self.chat_id = chat_id
+        self.file_threshold = file_threshold
+        self.flush_interval = flush_interval
+        self._events: list[str] = []
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def add(self, text: str):
+        self._events.append(text)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сводки уведомлений: {e}")
+
+    async def flush(self, bot: Bot | None = None):
+        bot = bot or self._bot
+        if bot is None:
+            return
+
+        async with self._lock:
+            events, self._events = self._events, []
+            if not events:
+                return
+
+            header = f"📋 Сводка событий ({len(events)}):"
+            try:
+                if len(events) > self.file_threshold:
+                    report = "\n".join(events).encode("utf-8")
+                    filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+                    await bot_limiter.acquire(self.chat_id)
+                    await bot.send_document(self.chat_id, BufferedInputFile(report, filename=filename), caption=header)
+                else:
+                    for text in split_messages(events, header):
+                        await bot_limiter.acquire(self.chat_id)
+                        await bot.send_message(self.chat_id, text, parse_mode=None)
+                logger.info(f"Администратору отправлена сводка из {len(events)} событий.")
+            except Exception as e:
+                logger.error(f"Не удалось отправить сводку из {len(events)} событий администратору: {e}")
+
+
+notifier = NotificationAggregator(ADMIN_ID)
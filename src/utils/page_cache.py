@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+from src.config import LIST_CACHE_SIZE
+
+
+class PageRenderCache:
+    """
+    Отрисованные страницы списков пользователей по ключу (тип списка, страница, курсор) в пределах
+    одной версии данных. При смене версии (запись в БД или новый день) кэш очищается целиком.
+    Также помнит, какая страница показана в каждом сообщении, чтобы не редактировать его тем же содержимым.
+    """
+
+    def __init__(self, max_size: int = LIST_CACHE_SIZE):
+        self.max_size = max_size
+        self._version = None
+        self._pages: OrderedDict[tuple, tuple] = OrderedDict()
+        self._shown: OrderedDict[tuple[int, int], tuple] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._version = version
+            self._pages.clear()
+
+    def get(self, version, key: tuple) -> tuple | None:
+        self._check_version(version)
+        page = self._pages.get(key)
+        if page is None:
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return page
+
+    def peek(self, version, key: tuple) -> tuple | None:
+        # Без учета в статистике и без продления жизни записи
+        return self._pages.get(key) if version == self._version else None
+
+    def put(self, version, key: tuple, page: tuple):
+        # Страница, отрисованная по устаревшей версии, пока параллельно шла запись, не попадает в кэш
+        if self.max_size <= 0 or version != self._version:
+            return
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_size:
+            self._pages.popitem(last=False)
+
+    def is_shown(self, chat_id: int, message_id: int, version, page_id: tuple) -> bool:
+        return self._shown.get((chat_id, message_id)) == (version, page_id)
+
+    def mark_shown(self, chat_id: int, message_id: int, version, page_id: tuple):
+        if self.max_size <= 0:
+            return
+        self._shown[(chat_id, message_id)] = (version, page_id)
+        self._shown.move_to_end((chat_id, message_id))
+        while len(self._shown) > self.max_size:
+            self._shown.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._pages),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+list_page_cache = PageRenderCache()
@@ -0,0 +1,74 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from loguru import logger
+
+from src.config import PIPELINE_CONCURRENCY, PIPELINE_MAX_RETRIES
+from src.utils.rate_limiter import RateLimiter, bot_limiter
+
+MAX_BACKOFF_SECONDS = 30
+
+
+@dataclass
+class PipelineResult:
+    succeeded: list = field(default_factory=list)
+    failed: list = field(default_factory=list)
+    retried: int = 0
+
+
+async def run_bot_actions(
+    items: Iterable[Any],
+    action: Callable[[Any], Awaitable[None]],
+    *,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    max_retries: int = PIPELINE_MAX_RETRIES,
+    limiter: RateLimiter = bot_limiter,
+    label: Callable[[Any], Any] = repr,
+) -> PipelineResult:
+    """
+    Выполняет action для каждого элемента несколькими воркерами с повторами при ошибках Bot API.
+    Лимиты запросов соблюдает сам action через limiter.acquire().
+    """
+    result = PipelineResult()
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            attempt = 0
+            while True:
+                try:
+                    await action(item)
+                    result.succeeded.append(item)
+                    break
+                except TelegramRetryAfter as e:
+                    delay = e.retry_after
+                    limiter.pause(delay)
+                    logger.warning(f"Превышен лимит запросов Telegram, пауза {delay} с.")
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    delay = min(2 ** attempt, MAX_BACKOFF_SECONDS)
+                    logger.warning(f"Временная ошибка Telegram: {e}. Повтор через {delay} с.")
+                except Exception as e:
+                    logger.error(f"Не удалось выполнить действие для {label(item)}: {e}")
+                    result.failed.append(item)
+                    break
+
+                if attempt >= max_retries:
+                    logger.error(f"Исчерпаны попытки ({max_retries}) для {label(item)}.")
+                    result.failed.append(item)
+                    break
+                attempt += 1
+                result.retried += 1
+                await asyncio.sleep(delay)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, queue.qsize())))]
+    await asyncio.gather(*workers)
+    return result
@@ -1,65 +1,173 @@
+import asyncio
+import time
 from datetime import datetime, timedelta, timezone
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from loguru import logger
 
-from src.config import CHANNEL_ID, ADMIN_ID
-from src.database import database as db
-from src.utils.user_utils import get_user_mention
+from src.config import CHANNEL_IDS, ADMIN_ID
+from src.database.storage import Storage
+from src.utils.user_utils import get_user_mention, get_channel_note
+from src.utils.pipeline import PipelineResult, run_bot_actions
+from src.utils.rate_limiter import bot_limiter
+from src.utils.notifier import notifier
+from src.utils.ledger import ledger
+from src.utils.metrics import metrics
+from src.utils.membership import membership
 
-async def check_subscriptions_with_stats(bot: Bot, admin_chat_id: int = ADMIN_ID):
+
+async def remove_expired_user(bot: Bot, user: dict):
+    user_id, channel_id = user['user_id'], user['channel_id']
+    logger.info(f"Подписка для пользователя {user_id} в канале {channel_id} истекла. Удаление...")
+    await bot_limiter.acquire()
+    await bot.ban_chat_member(chat_id=channel_id, user_id=user_id)
+    # Сразу разблокируем, чтобы просто удалить, а не заблокировать
+    await bot_limiter.acquire()
+    await bot.unban_chat_member(chat_id=channel_id, user_id=user_id)
+    membership.set(channel_id, user_id, False)
+    logger.info(f"Пользователь {user_id} удален из канала {channel_id}.")
+
+
+# Один запуск удаления за раз: таймеры, ежедневная проверка и продолжение после перезапуска не пересекаются
+_sweep_lock = asyncio.Lock()
+
+
+async def expire_users(bot: Bot, db: Storage, users: list[dict]) -> tuple[PipelineResult, int]:
+    """
+    Удаляет пользователей с истекшей подпиской из их каналов и переводит их в статус expired.
+    Шаги записываются в журнал проверок, поэтому прерванный запуск можно продолжить.
+    Возвращает результат конвейера и количество пользователей, чей статус обновлен.
+    """
+    if not users:
+        return PipelineResult(), 0
+    async with _sweep_lock:
+        run_id = await db.create_sweep_run(users)
+        result, expired_count, _ = await _process_sweep_run(bot, db, run_id)
+        return result, expired_count
+
+
+async def resume_interrupted_sweep(bot: Bot, db: Storage) -> tuple[PipelineResult, int, int]:
+    """
+    Доводит до конца запуск, прерванный остановкой процесса: уже удаленных из канала пользователей
+    только переводит в expired, остальных удаляет заново.
+    Кроме результата конвейера и количества обновленных статусов возвращает, скольких пользователей
+    из журнала запуск обработал.
+    """
+    async with _sweep_lock:
+        run_id = await db.get_unfinished_sweep_run()
+        if run_id is None:
+            return PipelineResult(), 0, 0
+        logger.info(f"Найдена незавершенная проверка подписок #{run_id}, продолжение...")
+        result, expired_count, processed = await _process_sweep_run(bot, db, run_id)
+        logger.info(f"Проверка подписок #{run_id} завершена: удалено {expired_count}, ошибок {len(result.failed)}.")
+        return result, expired_count, processed
+
+
+async def _remove_and_mark(bot: Bot, db: Storage, run_id: int, user: dict):
+    await remove_expired_user(bot, user)
+    await db.mark_sweep_steps(run_id, [(user['channel_id'], user['user_id'])], 'kicked')
+
+
+async def _process_sweep_run(bot: Bot, db: Storage, run_id: int) -> tuple[PipelineResult, int, int]:
+    journal = await db.get_sweep_journal(run_id)
+    today = datetime.now().date().isoformat()
+    # Удаленные из канала в прошлый раз пользователи повторно в Bot API не отправляются
+    kicked = [user for user in journal if user['step'] == 'kicked']
+    pending, skipped = [], []
+    for user in journal:
+        if user['step'] != 'pending':
+            continue
+        # Пока запуск был прерван, подписку могли продлить или пользователя заблокировать
+        if user['status'] == 'active' and (user.get('subscription_end_date') or '') < today:
+            pending.append(user)
+        else:
+            skipped.append((user['channel_id'], user['user_id']))
+    await db.mark_sweep_steps(run_id, skipped, 'skipped')
+
+    result = await run_bot_actions(
+        pending,
+        lambda user: _remove_and_mark(bot, db, run_id, user),
+        label=lambda user: f"{user['user_id']} (канал {user['channel_id']})",
+    )
+    await db.mark_sweep_steps(run_id, [(user['channel_id'], user['user_id']) for user in result.failed], 'failed')
+
+    expired_count = 0
+    for channel_id in CHANNEL_IDS:
+        removed_users = {user['user_id']: user for user in kicked + result.succeeded if user['channel_id'] == channel_id}
+        if not removed_users:
+            continue
+        expired_ids = await db.complete_sweep_users(run_id, channel_id, list(removed_users))
+        expired_count += len(expired_ids)
+        for user_id in expired_ids:
+            ledger.record('expire', channel_id, user_id, end_date=removed_users[user_id].get('subscription_end_date'))
+            user_mention = get_user_mention(removed_users[user_id])
+            notifier.add(f"Пользователь ID: {user_id} {user_mention} удален из канала{get_channel_note(channel_id, html=False)}, статус обновлен на 'expired'.")
+    await db.finish_sweep_run(run_id)
+    return result, expired_count, len(kicked) + len(pending) + len(skipped)
+
+
+async def check_subscriptions_with_stats(bot: Bot, db: Storage, admin_chat_id: int = ADMIN_ID):
 
     logger.info("Запущена проверка подписок...")
+    started = time.perf_counter()
     
     try:
-        active_users = await db.get_users_by_status('active')
-        total_active_before = len(active_users)
-        today = datetime.now().date()
-        expired_count = 0
+        total_active_before = await db.count_users_by_status('active')
+        today = datetime.now().date().isoformat()
 
-        for user in active_users:
-            user_id = user['user_id']
+        for user in await db.get_users_with_invalid_end_date('active'):
             end_date_str = user.get('subscription_end_date')
-            
             if not end_date_str:
-                logger.warning(f"У активного пользователя {user_id} отсутствует дата окончания подписки.")
-                continue
-
-            try:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                if end_date < today:
-                    logger.info(f"Подписка для пользователя {user_id} истекла. Удаление...")
-                    await bot.ban_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-                    # Сразу разблокируем, чтобы просто удалить, а не заблокировать
-                    await bot.unban_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-                    await db.update_user_status(user_id, 'expired')
-                    expired_count += 1
-                    logger.info(f"Пользователь {user_id} удален из канала, статус обновлен на 'expired'.")
-                    await bot.send_message(admin_chat_id, f"Пользователь ID: {user_id} {get_user_mention(user)} удален из канала, статус обновлен на 'expired'.")
-            except ValueError:
-                logger.error(f"Неверный формат даты '{end_date_str}' для пользователя {user_id}.")
-            except Exception as e:
-                logger.error(f"Не удалось удалить пользователя {user_id} из канала: {e}")
+                logger.warning(f"У активного пользователя {user['user_id']} отсутствует дата окончания подписки.")
+            else:
+                logger.error(f"Неверный формат даты '{end_date_str}' для пользователя {user['user_id']}.")
+
+        # Сначала доводим до конца запуск, прерванный остановкой бота
+        resumed, resumed_count, resumed_processed = await resume_interrupted_sweep(bot, db)
+
+        # Истекшие подписки собираем по всем каналам и удаляем одним конвейером с общим лимитом запросов
+        expired_users = []
+        for channel_id in CHANNEL_IDS:
+            expired_users.extend(await db.get_expired_users(today, channel_id))
+        result, expired_count = await expire_users(bot, db, expired_users)
+        result.succeeded.extend(resumed.succeeded)
+        result.failed.extend(resumed.failed)
+        result.retried += resumed.retried
+        expired_count += resumed_count
+        await notifier.flush(bot)
+
+        duration = time.perf_counter() - started
+        # Пользователи прерванного запуска тоже обработаны в этой проверке и входят в пропускную способность
+        processed = len(expired_users) + resumed_processed
+        metrics.observe('bot_sweep_seconds', duration)
+        metrics.inc('bot_sweep_users', len(result.succeeded), result='removed')
+        metrics.inc('bot_sweep_users', len(result.failed), result='failed')
+        metrics.set('bot_sweep_throughput', processed / duration if duration > 0 else 0)
+        resumed_note = f" (из них из прерванной проверки: {resumed_processed})" if resumed_processed else ""
+        logger.info(f"Удаление истекших подписок заняло {duration:.1f} с, обработано пользователей: {processed}{resumed_note}.")
 
         # Статистика
-        updated_active_users = await db.get_users_by_status('active')
-        total_active_after = len(updated_active_users)
+        total_active_after = await db.count_users_by_status('active')
         
         stats = {
             'message': '',
             'total_before': total_active_before,
             'total_after': total_active_after,
             'expired_count': expired_count,
+            'retried_count': result.retried,
+            'failed_count': len(result.failed),
             'success': True
         }
         
-        if expired_count > 0:
+        if expired_count > 0 or result.failed:
             stats_message = (
                 f"✅ Проверка подписок завершена!\n\n"
                 f"📊 Статистика:\n"
                 f"• Было активных: {total_active_before}\n"
                 f"• Стало активных: {total_active_after}\n"
-                f"• Истекших подписок: {expired_count}\n\n"
+                f"• Истекших подписок: {expired_count}\n"
+                f"• Повторных попыток: {result.retried}\n"
+                f"• Не удалось удалить: {len(result.failed)}\n\n"
                 f"Пользователи с истекшими подписками были удалены из канала."
             )
         else:
@@ -96,12 +204,13 @@ async def check_subscriptions_with_stats(bot: Bot, admin_chat_id: int = ADMIN_ID
         
         return error_stats
 
-async def scheduled_check_subscriptions(bot: Bot):
+async def scheduled_check_subscriptions(bot: Bot, db: Storage):
+    # Подписки удаляются таймерами в момент истечения, ежедневная проверка подстраховывает их
     logger.info("Запущена автоматическая ежедневная проверка подписок...")
-    await check_subscriptions_with_stats(bot)
+    await check_subscriptions_with_stats(bot, db)
 
-def setup_scheduler(bot: Bot):
+def setup_scheduler(bot: Bot, db: Storage):
     scheduler = AsyncIOScheduler(timezone=timezone(timedelta(hours=3)))
-    scheduler.add_job(scheduled_check_subscriptions, 'cron', hour=4, minute=0, args=(bot,))
+    scheduler.add_job(scheduled_check_subscriptions, 'cron', hour=4, minute=0, args=(bot, db))
     scheduler.start()
-    logger.info("Планировщик задач запущен. Проверка будет выполняться ежедневно в 4:00 по МСК с отправкой статистики администратору.") 
\ No newline at end of file
+    logger.info("Планировщик задач запущен. Страховочная проверка будет выполняться ежедневно в 4:00 по МСК с отправкой статистики администратору.") 
\ No newline at end of file
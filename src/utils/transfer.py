@@ -0,0 +1,205 @@
+import asyncio
+import csv
+import gzip
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from itertools import islice
+
+from loguru import logger
+
+from src.config import CHANNEL_ID, CHANNEL_IDS
+from src.database.database import IMPORT_COLUMNS
+from src.database.storage import Storage
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_BATCH_SIZE = 2000
+# Уровень 9 (по умолчанию в gzip) в несколько раз медленнее при почти том же размере файла
+EXPORT_COMPRESS_LEVEL = 5
+IMPORT_CHUNK_SIZE = 5000
+USER_STATUSES = ('pending', 'active', 'expired', 'rejected', 'banned')
+# Сколько ошибок валидации хранить для отчета, остальные только считаются
+MAX_REPORTED_ERRORS = 1000
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def export_filename(fmt: str) -> str:
+    return f"users_{datetime.now():%Y%m%d_%H%M%S}.{fmt}.gz"
+
+
+async def export_users(db: Storage, path: str, fmt: str = 'csv') -> int:
+    """
+    Пишет таблицу users в сжатый gzip файл порциями из курсора БД. Возвращает число строк.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=EXPORT_COMPRESS_LEVEL) as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=IMPORT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            write_batch = writer.writerows
+        else:
+            def write_batch(batch: list[dict]):
+                f.write("".join(
+                    json.dumps({column: user[column] for column in IMPORT_COLUMNS}, ensure_ascii=False) + "\n"
+                    for user in batch
+                ))
+
+        # Сериализация и сжатие - синхронная работа: выносим ее в поток и пишем порцию,
+        # пока из БД читается следующая
+        writing = None
+        async for batch in db.iter_users(EXPORT_BATCH_SIZE):
+            if writing is not None:
+                await writing
+            writing = asyncio.ensure_future(asyncio.to_thread(write_batch, batch))
+            count += len(batch)
+        if writing is not None:
+            await writing
+    logger.info(f"Выгружено {count} пользователей в {path} ({fmt}).")
+    return count
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    processed: int = 0
+    error_count: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _optional(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_row(raw: dict) -> tuple:
+    """
+    Проверяет строку импорта и приводит ее к порядку IMPORT_COLUMNS. Ошибки - ValueError.
+    """
+    try:
+        user_id = int(raw.get('user_id'))
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректный user_id: {raw.get('user_id')!r}")
+
+    channel_id = _optional(raw.get('channel_id'))
+    if channel_id is None:
+        # Выгрузки из одноканальной системы относим к основному каналу
+        channel_id = CHANNEL_ID
+    else:
+        try:
+            channel_id = int(channel_id)
+        except ValueError:
+            raise ValueError(f"некорректный channel_id: {channel_id!r}")
+        if channel_id not in CHANNEL_IDS:
+            raise ValueError(f"канал {channel_id} не обслуживается ботом")
+
+    username = _optional(raw.get('username'))
+    if username:
+        username = username.lstrip('@').lower()
+
+    full_name = _optional(raw.get('full_name'))
+    if full_name is None:
+        raise ValueError("пустой full_name")
+
+    status = _optional(raw.get('status')) or 'pending'
+    if status not in USER_STATUSES:
+        raise ValueError(f"неизвестный статус: {status!r}")
+
+    end_date = _optional(raw.get('subscription_end_date'))
+    if end_date is not None:
+        try:
+            end_date = date.fromisoformat(end_date).isoformat()
+        except ValueError:
+            raise ValueError(f"некорректная дата окончания подписки: {end_date!r}")
+    if status == 'active' and end_date is None:
+        raise ValueError("у активного пользователя нет даты окончания подписки")
+
+    last_application_date = _optional(raw.get('last_application_date'))
+    if last_application_date is not None:
+        try:
+            datetime.fromisoformat(last_application_date)
+        except ValueError:
+            raise ValueError(f"некорректная дата заявки: {last_application_date!r}")
+
+    return channel_id, user_id, username, full_name, status, end_date, last_application_date
+
+
+def _open_text(path: str):
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+def _read_records(f, fmt: str):
+    # (номер строки, словарь или ошибка разбора)
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f"некорректный JSON: {e.msg}")
+            continue
+        yield line_number, record if isinstance(record, dict) else ValueError("строка JSON должна быть объектом")
+
+
+def detect_format(file_name: str) -> str:
+    name = file_name.lower().removesuffix('.gz')
+    if name.endswith(('.jsonl', '.json', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    raise ValueError("поддерживаются файлы .csv и .jsonl, в том числе сжатые gzip")
+
+
+async def import_users_file(db: Storage, path: str, fmt: str, progress=None, chunk_size: int = IMPORT_CHUNK_SIZE) -> ImportReport:
+    """
+    Загружает пользователей из файла пачками по chunk_size строк, каждая пачка - отдельная транзакция.
+    progress - необязательная корутина, вызываемая с отчетом после каждой пачки.
+    """
+    report = ImportReport()
+
+    with _open_text(path) as f:
+        records = _read_records(f, fmt)
+
+        def next_chunk() -> tuple[list[tuple], int]:
+            rows, processed = [], 0
+            for line_number, record in islice(records, chunk_size):
+                processed += 1
+                if isinstance(record, Exception):
+                    report.add_error(line_number, str(record))
+                    continue
+                try:
+                    rows.append(validate_row(record))
+                except ValueError as e:
+                    report.add_error(line_number, str(e))
+            return rows, processed
+
+        while True:
+            # Чтение, распаковка и проверка пачки идут в потоке, чтобы не блокировать бота
+            rows, processed = await asyncio.to_thread(next_chunk)
+            if not processed:
+                break
+            report.processed += processed
+            report.imported += await db.import_users(rows)
+            if progress is not None:
+                await progress(report)
+
+    logger.info(f"Импорт из {path}: загружено {report.imported}, ошибок {report.error_count}.")
+    return report
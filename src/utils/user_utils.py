@@ -1,5 +1,7 @@
 from aiogram.types import User
 
+from src.config import CHANNEL_IDS
+
 def get_user_mention(user: User | dict) -> str:
     if isinstance(user, dict):
         # Если это словарь из нашей БД
@@ -12,4 +14,14 @@ def get_user_mention(user: User | dict) -> str:
 
     if username:
         return f"@{username}"
-    return full_name 
\ No newline at end of file
+    return full_name 
+
+
+def get_channel_note(channel_id: int, html: bool = True) -> str:
+    # Канал указываем только если бот обслуживает несколько каналов.
+    # html=False - для текста без разметки, например уведомлений notifier
+    if len(CHANNEL_IDS) < 2:
+        return ""
+    if not html:
+        return f" [канал {channel_id}]"
+    return f" [канал <code>{channel_id}</code>]"
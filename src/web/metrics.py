@@ -0,0 +1,37 @@
+from aiohttp import web
+from loguru import logger
+
+from src.config import METRICS_HOST, METRICS_PATH, METRICS_PORT
+from src.utils.metrics import metrics
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class MetricsServer:
+    """
+    Отдельный aiohttp-сервер, отдающий метрики бота в текстовом формате OpenMetrics.
+    """
+
+    def __init__(self, path: str = METRICS_PATH):
+        self.path = path
+        self._runner: web.AppRunner | None = None
+        self.app = web.Application()
+        self.app.router.add_get(path, self.handle_metrics)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self._runner = web.AppRunner(self.app, handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Метрики доступны на {host}:{port}{self.path}")
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        await self._runner.cleanup()
+        self._runner = None
+
+
+metrics_server = MetricsServer()
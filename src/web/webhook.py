@@ -0,0 +1,110 @@
+import asyncio
+import hmac
+import signal
+from contextlib import suppress
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from loguru import logger
+from pydantic import ValidationError
+
+from src.config import (
+    WEBHOOK_HOST, WEBHOOK_MAX_CONCURRENCY, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL,
+)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    aiohttp-сервер, принимающий обновления от Telegram и передающий их в Dispatcher.feed_update.
+    Ответ отправляется сразу, обработка идет в фоне с ограничением числа одновременных обновлений.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, path: str = WEBHOOK_PATH, secret: str | None = WEBHOOK_SECRET, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY):
+        if not secret:
+            raise ValueError("Webhook-сервер не запускается без секретного токена WEBHOOK_SECRET")
+        self.bot = bot
+        self.dp = dp
+        self.path = path
+        self.secret = secret
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._runner: web.AppRunner | None = None
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            logger.warning(f"Отклонен запрос к webhook с неверным секретным токеном от {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (ValueError, ValidationError) as e:
+            logger.warning(f"Получено некорректное обновление на webhook: {e}")
+            return web.Response(status=400)
+
+        # При достижении лимита ждем свободного места, не отвечая Telegram: это и есть обратное давление
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process_update(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process_update(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+        self._runner = web.AppRunner(self.app, handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook-сервер запущен на {host}:{port}{self.path}")
+
+    async def stop(self, timeout: float = 30):
+        if self._runner is None:
+            return
+        # Сначала перестаем принимать новые обновления, затем дожидаемся уже принятых
+        for site in list(self._runner.sites):
+            await site.stop()
+        if self._tasks:
+            logger.info(f"Ожидание завершения обработки {len(self._tasks)} обновлений...")
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        await self._runner.cleanup()
+        self._runner = None
+        logger.info("Webhook-сервер остановлен.")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    server = WebhookServer(bot, dp)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    with suppress(NotImplementedError):
+        # На Windows обработчики сигналов не поддерживаются
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+        loop.add_signal_handler(signal.SIGINT, stop_event.set)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+    await server.start()
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info(f"Webhook зарегистрирован в Telegram: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            logger.warning("WEBHOOK_URL не задан: webhook не зарегистрирован в Telegram, сервер принимает только локальные запросы.")
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# src.config требует переменные окружения бота: для тестов достаточно заглушек, к Telegram тесты не обращаются
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "-1001,-1002")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+"""
+Кэш отрисованных страниц списков живет в пределах поколения данных хранилища: его сбрасывает только запись
+в users, а запись истории подписок (сброс буфера SubscriptionLedger) страницы не меняет и кэш не трогает.
+"""
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from loguru import logger
+
+from src.database.database import SQLiteStorage
+from src.database.memory import MemoryStorage
+from src.handlers.admin_commands import render_users_page
+from src.utils.ledger import SubscriptionLedger
+from src.utils.page_cache import list_page_cache
+
+CHANNEL_ID = -1001
+
+
+def _storage(kind: str, tmp_path):
+    if kind == 'sqlite':
+        return SQLiteStorage(str(tmp_path / "pages.db"), readers=1, cache_size=0)
+    return MemoryStorage()
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "memory"])
+def test_ledger_flush_keeps_cached_pages(tmp_path, kind):
+    async def run():
+        storage = _storage(kind, tmp_path)
+        await storage.open()
+        ledger = SubscriptionLedger()
+        try:
+            end_date = (date.today() + timedelta(days=30)).isoformat()
+            for user_id in range(1, 6):
+                await storage.upsert_user(CHANNEL_ID, user_id, f"Пользователь {user_id}", f"user{user_id}")
+                await storage.update_subscription(user_id, end_date, CHANNEL_ID)
+
+            await render_users_page(storage, 'all')
+            generation, misses = storage.generation, list_page_cache.misses
+
+            ledger.start(storage)
+            ledger.record('grant', CHANNEL_ID, 1, 30, end_date)
+            assert await ledger.flush() == 1
+            assert storage.generation == generation
+            await render_users_page(storage, 'all')
+            assert list_page_cache.misses == misses, "запись истории подписок сбросила кэш страниц"
+
+            await storage.update_user_status(2, 'banned', CHANNEL_ID)
+            assert storage.generation != generation
+            await render_users_page(storage, 'all')
+            assert list_page_cache.misses == misses + 1, "запись в users не сбросила кэш страниц"
+        finally:
+            await ledger.close()
+            await storage.close()
+
+    logger.disable("src")
+    try:
+        asyncio.run(run())
+    finally:
+        logger.enable("src")
@@ -0,0 +1,158 @@
+"""
+Планы запросов к users на мигрированной БД (EXPLAIN QUERY PLAN): списки, счетчики, поиск пользователя и проверка
+подписок должны идти по индексам - без полного сканирования таблицы, а списки и проверка еще и без сортировки
+во временном B-дереве. Проверяются запросы, которые хранилище выполняет на самом деле: они перехватываются
+через trace callback соединений пула.
+"""
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from loguru import logger
+
+from src.database.database import SQLiteStorage
+from src.handlers.admin_commands import LIST_FILTERS
+
+CHANNELS = (-1001, -1002)
+STATUSES = ('active', 'expired', 'pending', 'banned')
+ROWS = 400
+TODAY = date.today()
+
+
+def _dataset() -> list[tuple]:
+    rows = []
+    for i in range(1, ROWS + 1):
+        end_date = None if i % 7 == 0 else (TODAY + timedelta(days=i % 60 - 20)).isoformat()
+        applied_at = f"{TODAY - timedelta(days=i % 30)} 12:00:00"
+        rows.append((CHANNELS[i % 2], i, f"user{i}", f"Пользователь {i}", STATUSES[i % 4], end_date, applied_at))
+    return rows
+
+
+def collect_plans(tmp_path, call) -> dict[str, list[str]]:
+    """
+    Выполняет call(storage) на заполненной БД и возвращает {SQL запроса: строки плана} для всех выполненных SELECT.
+    """
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "plans.db"), readers=1, cache_size=0)
+        await storage.open()
+        try:
+            await storage.import_users(_dataset())
+            pool = storage._get_pool()
+            connections = [pool._writer, *pool._all_readers]
+            statements = []
+            for conn in connections:
+                await conn.set_trace_callback(statements.append)
+            await call(storage)
+            for conn in connections:
+                await conn.set_trace_callback(None)
+
+            plans = {}
+            async with pool.reader() as db:
+                for sql in statements:
+                    if not sql.lstrip().upper().startswith("SELECT"):
+                        continue
+                    cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}")
+                    plans[sql] = [row['detail'] for row in await cursor.fetchall()]
+            return plans
+        finally:
+            await storage.close()
+
+    logger.disable("src")
+    try:
+        plans = asyncio.run(run())
+    finally:
+        logger.enable("src")
+    assert plans, "хранилище не выполнило ни одного SELECT"
+    return plans
+
+
+def users_lines(plans: dict[str, list[str]]) -> list[str]:
+    return [line for lines in plans.values() for line in lines if " users " in f"{line} "]
+
+
+def assert_no_full_scan(plans: dict[str, list[str]]):
+    # "SCAN users USING INDEX" - чтение по индексу в нужном порядке, полное сканирование - "SCAN users" без индекса
+    for sql, lines in plans.items():
+        full_scans = [line for line in lines if line.startswith("SCAN users") and "INDEX" not in line]
+        assert not full_scans, f"полное сканирование users:\n{sql}\n{lines}"
+
+
+def assert_no_temp_sort(plans: dict[str, list[str]]):
+    for sql, lines in plans.items():
+        assert not [line for line in lines if "TEMP B-TREE" in line], f"сортировка во временном B-дереве:\n{sql}\n{lines}"
+
+
+PAGE_KEYSETS = [
+    None,
+    ((TODAY + timedelta(days=5)).isoformat(), 200),
+    (None, 70),
+]
+
+
+@pytest.mark.parametrize("list_type", sorted(LIST_FILTERS))
+@pytest.mark.parametrize("keyset", PAGE_KEYSETS, ids=["first", "date", "null-date"])
+@pytest.mark.parametrize("forward", [True, False], ids=["next", "prev"])
+def test_list_pages_use_index(tmp_path, list_type, keyset, forward):
+    if keyset is None and not forward:
+        pytest.skip("первая страница листается только вперед")
+    if keyset is not None and keyset[0] is None and 'expiring_days' in LIST_FILTERS[list_type]:
+        pytest.skip("в списке истекающих подписок нет пустых дат, такого курсора не бывает")
+    plans = collect_plans(
+        tmp_path,
+        lambda storage: storage.get_users_page(keyset=keyset, forward=forward, limit=20, **LIST_FILTERS[list_type]),
+    )
+    assert_no_full_scan(plans)
+    assert_no_temp_sort(plans)
+    if keyset is not None:
+        # Страница после курсора начинается с поиска по индексу, а не с его просмотра от начала
+        lines = users_lines(plans)
+        assert lines and all(line.startswith("SEARCH users") for line in lines), lines
+
+
+def test_counts_use_counters(tmp_path):
+    async def call(storage):
+        await storage.count_users_by_status('active')
+        await storage.count_users_by_status('active', CHANNELS[0])
+        await storage.get_status_counts()
+        await storage.get_expiry_counts(TODAY.isoformat(), (TODAY + timedelta(days=10)).isoformat(), CHANNELS[1])
+
+    plans = collect_plans(tmp_path, call)
+    assert not users_lines(plans), plans
+
+
+@pytest.mark.parametrize("lookup", [
+    lambda storage: storage.get_user(10, CHANNELS[0]),
+    lambda storage: storage.get_user_channels(10),
+    lambda storage: storage.get_users_by_ids([10, 12, 14], CHANNELS[0]),
+    lambda storage: storage.find_user_by_id_or_username("10"),
+    lambda storage: storage.find_user_by_id_or_username("@user10"),
+    lambda storage: storage.find_user_by_id_or_username("@user10", CHANNELS[0]),
+    lambda storage: storage.find_users([10, 11], ["user12", "user13"]),
+], ids=["get_user", "user_channels", "by_ids", "by_id", "by_username", "by_username_channel", "find_users"])
+def test_lookups_use_index(tmp_path, lookup):
+    # Строки одного пользователя (по одной на канал) могут сортироваться во временном B-дереве: их единицы
+    plans = collect_plans(tmp_path, lookup)
+    assert_no_full_scan(plans)
+    lines = users_lines(plans)
+    assert lines and all(line.startswith("SEARCH users") for line in lines), lines
+
+
+@pytest.mark.parametrize("channel_id", CHANNELS)
+def test_expired_sweep_uses_index(tmp_path, channel_id):
+    plans = collect_plans(tmp_path, lambda storage: storage.get_expired_users(TODAY.isoformat(), channel_id))
+    assert_no_full_scan(plans)
+    assert_no_temp_sort(plans)
+    assert all(line.startswith("SEARCH users") for line in users_lines(plans))
+
+
+def test_expiring_soon_uses_index(tmp_path):
+    plans = collect_plans(tmp_path, lambda storage: storage.get_users_expiring_soon('active', 10))
+    assert_no_full_scan(plans)
+    assert_no_temp_sort(plans)
+
+
+def test_distinct_users_uses_index(tmp_path):
+    # Разных пользователей счетчики не знают: подсчет идет по индексу user_id, а не по строкам таблицы
+    plans = collect_plans(tmp_path, lambda storage: storage.count_distinct_users())
+    assert_no_full_scan(plans)
+    assert all("COVERING INDEX idx_users_user_id" in line for line in users_lines(plans)), plans
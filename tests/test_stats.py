@@ -0,0 +1,39 @@
+"""
+/stats по всем каналам: пользователь из нескольких каналов входит в общий итог один раз,
+а итоги каналов показываются отдельно.
+"""
+import asyncio
+
+import pytest
+from loguru import logger
+
+from src.database.database import SQLiteStorage
+from src.database.memory import MemoryStorage
+from src.handlers.admin_commands import format_stats
+
+CHANNELS = (-1001, -1002)
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "memory"])
+def test_total_counts_each_user_once(tmp_path, kind):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "stats.db"), readers=1, cache_size=0) if kind == 'sqlite' else MemoryStorage()
+        await storage.open()
+        try:
+            await storage.upsert_user(CHANNELS[0], 1, "Первый", "first")
+            await storage.upsert_user(CHANNELS[1], 1, "Первый", "first")
+            await storage.upsert_user(CHANNELS[1], 2, "Второй", "second")
+            return await format_stats(storage), await format_stats(storage, CHANNELS[1])
+        finally:
+            await storage.close()
+
+    logger.disable("src")
+    try:
+        overall, channel = asyncio.run(run())
+    finally:
+        logger.enable("src")
+    assert "Всего пользователей: <b>2</b>" in overall
+    assert f"В канале <code>{CHANNELS[0]}</code>: 1" in overall
+    assert f"В канале <code>{CHANNELS[1]}</code>: 2" in overall
+    assert "⏳ Ожидают решения: 3" in overall
+    assert "Всего пользователей: <b>2</b>" in channel
@@ -0,0 +1,61 @@
+"""
+username уникален в Telegram: после миграций база не дает записать его второму пользователю ни в одном канале
+и не принимает username не в нижнем регистре, а хранилище при записи освобождает его у прежнего владельца.
+"""
+import asyncio
+
+import aiosqlite
+import pytest
+from loguru import logger
+
+from src.database.database import SQLiteStorage
+
+CHANNELS = (-1001, -1002)
+
+
+def run_with_storage(tmp_path, call):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "usernames.db"), readers=1, cache_size=0)
+        await storage.open()
+        try:
+            return await call(storage)
+        finally:
+            await storage.close()
+
+    logger.disable("src")
+    try:
+        return asyncio.run(run())
+    finally:
+        logger.enable("src")
+
+
+def test_upsert_moves_username_between_channels(tmp_path):
+    async def call(storage):
+        await storage.upsert_user(CHANNELS[0], 1, "Первый", "bob")
+        await storage.upsert_user(CHANNELS[0], 2, "Второй", "amy")
+        await storage.upsert_user(CHANNELS[1], 2, "Второй", "Bob")
+        return await storage.find_users([1, 2], [])
+
+    rows = run_with_storage(tmp_path, call)
+    assert {(row['channel_id'], row['user_id']): row['username'] for row in rows} == {
+        (CHANNELS[0], 1): None,
+        (CHANNELS[0], 2): "amy",
+        (CHANNELS[1], 2): "bob",
+    }
+
+
+@pytest.mark.parametrize("channel_id, user_id, username", [
+    (CHANNELS[1], 2, "bob"),
+    (CHANNELS[1], 1, "Bob"),
+], ids=["other_user", "upper_case"])
+def test_database_rejects_bad_username(tmp_path, channel_id, user_id, username):
+    async def call(storage):
+        await storage.upsert_user(CHANNELS[0], 1, "Первый", "bob")
+        async with storage._get_pool().transaction() as db:
+            await db.execute(
+                "INSERT INTO users (channel_id, user_id, username, full_name, status) VALUES (?, ?, ?, ?, 'pending')",
+                (channel_id, user_id, username, "Второй"),
+            )
+
+    with pytest.raises(aiosqlite.IntegrityError):
+        run_with_storage(tmp_path, call)